@@ -0,0 +1,1402 @@
+"""
+reactive 模块性能基准
+
+用法:
+    python -m reactive.benchmark              # 运行全部基准
+    python -m reactive.benchmark history      # 运行指定基准
+    python -m reactive.benchmark --quick      # 缩小规模，快速验证
+
+回归检测（离线运行，结果为 JSON）:
+    python -m reactive.benchmark engine --json baseline.json       # 保存基线
+    python -m reactive.benchmark engine --compare baseline.json    # 与基线比较
+比较时变慢超过阈值（--threshold，默认 25%）的项目视为回归，进程以状态 1 退出。
+基线只在同一台机器、同一 Python 版本、同样的 --quick 设置下有可比性；
+共享的虚拟机上速度会随时间漂移，基线最好在比较前不久重新生成。
+"""
+
+import argparse
+import asyncio
+import copy
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+from array import array
+from typing import Callable
+
+import reactive.reactive as reactive_module
+from reactive.patch import _plain, dumps_patch, patch_listener
+from reactive.persistence import DocumentStore
+from reactive.reactive import (
+    _INTERNAL_ATTRS,
+    DELIVER_CHANGES,
+    CoalescePolicy,
+    CommandManager,
+    NotifyScheduler,
+    ReactivableDict,
+    SetItemCommand,
+    disable_metrics,
+    enable_metrics,
+)
+from reactive.serialize import FORMAT_BINARY, FORMAT_JSON, encode, iter_encode
+
+# 基准注册表：名称 -> 基准函数
+BENCHMARKS: dict[str, Callable[[bool], None]] = {}
+
+
+def benchmark(name: str) -> Callable:
+    """注册基准函数的装饰器"""
+
+    def decorator(func: Callable[[bool], None]) -> Callable[[bool], None]:
+        BENCHMARKS[name] = func
+        return func
+
+    return decorator
+
+
+def _per_op_ns(elapsed: float, count: int) -> float:
+    return elapsed / count * 1e9
+
+
+# 记录下来的结果：名称 -> {"value": 数值, "unit": 单位}，数值越小越好
+RESULTS: dict[str, dict] = {}
+# 每项测量的轮数，取最小值以减少干扰
+_REPEAT = 9
+
+
+def record(name: str, value: float, unit: str = "ns/op") -> None:
+    """记录一项结果，供 --json 保存和 --compare 比较"""
+    RESULTS[name] = {"value": value, "unit": unit}
+    print(f"  {name:<28} {value:12.1f} {unit}")
+
+
+def _elapsed(func: Callable[[], object]) -> float:
+    """运行一次 func 的耗时（关闭 GC，与 timeit 一致）"""
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def _record_best(name: str, timings: list[float], count: int, unit="ns/op") -> None:
+    record(name, _per_op_ns(min(timings), count), unit)
+
+
+def _record_timeit(name: str, stmt: str, namespace: dict, number: int) -> None:
+    timings = timeit.repeat(stmt, globals=namespace, number=number, repeat=_REPEAT)
+    _record_best(name, timings, number)
+
+
+def _metadata(quick: bool) -> dict:
+    return {
+        "python": sys.version.split()[0],
+        "implementation": sys.implementation.name,
+        "platform": sys.platform,
+        "quick": quick,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def save_results(path: str, quick: bool) -> None:
+    """把 RESULTS 连同运行环境写入 JSON 文件"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"meta": _metadata(quick), "results": RESULTS},
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+        f.write("\n")
+
+
+def compare_results(path: str, quick: bool, threshold: float) -> list[str]:
+    """与基线文件比较，打印每项变化，返回回归的项目名称"""
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\n【与基线 {path} 比较（阈值 {threshold:.0%}）】")
+    print("-" * 40)
+    meta = baseline.get("meta", {})
+    current = _metadata(quick)
+    for key in ("python", "implementation", "quick"):
+        if meta.get(key) != current[key]:
+            print(f"  注意：基线的 {key} 为 {meta.get(key)!r}，本次为 {current[key]!r}")
+
+    regressions = []
+    for name, result in RESULTS.items():
+        old = baseline.get("results", {}).get(name)
+        if old is None:
+            print(f"  {name:<28} {'(基线中没有)':>12}")
+            continue
+        ratio = result["value"] / old["value"] if old["value"] else float("inf")
+        if ratio > 1 + threshold:
+            status = "回归"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            status = "提升"
+        else:
+            status = ""
+        print(
+            f"  {name:<28} {old['value']:12.1f} -> {result['value']:12.1f} "
+            f"{result['unit']:<14} {ratio - 1:+7.1%} {status}"
+        )
+    return regressions
+
+
+@benchmark("history")
+def bench_history_depth(quick: bool = False) -> None:
+    """历史栈写满后，每次 execute 的开销应与深度无关"""
+    print("\n【历史深度 vs 单条命令开销】")
+    print("-" * 40)
+
+    depths = [200, 10_000, 1_000_000]
+    count = 10_000 if quick else 100_000
+    target = ReactivableDict({"k": 0})
+
+    for depth in depths:
+        manager = CommandManager(max_depth=depth)
+        # 预先填满历史，使后续每次 execute 都触发裁剪
+        filler = SetItemCommand(target, "k", 0, 0)
+        manager.undo_stack.extend([filler] * depth)
+
+        commands = [SetItemCommand(target, "k", i, i - 1) for i in range(count)]
+        start = time.perf_counter()
+        for command in commands:
+            manager.execute(command)
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"  depth={depth:>9,}: {_per_op_ns(elapsed, count):8.1f} ns/command, "
+            f"history ≈ {manager.memory_usage() / 1024:,.0f} KiB"
+        )
+
+        # 对比旧实现：list + pop(0)，深度越大越慢（1M 深度过慢，跳过）
+        if depth <= 10_000:
+            stack = [filler] * depth
+            start = time.perf_counter()
+            for command in commands:
+                command.execute()
+                stack.append(command)
+                if len(stack) > depth:
+                    stack.pop(0)
+            elapsed = time.perf_counter() - start
+            print(
+                f"  {'list.pop(0)':>15}: {_per_op_ns(elapsed, count):8.1f} ns/command"
+            )
+
+
+@benchmark("documents")
+def bench_documents(quick: bool = False) -> None:
+    """1,000 个文档交替编辑：每个文档独立历史 vs 共享一个命令管理器"""
+    print("\n【多文档并发编辑吞吐】")
+    print("-" * 40)
+
+    doc_count = 1_000
+    rounds = 20 if quick else 200
+    total = doc_count * rounds
+
+    for label, shared in (("独立历史", None), ("共享历史", CommandManager())):
+        docs = [
+            ReactivableDict({"title": "", "body": {"rev": 0}}, command_manager=shared)
+            for _ in range(doc_count)
+        ]
+        start = time.perf_counter()
+        for rev in range(1, rounds + 1):
+            for doc in docs:
+                doc.body.rev = rev
+        elapsed = time.perf_counter() - start
+
+        # 撤销一个文档，检查是否波及其他文档
+        docs[0].undo()
+        untouched = sum(1 for doc in docs[1:] if doc.body.rev == rounds)
+        print(
+            f"  {label}: {total / elapsed:,.0f} ops/s, "
+            f"撤销 doc[0] 后其余文档保持不变: {untouched}/{doc_count - 1}"
+        )
+
+
+@benchmark("notify")
+def bench_notify_coalescing(quick: bool = False) -> None:
+    """深层列表上连续 append：对比各调度模式的回调次数与耗时"""
+    print("\n【通知合并：回调次数与耗时】")
+    print("-" * 40)
+
+    count = 1_000 if quick else 10_000
+
+    def make(mode):
+        scheduler = NotifyScheduler(mode)
+        data = {"a": {"b": {"c": {"items": []}}}}
+        root = ReactivableDict(
+            data, command_manager=CommandManager(scheduler=scheduler)
+        )
+        calls = [0]
+
+        def observer(value):
+            calls[0] += 1
+
+        # 在路径上的每一层都挂一个观察者
+        node = root
+        for key in ("a", "b", "c", "items"):
+            node.subscribe(observer)
+            node = node[key]
+        node.subscribe(observer)
+        return root, root.a.b.c["items"], calls
+
+    def run_sync_or_manual(mode):
+        root, items, calls = make(mode)
+        start = time.perf_counter()
+        for i in range(count):
+            items.append(i)
+        root.flush()
+        return time.perf_counter() - start, calls[0]
+
+    def run_asyncio():
+        async def body():
+            root, items, calls = make("asyncio")
+            start = time.perf_counter()
+            for i in range(count):
+                items.append(i)
+            await asyncio.sleep(0)
+            return time.perf_counter() - start, calls[0]
+
+        return asyncio.run(body())
+
+    results = [
+        ("sync", run_sync_or_manual("sync")),
+        ("manual", run_sync_or_manual("manual")),
+        ("asyncio", run_asyncio()),
+    ]
+    for mode, (elapsed, calls) in results:
+        print(
+            f"  {mode:>8}: {count:,} 次 append, {calls:>7,} 次回调, {elapsed * 1000:8.2f} ms"
+        )
+
+
+@benchmark("batch")
+def bench_batch_update(quick: bool = False) -> None:
+    """大型嵌套树：逐条更新所有叶子 vs 在一个 batch_update 中更新"""
+    print("\n【批量更新：回调次数】")
+    print("-" * 40)
+
+    groups = 20 if quick else 100
+    leaves = 20 if quick else 100
+
+    def make():
+        data = {f"g{g}": {f"leaf{i}": 0 for i in range(leaves)} for g in range(groups)}
+        root = ReactivableDict(data)
+        calls = [0]
+
+        def observer(value):
+            calls[0] += 1
+
+        root.subscribe(observer)
+        for g in range(groups):
+            root[f"g{g}"].subscribe(observer)
+        return root, calls
+
+    root, calls = make()
+    start = time.perf_counter()
+    for g in range(groups):
+        group = root[f"g{g}"]
+        for i in range(leaves):
+            group[f"leaf{i}"] = 1
+    unbatched = time.perf_counter() - start, calls[0]
+
+    root, calls = make()
+    start = time.perf_counter()
+    with root.batch_update():
+        for g in range(groups):
+            group = root[f"g{g}"]
+            for i in range(leaves):
+                group[f"leaf{i}"] = 1
+    batched = time.perf_counter() - start, calls[0]
+
+    for label, (elapsed, count) in (("逐条更新", unbatched), ("批量更新", batched)):
+        print(f"  {label}: {count:>8,} 次回调, {elapsed * 1000:8.2f} ms")
+    print(f"  回调减少: {unbatched[1] / batched[1]:,.0f}x")
+
+
+def _large_payload(records: int) -> dict:
+    """生成大型嵌套 JSON 风格数据"""
+    return {
+        "records": [
+            {
+                "id": i,
+                "name": f"user{i}",
+                "tags": ["a", "b", "c"],
+                "address": {"city": "Beijing", "zip": "100000"},
+            }
+            for i in range(records)
+        ]
+    }
+
+
+@benchmark("wrap")
+def bench_wrap(quick: bool = False) -> None:
+    """大型嵌套数据：立即封装 vs 惰性封装的构造时间与峰值内存"""
+    print("\n【封装大型嵌套数据：构造时间与峰值内存】")
+    print("-" * 40)
+
+    records = 20_000 if quick else 200_000
+    for label, lazy in (("立即封装", False), ("惰性封装", True)):
+        payload = _large_payload(records)
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        root = ReactivableDict(payload, lazy=lazy)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # 访问一小部分记录，惰性模式只封装被访问的路径
+        start = time.perf_counter()
+        for i in range(0, records, 1000):
+            _ = root.records[i].address.city
+        access = time.perf_counter() - start
+
+        print(
+            f"  {label}: 构造 {elapsed * 1000:9.2f} ms, 峰值新增内存 {peak / 1024 / 1024:8.2f} MiB, "
+            f"稀疏访问 {access * 1000:6.2f} ms"
+        )
+        del root, payload
+
+
+@benchmark("attr")
+def bench_attribute_access(quick: bool = False) -> None:
+    """属性读取微基准：Reactivable 与原生 dict、旧的 __getattribute__ 实现对比"""
+    print("\n【属性读取：Reactivable vs 旧实现 vs dict】")
+    print("-" * 40)
+
+    number = 100_000 if quick else 1_000_000
+
+    def make():
+        return {"name": "Alice", "address": {"city": "Beijing"}, "hobbies": ["reading"]}
+
+    namespace = {
+        "d": make(),
+        "r": ReactivableDict(make()),
+        "o": _GetattributeDict(make()),
+    }
+    # 对照组的嵌套字典也使用旧实现
+    old = namespace["o"]
+    old._value["address"] = _GetattributeDict(
+        {"city": "Beijing"}, parent=old, key="address"
+    )
+    cases = [
+        ("顶层键", 'd["name"]', "name"),
+        ("顶层键（下标）", 'd["name"]', '["name"]'),
+        ("嵌套键", 'd["address"]["city"]', "address.city"),
+        ("嵌套键（下标）", 'd["address"]["city"]', '["address"]["city"]'),
+        ("列表元素", 'd["hobbies"][0]', "hobbies[0]"),
+        ("容器方法", "d.keys", "keys"),
+    ]
+    for label, raw_stmt, access in cases:
+        sep = "" if access.startswith("[") else "."
+        raw_ns, old_ns, new_ns = (
+            _per_op_ns(timeit.timeit(stmt, globals=namespace, number=number), number)
+            for stmt in (raw_stmt, f"o{sep}{access}", f"r{sep}{access}")
+        )
+        print(
+            f"  {label:<10} dict {raw_ns:7.1f} ns | 旧实现 {old_ns:7.1f} ns | "
+            f"Reactivable {new_ns:7.1f} ns ({new_ns / old_ns:4.2f}x 旧实现)"
+        )
+
+
+class _GetattributeDict(ReactivableDict):
+    """对照组：改为 __slots__ + 数据键描述符之前，每次属性访问都经过 __getattribute__"""
+
+    __slots__ = ()
+
+    def __getattribute__(self, item):
+        if item in _INTERNAL_ATTRS or item in _DICT_METHODS:
+            return object.__getattribute__(self, item)
+        try:
+            value = self._value[item]
+        except (KeyError, TypeError):
+            return object.__getattribute__(self._value, item)
+        if self._lazy:
+            return self._lazy_child(item, value)
+        return value
+
+
+_DICT_METHODS = frozenset(dir(ReactivableDict))
+
+
+class _DictSetItemCommand:
+    """对照组：使用实例 __dict__ 的命令（改为 __slots__ 之前的布局）"""
+
+    def __init__(self, target, key, new_value, old_value):
+        self.target = target
+        self.key = key
+        self.new_value = new_value
+        self.old_value = old_value
+
+
+@benchmark("commands")
+def bench_command_size(quick: bool = False) -> None:
+    """命令对象的内存占用与分配速率：__dict__ vs __slots__"""
+    print("\n【命令对象：字节数与分配速率】")
+    print("-" * 40)
+
+    count = 100_000 if quick else 1_000_000
+    target = ReactivableDict({"k": 0})
+
+    for label, cls in (
+        ("__dict__", _DictSetItemCommand),
+        ("__slots__", SetItemCommand),
+    ):
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        # 使用小整数（解释器缓存，不产生分配），只统计命令对象本身
+        commands = [cls(target, "k", 1, 0) for _ in range(count)]
+        elapsed = time.perf_counter() - start
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        per_command = (current - sys.getsizeof(commands)) / count
+        print(
+            f"  {label:>9}: {per_command:6.1f} bytes/command, "
+            f"{count / elapsed:12,.0f} commands/s"
+        )
+        del commands
+
+
+@benchmark("coalesce")
+def bench_coalesce(quick: bool = False) -> None:
+    """模拟向绑定字段连续输入：历史长度与全部撤销的耗时"""
+    print("\n【命令合并：高频写入同一字段】")
+    print("-" * 40)
+
+    keystrokes = 2_000 if quick else 20_000
+    text = "x" * keystrokes
+
+    for label, policy in (("不合并", None), ("合并", CoalescePolicy(window=None))):
+        manager = CommandManager(max_depth=keystrokes, coalesce=policy)
+        form = ReactivableDict({"title": ""}, command_manager=manager)
+        start = time.perf_counter()
+        for i in range(1, keystrokes + 1):
+            form.title = text[:i]
+        typing = time.perf_counter() - start
+
+        history = len(manager.undo_stack)
+        start = time.perf_counter()
+        while manager.undo_stack:
+            form.undo()
+        undo_all = time.perf_counter() - start
+        print(
+            f"  {label}: 输入 {typing * 1000:7.2f} ms, 历史 {history:>6,} 条, "
+            f"全部撤销 {undo_all * 1000:7.2f} ms"
+        )
+
+
+@benchmark("patch")
+def bench_patch(quick: bool = False) -> None:
+    """同步远端副本：每次变更导出差量补丁 vs 重新序列化整个文档"""
+    print("\n【差量补丁 vs 全量序列化】")
+    print("-" * 40)
+
+    records = 1_000 if quick else 10_000
+    edits = 200 if quick else 1_000
+    root = ReactivableDict(_large_payload(records))
+    sent = []
+    root._command_manager.add_listener(
+        patch_listener(lambda ops: sent.append(dumps_patch(ops)))
+    )
+
+    start = time.perf_counter()
+    for i in range(edits):
+        root.records[i % records].address.city = f"city{i}"
+    patch_elapsed = time.perf_counter() - start
+    patch_bytes = sum(len(chunk.encode()) for chunk in sent)
+
+    start = time.perf_counter()
+    full_bytes = 0
+    for _ in range(edits // 10):
+        full_bytes += len(json.dumps(_plain(root)).encode())
+    full_elapsed = (time.perf_counter() - start) * 10
+    full_bytes *= 10
+
+    print(
+        f"  差量补丁: {patch_bytes / edits:10,.1f} bytes/次, {patch_elapsed * 1000:9.2f} ms"
+    )
+    print(
+        f"  全量序列化: {full_bytes / edits:10,.1f} bytes/次, {full_elapsed * 1000:9.2f} ms"
+    )
+
+
+@benchmark("persist")
+def bench_persistence(quick: bool = False) -> None:
+    """预写日志：各 fsync 策略的提交延迟，以及大日志的恢复时间"""
+    print("\n【快照 + 预写日志：提交延迟与恢复时间】")
+    print("-" * 40)
+
+    for fsync, count in (("always", 200), ("batch", 20_000), ("never", 20_000)):
+        with tempfile.TemporaryDirectory() as directory:
+            with DocumentStore(directory, fsync=fsync, batch_size=256) as store:
+                doc = store.open({"counter": 0, "log": []})
+                start = time.perf_counter()
+                for i in range(count):
+                    doc.counter = i + 1
+                elapsed = time.perf_counter() - start
+        print(f"  fsync={fsync:<6}: {elapsed / count * 1e6:9.1f} µs/commit")
+
+    operations = 100_000 if quick else 1_000_000
+    with tempfile.TemporaryDirectory() as directory:
+        with DocumentStore(directory, fsync="never") as store:
+            doc = store.open({"counter": 0, "items": []})
+            for i in range(operations):
+                if i % 4 == 0:
+                    doc["items"].append(i)
+                else:
+                    doc.counter = i
+        log_size = os.path.getsize(store.log_path)
+
+        start = time.perf_counter()
+        with DocumentStore(directory) as store:
+            store.open()
+        elapsed = time.perf_counter() - start
+    print(
+        f"  恢复 {operations:,} 条日志 ({log_size / 1024 / 1024:.1f} MiB): "
+        f"{elapsed * 1000:,.0f} ms"
+    )
+
+
+@benchmark("paths")
+def bench_path_subscriptions(quick: bool = False) -> None:
+    """10k 订阅者、只有少量订阅者关心的变更流：路径订阅 vs 整节点观察者"""
+    print("\n【路径订阅 vs 整节点观察者】")
+    print("-" * 40)
+
+    subscribers = 10_000
+    mutations = 1_000 if quick else 10_000
+
+    def make():
+        return ReactivableDict(
+            {"users": [{"name": "", "score": 0} for _ in range(subscribers)]}
+        )
+
+    def stream(root, count):
+        users = root["users"]
+        for i in range(count):
+            user = users[(i * 7919) % subscribers]
+            # 1% 的变更落在被订阅的 score 上，其余落在 name 上
+            if i % 100 == 0:
+                user.score = i
+            else:
+                user.name = str(i)
+
+    root = make()
+    calls = [0]
+
+    def on_score(path, value):
+        calls[0] += 1
+
+    for i in range(subscribers):
+        root.subscribe(f"users.{i}.score", on_score)
+    start = time.perf_counter()
+    stream(root, mutations)
+    elapsed = time.perf_counter() - start
+    print(
+        f"  路径订阅  : {elapsed / mutations * 1e6:10.1f} µs/变更, "
+        f"{calls[0]:>10,} 次回调"
+    )
+
+    # 对照组：每个订阅者都是根对象上的观察者，自己判断是否关心本次变更
+    root = make()
+    calls[0] = 0
+    for i in range(subscribers):
+
+        def observer(value, i=i):
+            calls[0] += 1
+
+        root.subscribe(observer)
+    sample = max(mutations // 100, 10)
+    start = time.perf_counter()
+    stream(root, sample)
+    elapsed = time.perf_counter() - start
+    print(
+        f"  整节点观察: {elapsed / sample * 1e6:10.1f} µs/变更, "
+        f"{calls[0] * mutations // sample:>10,} 次回调（按 {sample} 次变更外推）"
+    )
+
+
+@benchmark("computed")
+def bench_computed(quick: bool = False) -> None:
+    """大列表求和 + 大量无关变更：派生值缓存 vs 每次通知都重新计算"""
+    print("\n【派生值 vs 观察者中重新计算】")
+    print("-" * 40)
+
+    rows = 10_000
+    mutations = 1_000 if quick else 10_000
+
+    def make():
+        return ReactivableDict({"title": "", "amounts": list(range(rows))})
+
+    def stream(root, count):
+        for i in range(count):
+            # 99% 的变更与合计无关
+            if i % 100 == 0:
+                root["amounts"][i % rows] = -i
+            else:
+                root.title = str(i)
+
+    root = make()
+    total = root.computed("total", lambda r: sum(r["amounts"]))
+    seen = []
+    total.subscribe(seen.append)
+    start = time.perf_counter()
+    stream(root, mutations)
+    elapsed = time.perf_counter() - start
+    print(
+        f"  派生值    : {elapsed / mutations * 1e6:10.1f} µs/变更, "
+        f"{len(seen):>6} 次通知"
+    )
+
+    # 对照组：控制器在 update() 中每次都重新求和
+    root = make()
+    results = []
+    root.subscribe(lambda value: results.append(sum(value["amounts"])))
+    start = time.perf_counter()
+    stream(root, mutations)
+    elapsed = time.perf_counter() - start
+    print(
+        f"  观察者求和: {elapsed / mutations * 1e6:10.1f} µs/变更, "
+        f"{len(results):>6} 次求和"
+    )
+
+
+@benchmark("async")
+def bench_async_observers(quick: bool = False) -> None:
+    """订阅者耗时不同：异步观察者下修改数据的延迟应保持平稳"""
+    print("\n【异步观察者：订阅者耗时 vs 修改延迟】")
+    print("-" * 40)
+
+    count = 200 if quick else 2_000
+
+    async def run(cost):
+        root = ReactivableDict({"count": 0})
+        handled = [0]
+
+        async def observer(value):
+            await asyncio.sleep(cost)
+            handled[0] += 1
+
+        for _ in range(10):
+            root.subscribe(lambda value, observer=observer: observer(value))
+        latencies = []
+        for i in range(count):
+            start = time.perf_counter()
+            root.count = i
+            latencies.append(time.perf_counter() - start)
+            # 让出事件循环，模拟真实的修改节奏
+            await asyncio.sleep(0)
+        await root.flush()
+        latencies.sort()
+        return latencies, handled[0]
+
+    for cost in (0, 0.001, 0.01):
+        latencies, handled = asyncio.run(run(cost))
+        p50 = latencies[len(latencies) // 2] * 1e6
+        p99 = latencies[int(len(latencies) * 0.99)] * 1e6
+        print(
+            f"  订阅者耗时 {cost * 1000:4.0f} ms: 修改延迟 p50 {p50:7.1f} µs, "
+            f"p99 {p99:7.1f} µs, 实际处理 {handled:>6,} 次"
+        )
+
+
+@benchmark("threads")
+def bench_threads(quick: bool = False) -> None:
+    """多线程并发修改同一文档：吞吐与正确性（历史条数、最终状态、全部撤销）"""
+    print("\n【多线程并发修改】")
+    print("-" * 40)
+
+    per_thread = 2_000 if quick else 20_000
+
+    def run(threads, thread_safe):
+        manager = CommandManager(
+            max_depth=threads * per_thread * 2, thread_safe=thread_safe
+        )
+        root = ReactivableDict(
+            {"log": [], "counters": {str(t): 0 for t in range(threads)}},
+            command_manager=manager,
+        )
+
+        def work(t):
+            counters, log = root["counters"], root["log"]
+            key = str(t)
+            for i in range(1, per_thread + 1):
+                counters[key] = i
+                if i % 10 == 0:
+                    # 每 10 次修改做一次事务
+                    with root.batch_update():
+                        log.append(t)
+                        log.append(-t)
+
+        workers = [threading.Thread(target=work, args=(t,)) for t in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        ops = threads * per_thread * 6 // 5
+        expected_history = threads * per_thread * 11 // 10
+        correct = (
+            len(manager.undo_stack) == expected_history
+            and len(root["log"]) == threads * per_thread // 5
+            and all(v == per_thread for v in root["counters"].values())
+        )
+        while manager.undo_stack:
+            manager.undo()
+        restored = len(root["log"]) == 0 and not any(root["counters"].values())
+        return ops / elapsed, correct and restored
+
+    throughput, ok = run(1, False)
+    print(f"  1 线程（无锁）  : {throughput:12,.0f} ops/s, 正确: {ok}")
+    for threads in (1, 2, 4, 8):
+        throughput, ok = run(threads, True)
+        print(f"  {threads} 线程（加锁）  : {throughput:12,.0f} ops/s, 正确: {ok}")
+
+
+@benchmark("leak")
+def bench_leak(quick: bool = False) -> None:
+    """1M 次“创建文档 - 编辑 - 丢弃”循环，共享历史：内存应只随命令对象增长"""
+    print("\n【已丢弃文档的内存回收】")
+    print("-" * 40)
+
+    cycles = 50_000 if quick else 1_000_000
+    manager = CommandManager(max_depth=cycles)
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    for i in range(cycles):
+        doc = ReactivableDict(
+            {"title": "", "body": {"rev": 0}}, command_manager=manager
+        )
+        doc.body.rev = i
+        del doc
+    elapsed = time.perf_counter() - start
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    removed = manager.prune()
+    pruned = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    print(f"  循环次数  : {cycles:>12,}（{elapsed:.1f} s，含 tracemalloc 开销）")
+    print(f"  历史保留  : {retained / cycles:12.1f} B/循环（仅命令对象）")
+    print(f"  prune 后  : {pruned / 1024:12,.1f} KiB，移除 {removed:,} 条失效历史")
+
+
+@benchmark("extend")
+def bench_extend(quick: bool = False) -> None:
+    """追加 1M 个元素：extend 一条命令 vs 逐个 append"""
+    print("\n【列表批量追加：extend vs append 循环】")
+    print("-" * 40)
+
+    count = 100_000 if quick else 1_000_000
+    values = list(range(count))
+
+    def run(label, body):
+        manager = CommandManager(max_depth=count + 1)
+        root = ReactivableDict({"items": []}, command_manager=manager)
+        calls = [0]
+
+        def observer(value):
+            calls[0] += 1
+
+        root.subscribe(observer)
+        items = root["items"]
+        gc.collect()
+        start = time.perf_counter()
+        body(items)
+        elapsed = time.perf_counter() - start
+        history, notified = len(manager.undo_stack), calls[0]
+        start = time.perf_counter()
+        root.undo()
+        undo_elapsed = time.perf_counter() - start
+        print(
+            f"  {label}: {elapsed * 1000:9.1f} ms, {history:>9,} 条历史, "
+            f"{notified:>9,} 次通知, 撤销最后一步 {undo_elapsed * 1000:7.2f} ms"
+        )
+
+    def append_loop(items):
+        for value in values:
+            items.append(value)
+
+    run("append 循环", append_loop)
+    run("extend     ", lambda items: items.extend(values))
+
+
+@benchmark("merge")
+def bench_merge(quick: bool = False) -> None:
+    """把 100k 个键合并进 100k 个键的字典（一半重叠）：update vs 逐键赋值"""
+    print("\n【字典批量合并：update vs __setitem__ 循环】")
+    print("-" * 40)
+
+    size = 10_000 if quick else 100_000
+    incoming = {f"k{i}": -i for i in range(size // 2, size + size // 2)}
+
+    def run(label, body):
+        root = ReactivableDict({"data": {f"k{i}": i for i in range(size)}})
+        calls = [0]
+
+        def observer(value):
+            calls[0] += 1
+
+        root.subscribe(observer)
+        data = root["data"]
+        gc.collect()
+        start = time.perf_counter()
+        body(data)
+        elapsed = time.perf_counter() - start
+        history, notified = len(root._command_manager.undo_stack), calls[0]
+        start = time.perf_counter()
+        root.undo()
+        undo_elapsed = time.perf_counter() - start
+        print(
+            f"  {label}: {elapsed * 1000:9.1f} ms, {history:>5,} 条历史, "
+            f"{notified:>9,} 次通知, 撤销最后一步 {undo_elapsed * 1000:7.2f} ms"
+        )
+
+    def setitem_loop(data):
+        for key, value in incoming.items():
+            data[key] = value
+
+    run("__setitem__ 循环", setitem_loop)
+    run("update          ", lambda data: data.update(incoming))
+    run("clear           ", lambda data: data.clear())
+
+
+@benchmark("snapshot")
+def bench_snapshot(quick: bool = False) -> None:
+    """每次修改后取快照：写时复制快照 vs copy.deepcopy，比较延迟与保留内存"""
+    print("\n【写时复制快照 vs copy.deepcopy】")
+    print("-" * 40)
+
+    rows = 1_000 if quick else 10_000
+    rounds = 100
+
+    def make():
+        return {
+            "title": "",
+            "rows": [
+                {"id": i, "name": f"row{i}", "tags": ["a", "b"]} for i in range(rows)
+            ],
+        }
+
+    def run(label, make_root, mutate, take):
+        # 延迟与内存分两轮测量，避免 tracemalloc 的开销影响计时
+        root = make_root()
+        elapsed = 0.0
+        for i in range(rounds):
+            mutate(root, i)
+            start = time.perf_counter()
+            take(root)
+            elapsed += time.perf_counter() - start
+
+        root = make_root()
+        snapshots = []
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        for i in range(rounds):
+            mutate(root, i)
+            snapshots.append(take(root))
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        print(
+            f"  {label}: {elapsed / rounds * 1e6:10.1f} µs/快照, "
+            f"保留 {rounds} 个快照 {retained / 1024:10,.0f} KiB"
+        )
+        return root
+
+    def mutate_plain(data, i):
+        data["rows"][(i * 7919) % rows]["name"] = str(i)
+
+    def mutate_reactive(root, i):
+        root["rows"][(i * 7919) % rows].name = str(i)
+
+    def make_reactive():
+        root = ReactivableDict(make())
+        root.snapshot()
+        return root
+
+    run("copy.deepcopy", make, mutate_plain, copy.deepcopy)
+    root = run(
+        "snapshot()   ", make_reactive, mutate_reactive, ReactivableDict.snapshot
+    )
+
+    # 没有修改时取快照：直接返回缓存
+    count = 100_000
+    elapsed = timeit.timeit(root.snapshot, number=count)
+    print(f"  未修改时 snapshot(): {_per_op_ns(elapsed, count):8.1f} ns")
+
+
+@benchmark("budget")
+def bench_budget(quick: bool = False) -> None:
+    """大命令与小命令混合：仅按深度淘汰 vs 字节预算，比较实际保留的内存"""
+    print("\n【历史字节预算】")
+    print("-" * 40)
+
+    payload = 50_000 if quick else 500_000
+    large, small = 20, 20_000
+    budget = 64 * 1024 * 1024
+
+    for label, max_bytes in (("仅深度 200  ", None), ("预算 64 MiB ", budget)):
+        manager = CommandManager(max_bytes=max_bytes)
+        root = ReactivableDict({"data": [], "n": 0}, command_manager=manager)
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        for i in range(large):
+            root.data = list(range(i, i + payload))
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        print(
+            f"  {label}: {len(manager.undo_stack):>4} 条历史, "
+            f"估算 {manager.history_bytes / 2**20:8.1f} MiB, "
+            f"实际 {retained / 2**20:8.1f} MiB, 淘汰 {manager.eviction_count} 条"
+        )
+
+        # 小命令的单条开销（新的历史，避免把释放大命令的时间算进来）：
+        # 预算模式下多一次大小估算
+        root = ReactivableDict(
+            {"n": 0}, command_manager=CommandManager(max_bytes=max_bytes)
+        )
+        start = time.perf_counter()
+        for i in range(1, small + 1):
+            root.n = i
+        elapsed = time.perf_counter() - start
+        print(f"  {'':12}  小命令 {_per_op_ns(elapsed, small):8.1f} ns/command")
+
+
+@benchmark("jump")
+def bench_history_jump(quick: bool = False) -> None:
+    """在 10k 步的历史中跳转：逐步 undo() vs undo_to() 一次通知"""
+    print("\n【历史跳转：逐步撤销 vs undo_to】")
+    print("-" * 40)
+
+    steps = 1_000 if quick else 10_000
+    rows = 1_000
+
+    def make():
+        manager = CommandManager(max_depth=steps)
+        root = ReactivableDict(
+            {"rows": [{"value": 0} for _ in range(rows)]}, command_manager=manager
+        )
+        calls = [0]
+
+        def observer(value):
+            calls[0] += 1
+
+        # 根和每一行都有观察者
+        root.subscribe(observer)
+        for row in root["rows"]:
+            row.subscribe(observer)
+        for i in range(steps):
+            root["rows"][i % rows].value = i + 1
+        calls[0] = 0
+        return root, calls
+
+    root, calls = make()
+    start = time.perf_counter()
+    for _ in range(steps):
+        root.undo()
+    elapsed = time.perf_counter() - start
+    print(f"  逐步 undo(): {elapsed * 1000:9.1f} ms, {calls[0]:>9,} 次通知")
+
+    root, calls = make()
+    start = time.perf_counter()
+    root.undo_to(0)
+    elapsed = time.perf_counter() - start
+    print(f"  undo_to(0) : {elapsed * 1000:9.1f} ms, {calls[0]:>9,} 次通知")
+    start = time.perf_counter()
+    root.redo_to(steps)
+    elapsed = time.perf_counter() - start
+    print(f"  redo_to()  : {elapsed * 1000:9.1f} ms")
+
+
+@benchmark("array")
+def bench_array(quick: bool = False) -> None:
+    """数值序列：ReactivableArray vs ReactivableList，比较内存与批量更新吞吐"""
+    print("\n【类型化数组 vs 列表】")
+    print("-" * 40)
+
+    size = 100_000 if quick else 1_000_000
+    chunk = 10_000
+    writes = 20
+
+    # 每个元素都是不同的 float 对象，[0.0] * size 会共享同一个对象
+    def make_list():
+        return ReactivableDict({"series": [float(i) for i in range(size)]})
+
+    def make_array():
+        return ReactivableDict({"series": array("d", map(float, range(size)))})
+
+    for label, make in (("list ", make_list), ("array", make_array)):
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        root = make()
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        series = root.series
+        print(f"  {label}: {size:,} 个浮点数占用 {retained / 2**20:8.1f} MiB")
+
+        # 批量写入：一次区间更新记录为一条命令
+        values = [float(i) for i in range(chunk)]
+        start = time.perf_counter()
+        for i in range(writes):
+            offset = (i * chunk) % (size - chunk)
+            if label == "array":
+                series.write(offset, values)
+            else:
+                series[offset : offset + chunk] = values
+        elapsed = time.perf_counter() - start
+        print(
+            f"  {'':5}  批量写入 {chunk:,} 个: "
+            f"{writes * chunk / elapsed / 1e6:8.2f} M 元素/s, "
+            f"历史占用 {root._command_manager.history_bytes / 2**20:6.1f} MiB"
+        )
+
+        # 逐个元素写入
+        count = 10_000
+        start = time.perf_counter()
+        for i in range(count):
+            series[i] = 1.5
+        elapsed = time.perf_counter() - start
+        print(f"  {'':5}  逐个写入: {_per_op_ns(elapsed, count):8.1f} ns/op")
+
+    # 零拷贝读取
+    series = make_array().series
+    count = 100_000
+    elapsed = timeit.timeit(series.view, number=count)
+    print(f"  view(): {_per_op_ns(elapsed, count):8.1f} ns（与长度无关）")
+
+
+@benchmark("changes")
+def bench_change_records(quick: bool = False) -> None:
+    """大列表上的少量修改：观察者比较整个容器 vs 接收变更记录"""
+    print("\n【变更记录投递 vs 比较整个容器】")
+    print("-" * 40)
+
+    size = 10_000 if quick else 100_000
+    rounds = 100
+
+    def run(label, subscribe):
+        root = ReactivableDict({"rows": list(range(size))})
+        rows = root.rows
+        touched = [0]
+        subscribe(rows, touched)
+        start = time.perf_counter()
+        for i in range(rounds):
+            rows[(i * 7919) % size] = -i
+            rows.append(i)
+        elapsed = time.perf_counter() - start
+        print(
+            f"  {label}: {elapsed / rounds * 1e6:10.1f} µs/次修改, "
+            f"观察者共处理 {touched[0]:,} 个元素"
+        )
+
+    def diff_observer(rows, touched):
+        # 旧方式：保存上一次的副本，逐个比较找出变化
+        previous = list(rows._value)
+
+        def observer(value):
+            nonlocal previous
+            touched[0] += len(value)
+            changed = [i for i, (a, b) in enumerate(zip(previous, value)) if a != b]
+            changed.extend(range(len(previous), len(value)))
+            previous = list(value)
+
+        rows.subscribe(observer)
+
+    def change_observer(rows, touched):
+        def observer(changes):
+            touched[0] += len(changes)
+
+        rows.subscribe(observer, delivery=DELIVER_CHANGES)
+
+    run("比较整个容器", diff_observer)
+    run("变更记录    ", change_observer)
+
+
+@benchmark("serialize")
+def bench_serialize(quick: bool = False) -> None:
+    """导出整棵树：to_plain + json.dumps vs 直接编码，以及修改后的增量重新编码"""
+    print("\n【序列化：json.dumps vs encode】")
+    print("-" * 40)
+
+    rows = 1_000 if quick else 10_000
+    root = ReactivableDict(
+        {
+            "title": "doc",
+            "rows": [
+                {"id": i, "name": f"row{i}", "score": i * 0.5, "tags": ["a", "b"]}
+                for i in range(rows)
+            ],
+        }
+    )
+    plain = root.to_plain()
+    number = 5
+
+    def dumps_plain():
+        return json.dumps(plain, ensure_ascii=False, separators=(",", ":"))
+
+    def dumps_old():
+        # 旧方式：先递归拷贝出普通数据，再 json.dumps
+        return json.dumps(_plain(root), ensure_ascii=False, separators=(",", ":"))
+
+    def uncached(func):
+        # 先清空各节点的编码缓存，测量完整编码
+        def run():
+            root._encoded = root["rows"]._encoded = None
+            for row in root["rows"]:
+                row._encoded = row["tags"]._encoded = None
+            return func()
+
+        return run
+
+    results = [
+        ("json.dumps（未封装的副本）", dumps_plain),
+        ("to_plain + json.dumps     ", dumps_old),
+        ("encode JSON（无缓存）     ", uncached(lambda: encode(root))),
+        ("iter_encode JSON（无缓存）", uncached(lambda: b"".join(iter_encode(root)))),
+        ("encode 二进制（无缓存）   ", uncached(lambda: encode(root, FORMAT_BINARY))),
+    ]
+    for label, func in results:
+        elapsed = timeit.timeit(func, number=number)
+        print(f"  {label}: {elapsed / number * 1000:8.2f} ms")
+
+    # 每次修改一行后重新编码：只有被修改的行、rows 和根需要重新编码。
+    # 缓存每修改一次沿路径向下一层（先是 rows，再是每一行），先修改两次预热
+    for format in (FORMAT_JSON, FORMAT_BINARY):
+        encode(root, format)
+        for i in range(2):
+            root["rows"][0].name = f"warm{i}"
+            encode(root, format)
+    count = 200
+    for format in (FORMAT_JSON, FORMAT_BINARY):
+        start = time.perf_counter()
+        for i in range(count):
+            root["rows"][(i * 7919) % rows].name = f"{format}{i}"
+            encode(root, format)
+        elapsed = time.perf_counter() - start
+        print(f"  修改一行后增量 encode {format:6}: {elapsed / count * 1000:8.2f} ms")
+
+
+@benchmark("metrics")
+def bench_metrics(quick: bool = False) -> None:
+    """指标关闭 / 开启时的单次写入开销，以及关闭时每处检查本身的成本"""
+    print("\n【运行指标的开销】")
+    print("-" * 40)
+
+    count = 20_000 if quick else 200_000
+
+    def run():
+        root = ReactivableDict({"count": 0, "address": {"city": ""}})
+        root.subscribe(lambda value: None)
+        address = root.address
+        start = time.perf_counter()
+        for i in range(count):
+            address.city = i
+        return time.perf_counter() - start
+
+    # 交替测量，减少机器状态变化的影响
+    disabled, enabled = [], []
+    for _ in range(3):
+        disable_metrics()
+        disabled.append(run())
+        enable_metrics()
+        enabled.append(run())
+    disable_metrics()
+    print(f"  关闭: {_per_op_ns(min(disabled), count):8.1f} ns/写入（含通知）")
+    print(f"  开启: {_per_op_ns(min(enabled), count):8.1f} ns/写入（含通知）")
+
+    # 关闭时这里的每次写入只多 3 处 `_metrics is not None` 判断
+    # （execute、flush、每个观察者回调各一处）
+    number = 1_000_000
+    check = timeit.timeit(
+        "_metrics is not None", globals=vars(reactive_module), number=number
+    )
+    empty = timeit.timeit("pass", number=number)
+    print(
+        f"  关闭时每处检查: {_per_op_ns(max(check - empty, 0.0), number):6.1f} ns，"
+        f"占一次写入的 {3 * (check - empty) / number / (min(disabled) / count):.2%}"
+    )
+
+
+@benchmark("engine")
+def bench_engine(quick: bool = False) -> None:
+    """引擎核心路径的回归基准：每项取多轮中的最小值，结果写入 RESULTS"""
+    print("\n【引擎核心路径】")
+    print("-" * 40)
+
+    scale = 1 if quick else 10
+
+    # 构造并封装大型树（每轮使用新的数据，封装会原地修改数据）
+    records = 1_000 * scale
+    payloads = [_large_payload(records) for _ in range(_REPEAT)]
+    _record_best(
+        "engine.construct",
+        [_elapsed(lambda: ReactivableDict(payload)) for payload in payloads],
+        records,
+        "ns/record",
+    )
+    del payloads
+
+    # 属性读写（同步通知、没有观察者）
+    number = 20_000 * scale
+    root = ReactivableDict({"title": "", "count": 0, "address": {"city": ""}})
+    namespace = {"root": root, "values": range(number)}
+    _record_timeit("engine.read", "root.title", namespace, number)
+    _record_timeit("engine.read_nested", "root.address.city", namespace, number)
+    _record_best(
+        "engine.write",
+        [_elapsed(lambda: _write_all(root, number)) for _ in range(_REPEAT)],
+        number,
+    )
+
+    # append 吞吐（含历史记录），每轮使用新的列表
+    def append_all(items):
+        for i in range(number):
+            items.append(i)
+
+    docs = [ReactivableDict({"items": []}) for _ in range(_REPEAT)]
+    _record_best(
+        "engine.append",
+        [_elapsed(lambda: append_all(doc["items"])) for doc in docs],
+        number,
+    )
+    del docs
+
+    # 通知扇出：同一节点上 N 个观察者
+    for observers in (1, 10, 100):
+        node = ReactivableDict({"count": 0})
+        for _ in range(observers):
+            node.subscribe(lambda value: None)
+        count = number // observers
+        _record_best(
+            f"engine.fanout_{observers}",
+            [
+                _elapsed(lambda: _write_all(node, count, "count"))
+                for _ in range(_REPEAT)
+            ],
+            count,
+        )
+
+    # 冒泡深度：修改深度为 D 的叶子，根上有一个观察者
+    for depth in (1, 8, 32):
+        data = value = {}
+        for _ in range(depth):
+            value["child"] = {}
+            value = value["child"]
+        value["count"] = 0
+        node = tree = ReactivableDict(data)
+        tree.subscribe(lambda value: None)
+        for _ in range(depth):
+            node = node.child
+        _record_best(
+            f"engine.bubble_{depth}",
+            [
+                _elapsed(lambda: _write_all(node, number, "count"))
+                for _ in range(_REPEAT)
+            ],
+            number,
+        )
+
+    # 撤销 / 重做吞吐（只计时撤销或重做本身）
+    def history_run(action):
+        manager = CommandManager(max_depth=number)
+        doc = ReactivableDict({"count": 0}, command_manager=manager)
+        _write_all(doc, number, "count")
+        if action == "redo":
+            for _ in range(number):
+                manager.undo()
+        step = getattr(manager, action)
+
+        def steps():
+            for _ in range(number):
+                step()
+
+        return _elapsed(steps)
+
+    for action in ("undo", "redo"):
+        _record_best(
+            f"engine.{action}",
+            [history_run(action) for _ in range(_REPEAT)],
+            number,
+        )
+
+    # 事务提交：每个事务包含 M 条修改
+    for size in (1, 10, 100):
+        doc = ReactivableDict({f"k{i}": 0 for i in range(size)})
+        doc.subscribe(lambda value: None)
+        keys = [f"k{i}" for i in range(size)]
+        transactions = number // size
+
+        def commit_all():
+            for n in range(1, transactions + 1):
+                with doc.batch_update():
+                    for key in keys:
+                        doc[key] = n
+
+        _record_best(
+            f"engine.transaction_{size}",
+            [_elapsed(commit_all) for _ in range(_REPEAT)],
+            transactions,
+            "ns/transaction",
+        )
+
+
+def _write_all(node: ReactivableDict, count: int, key: str = "title") -> None:
+    """对 node[key] 连续写入 count 个不同的值"""
+    base = node[key] if isinstance(node[key], int) else 0
+    for i in range(base + 1, base + count + 1):
+        node[key] = i
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="reactive 性能基准")
+    parser.add_argument(
+        "names", nargs="*", metavar="NAME", help=f"基准名称: {', '.join(BENCHMARKS)}"
+    )
+    parser.add_argument("--quick", action="store_true", help="缩小规模，快速运行")
+    parser.add_argument("--json", metavar="PATH", help="把记录的结果保存为 JSON")
+    parser.add_argument("--compare", metavar="PATH", help="与保存的基线 JSON 比较")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="变慢超过该比例视为回归（默认 0.25）",
+    )
+    args = parser.parse_args(argv)
+
+    names = args.names or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error(f"未知基准: {name}")
+    for name in names:
+        BENCHMARKS[name](args.quick)
+
+    if args.json:
+        save_results(args.json, args.quick)
+    if args.compare:
+        regressions = compare_results(args.compare, args.quick, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 项回归: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
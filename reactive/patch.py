@@ -0,0 +1,243 @@
+"""
+命令历史的结构化差量导出
+
+把已执行的 Command / CompositeCommand 转换为类似 JSON Patch（RFC 6902）的操作列表，
+路径由节点的 _parent / _key 推导；远端通过 apply_patch 在自己的响应式树上重放，
+从而只传输差量而不必重新序列化整个文档。
+
+    local.manager.add_listener(patch_listener(send))   # 本地：导出
+    apply_patch(remote_root, ops)                      # 远端：应用
+
+注意：列表位置按导出时的状态计算，应在命令执行、撤销或重做后立即导出。
+patch_listener 满足这一点：它通过 capture 让命令管理器在每条子命令执行后立即导出，
+事务内的补丁逐条计算、提交时一起交给 sink。
+"""
+
+import json
+import operator
+from array import array
+from functools import singledispatch
+
+from reactive.reactive import (
+    _MISSING,
+    AppendCommand,
+    ArrayRangeCommand,
+    Command,
+    CompositeCommand,
+    DelItemCommand,
+    InsertCommand,
+    PopCommand,
+    Reactivable,
+    ReactivableArray,
+    ReactivableList,
+    SetItemCommand,
+    SliceCommand,
+    UpdateCommand,
+    to_plain,
+)
+
+
+def _plain(value):
+    """把响应式对象还原为普通 dict / list，便于序列化"""
+    return to_plain(value)
+
+
+def _escape(key) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def to_pointer(keys) -> str:
+    """键路径 -> JSON Pointer，如 ("address", "city") -> "/address/city" """
+    return "".join("/" + _escape(key) for key in keys)
+
+
+def from_pointer(pointer: str) -> list[str]:
+    """JSON Pointer -> 键路径（各段均为字符串）"""
+    if not pointer:
+        return []
+    if not pointer.startswith("/"):
+        raise ValueError(f"无效的路径 {pointer!r}")
+    return [_unescape(token) for token in pointer[1:].split("/")]
+
+
+def _op(op: str, target: Reactivable, key, value=None, with_value=True) -> dict:
+    record = {"op": op, "path": to_pointer(target._path() + (key,))}
+    if with_value:
+        record["value"] = _plain(value)
+    return record
+
+
+@singledispatch
+def command_to_patch(command: Command, inverse: bool = False) -> list[dict]:
+    """把命令转换为补丁操作列表
+
+    Args:
+        command: 刚执行（或撤销、重做）的命令
+        inverse: True 表示导出撤销该命令产生的变更
+
+    Raises:
+        TypeError: 不支持的命令类型
+    """
+    raise TypeError(f"不支持导出的命令类型: {type(command).__name__}")
+
+
+@command_to_patch.register
+def _(command: SetItemCommand, inverse: bool = False) -> list[dict]:
+    if inverse and command.old_value is _MISSING:
+        # 撤销新增的键
+        return [_op("remove", command.target, command.key, with_value=False)]
+    value = command.old_value if inverse else command.new_value
+    # 对象成员的 add 等价于“新增或替换”；列表元素只能 replace
+    op = "replace" if isinstance(command.target._value, list) else "add"
+    return [_op(op, command.target, command.key, value)]
+
+
+@command_to_patch.register
+def _(command: DelItemCommand, inverse: bool = False) -> list[dict]:
+    if inverse:
+        return [_op("add", command.target, command.key, command.old_value)]
+    return [_op("remove", command.target, command.key, with_value=False)]
+
+
+@command_to_patch.register
+def _(command: UpdateCommand, inverse: bool = False) -> list[dict]:
+    target, old = command.target, command.old
+    if inverse:
+        ops = [
+            _op("remove", target, key, with_value=False)
+            for key in command.new
+            if key not in old
+        ]
+        ops.extend(_op("add", target, key, value) for key, value in old.items())
+        return ops
+    ops = [_op("add", target, key, value) for key, value in command.new.items()]
+    ops.extend(_op("remove", target, key, with_value=False) for key in command.removed)
+    return ops
+
+
+@command_to_patch.register
+def _(command: InsertCommand, inverse: bool = False) -> list[dict]:
+    if inverse:
+        return [_op("remove", command.target, command.index, with_value=False)]
+    return [_op("add", command.target, command.index, command.value)]
+
+
+@command_to_patch.register
+def _(command: AppendCommand, inverse: bool = False) -> list[dict]:
+    if inverse:
+        return [_op("remove", command.target, command.index, with_value=False)]
+    return [_op("add", command.target, "-", command.value)]
+
+
+@command_to_patch.register
+def _(command: PopCommand, inverse: bool = False) -> list[dict]:
+    if inverse:
+        return [_op("add", command.target, command.index, command.old_value)]
+    return [_op("remove", command.target, command.index, with_value=False)]
+
+
+def _splice_ops(target, start: int, removed, added, same) -> list[dict]:
+    """列表区间 [start, start + len(removed)) 被替换为 added 的补丁操作"""
+    if len(removed) == len(added):
+        # 等长替换（sort、reverse、等长切片赋值）：只导出发生变化的位置
+        return [
+            _op("replace", target, start + i, new)
+            for i, (old, new) in enumerate(zip(removed, added))
+            if not same(old, new)
+        ]
+    ops = [_op("remove", target, start, with_value=False) for _ in removed]
+    ops.extend(_op("add", target, start + i, value) for i, value in enumerate(added))
+    return ops
+
+
+@command_to_patch.register
+def _(command: SliceCommand, inverse: bool = False) -> list[dict]:
+    removed, added = command.old_items, command.items
+    if inverse:
+        removed, added = added, removed
+    return _splice_ops(command.target, command.start, removed, added, operator.is_)
+
+
+@command_to_patch.register
+def _(command: ArrayRangeCommand, inverse: bool = False) -> list[dict]:
+    typecode = command.target.typecode
+    removed = array(typecode, command.old).tolist()
+    added = array(typecode, command.new).tolist()
+    if inverse:
+        removed, added = added, removed
+    return _splice_ops(command.target, command.start, removed, added, operator.eq)
+
+
+@command_to_patch.register
+def _(command: CompositeCommand, inverse: bool = False) -> list[dict]:
+    children = reversed(command.commands) if inverse else command.commands
+    ops = []
+    for child in children:
+        ops.extend(command_to_patch(child, inverse))
+    return ops
+
+
+def patch_listener(sink):
+    """返回可注册到 CommandManager.add_listener 的监听器，把每次变更的补丁交给 sink
+
+    Args:
+        sink: 回调 sink(ops)，ops 为补丁操作列表
+    """
+
+    def listener(action: str, command: Command, ops: list[dict]) -> None:
+        sink(ops)
+
+    # 补丁在每条子命令执行后立即计算，路径对应当时的树
+    listener.capture = command_to_patch
+    return listener
+
+
+def dumps_patch(ops: list[dict]) -> str:
+    """紧凑 JSON 编码"""
+    return json.dumps(ops, ensure_ascii=False, separators=(",", ":"))
+
+
+def _resolve(root: Reactivable, keys: list[str]):
+    """沿路径定位到父节点，返回 (父节点, 最后一段键)"""
+    if not keys:
+        raise ValueError("不支持对根路径的操作")
+    node = root
+    for token in keys[:-1]:
+        node = node[_index(node, token)]
+    return node, keys[-1]
+
+
+def _index(node, token: str):
+    if isinstance(node, (ReactivableList, ReactivableArray)):
+        return int(token)
+    return token
+
+
+def apply_patch(root: Reactivable, ops: list[dict]) -> None:
+    """在响应式树上应用补丁，整个补丁作为一个事务记录并合并通知
+
+    Raises:
+        ValueError: 未知的操作或路径无效
+    """
+    with root.batch_update():
+        for record in ops:
+            op = record["op"]
+            parent, token = _resolve(root, from_pointer(record["path"]))
+            is_list = isinstance(parent, (ReactivableList, ReactivableArray))
+            if op == "add":
+                if is_list and token == "-":
+                    parent.append(record["value"])
+                elif is_list:
+                    parent.insert(int(token), record["value"])
+                else:
+                    parent[token] = record["value"]
+            elif op == "replace":
+                parent[_index(parent, token)] = record["value"]
+            elif op == "remove":
+                del parent[_index(parent, token)]
+            else:
+                raise ValueError(f"未知的补丁操作 {op!r}")
@@ -0,0 +1,256 @@
+"""
+响应式文档的快照 + 预写日志（WAL）持久化
+
+每条进入历史的变更（执行、撤销、重做、事务提交）以补丁形式追加到日志，
+定期把当前状态压缩为快照并截断日志。恢复时读取快照，再重放快照之后的日志记录。
+
+    store = DocumentStore("data/doc", fsync="batch")
+    doc = store.open(default={"title": ""})
+    doc.title = "hello"          # 自动写入日志
+    store.snapshot()             # 压缩
+    store.close()
+
+目录结构:
+    snapshot.json   {"seq": 最后包含的日志序号, "data": 文档数据}
+    wal.log         每行一条记录 {"seq": 序号, "ops": 补丁操作列表}
+"""
+
+import json
+import os
+
+from reactive.patch import _plain, from_pointer, patch_listener
+from reactive.reactive import ReactivableDict
+
+# fsync 策略
+FSYNC_ALWAYS = "always"  # 每条记录都 fsync，最安全、最慢
+FSYNC_BATCH = "batch"  # 每 batch_size 条记录 fsync 一次
+FSYNC_NEVER = "never"  # 只写入操作系统缓存，由操作系统决定落盘时机
+
+SNAPSHOT_FILE = "snapshot.json"
+LOG_FILE = "wal.log"
+
+
+def _fsync_directory(path: str) -> None:
+    """fsync 目录，保证 rename 等元数据操作落盘（Windows 不支持，忽略）"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def apply_plain_patch(data, ops: list[dict]) -> None:
+    """在普通 dict / list 数据上原地应用补丁（恢复时使用，不经过响应式封装）
+
+    Raises:
+        ValueError: 未知的操作或路径无效
+    """
+    for record in ops:
+        keys = from_pointer(record["path"])
+        if not keys:
+            raise ValueError("不支持对根路径的操作")
+        parent = data
+        for token in keys[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        token = keys[-1]
+        op = record["op"]
+        if op == "add":
+            if isinstance(parent, list):
+                if token == "-":
+                    parent.append(record["value"])
+                else:
+                    parent.insert(int(token), record["value"])
+            else:
+                parent[token] = record["value"]
+        elif op == "replace":
+            parent[int(token) if isinstance(parent, list) else token] = record["value"]
+        elif op == "remove":
+            del parent[int(token) if isinstance(parent, list) else token]
+        else:
+            raise ValueError(f"未知的补丁操作 {op!r}")
+
+
+class DocumentStore:
+    """单个响应式文档的持久化存储"""
+
+    FSYNC_MODES = (FSYNC_ALWAYS, FSYNC_BATCH, FSYNC_NEVER)
+
+    def __init__(
+        self,
+        directory: str,
+        fsync: str = FSYNC_BATCH,
+        batch_size: int = 64,
+        snapshot_every: int | None = None,
+    ):
+        """
+        Args:
+            directory: 存放快照和日志的目录，不存在时自动创建
+            fsync: fsync 策略，always / batch / never
+            batch_size: batch 策略下每多少条记录 fsync 一次
+            snapshot_every: 每写入多少条日志自动做一次快照，None 表示只手动快照
+        """
+        if fsync not in self.FSYNC_MODES:
+            raise ValueError(
+                f"未知的 fsync 策略 {fsync!r}，可选: {', '.join(self.FSYNC_MODES)}"
+            )
+        self.directory = directory
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.snapshot_every = snapshot_every
+        self.seq = 0
+        self._document: ReactivableDict | None = None
+        self._log = None
+        # 补丁按每条子命令执行时的树计算，事务提交时整体写入一条日志
+        self._listener = patch_listener(self._on_change)
+        self._unsynced = 0
+        self._since_snapshot = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, SNAPSHOT_FILE)
+
+    @property
+    def log_path(self) -> str:
+        return os.path.join(self.directory, LOG_FILE)
+
+    def open(self, default: dict | None = None, **kwargs) -> ReactivableDict:
+        """恢复文档并开始记录变更
+
+        Args:
+            default: 没有任何持久化数据时的初始内容
+            **kwargs: 传给 ReactivableDict 的其他参数（如 command_manager、lazy）
+
+        Returns:
+            恢复后的响应式文档
+        """
+        if self._document is not None:
+            raise RuntimeError("文档已经打开")
+        data = self.recover(default)
+        self._document = ReactivableDict(data, **kwargs)
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        self._document._command_manager.add_listener(self._listener)
+        if not os.path.exists(self.snapshot_path):
+            # 首次打开：初始内容不在日志中，先落一份快照
+            self.snapshot()
+        return self._document
+
+    def recover(self, default: dict | None = None) -> dict:
+        """读取快照并重放其后的日志，返回普通数据（不打开文档）"""
+        data = {} if default is None else default
+        self.seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            data = snapshot["data"]
+            self.seq = snapshot["seq"]
+
+        if not os.path.exists(self.log_path):
+            return data
+
+        valid_size = 0
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 崩溃时写了一半的记录：丢弃它及之后的内容
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                valid_size += len(line)
+                # 快照已包含的记录（快照后、截断日志前崩溃）直接跳过
+                if record["seq"] <= self.seq:
+                    continue
+                apply_plain_patch(data, record["ops"])
+                self.seq = record["seq"]
+
+        if valid_size != os.path.getsize(self.log_path):
+            with open(self.log_path, "r+b") as f:
+                f.truncate(valid_size)
+        return data
+
+    def _on_change(self, ops: list[dict]) -> None:
+        """把一次变更的补丁追加到日志"""
+        assert self._log is not None
+        if not ops:
+            return
+        self.seq += 1
+        self._log.write(
+            json.dumps(
+                {"seq": self.seq, "ops": ops},
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+            + "\n"
+        )
+        self._unsynced += 1
+        self._since_snapshot += 1
+        if self.fsync == FSYNC_ALWAYS or (
+            self.fsync == FSYNC_BATCH and self._unsynced >= self.batch_size
+        ):
+            self.sync()
+        else:
+            # 每条记录都交给操作系统，进程崩溃也不会丢在 Python 缓冲区里；
+            # 只有 fsync 按策略推迟
+            self._log.flush()
+        if self.snapshot_every and self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def sync(self) -> None:
+        """把已写入的日志刷到磁盘"""
+        if self._log is None:
+            return
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._unsynced = 0
+
+    def snapshot(self) -> None:
+        """把当前状态压缩为快照，并截断日志
+
+        先写临时文件并 fsync，再原子替换旧快照，最后截断日志；
+        任何一步崩溃，恢复时都能得到一致的状态。
+        """
+        if self._document is None:
+            raise RuntimeError("文档尚未打开")
+        assert self._log is not None
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"seq": self.seq, "data": _plain(self._document)},
+                f,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        _fsync_directory(self.directory)
+
+        self._log.close()
+        self._log = open(self.log_path, "w", encoding="utf-8")
+        self._unsynced = 0
+        self._since_snapshot = 0
+
+    def close(self) -> None:
+        """同步日志并停止记录"""
+        if self._document is None:
+            return
+        self.sync()
+        assert self._log is not None
+        self._log.close()
+        self._log = None
+        self._document._command_manager.remove_listener(self._listener)
+        self._document = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
@@ -1,9 +1,51 @@
+import asyncio
+import inspect
+import sys
+import threading
+import time
+import weakref
 from abc import ABC, abstractmethod
-from typing import Protocol
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from collections.abc import ItemsView, ValuesView
+from contextlib import nullcontext
+from contextvars import ContextVar
+from itertools import repeat
+from types import MappingProxyType
+from typing import NamedTuple, Protocol
+
+# 默认历史深度
+DEFAULT_MAX_DEPTH = 200
+
+# 会被封装为子响应式对象的容器类型
+_CONTAINER_TYPES = (list, dict, array)
+
+# 表示“键原来不存在”的旧值，撤销时删除该键而不是写回 None
+_MISSING = object()
+
+# 通知调度模式
+NOTIFY_SYNC = "sync"  # 每次变更后立即 flush（默认，与旧行为一致）
+NOTIFY_MANUAL = "manual"  # 只标记脏节点，由调用方显式 flush()
+NOTIFY_ASYNCIO = "asyncio"  # 在事件循环的下一个 tick 自动 flush
+
+# 观察者接收的内容
+DELIVER_VALUE = "value"  # observer(value)：整个容器（默认，与旧行为一致）
+DELIVER_CHANGES = "changes"  # observer(changes)：本次 flush 中的结构化变更记录
+
+# 变更记录的操作类型
+CHANGE_ADD = "add"  # 新增键
+CHANGE_SET = "set"  # 替换键或列表元素的值
+CHANGE_DELETE = "delete"  # 删除键
+CHANGE_SPLICE = "splice"  # 替换列表 / 数组的连续区间（插入、删除、批量写入）
+CHANGE_RESET = "reset"  # 容器整体变化（未提供变更记录的自定义命令）
 
 
 class ControllerProtocol(Protocol):
-    """控件标准接口：所有使用响应式数据的控件必须实现此接口"""
+    """控件标准接口：所有使用响应式数据的控件必须实现此接口
+
+    update 也可以是 async 方法：此时它在事件循环上作为任务运行，不阻塞修改数据的一方
+    """
 
     def update(self, reactive_data: "Reactivable") -> None:
         """更新控件，接收响应式数据
@@ -15,7 +57,11 @@ class ControllerProtocol(Protocol):
 
 
 class BatchUpdate:
-    """批量更新上下文管理器"""
+    """批量更新上下文管理器
+
+    批量期间的所有变更记录为一个事务，退出最外层批量时统一调度通知：
+    每个受影响的观察者和控件只收到一次通知。支持嵌套。
+    """
 
     def __init__(self, reactivable: "Reactivable"):
         self._reactivable = reactivable
@@ -31,13 +77,57 @@ class BatchUpdate:
         # 提交事务
         assert self._transaction_context is not None  # 类型检查器需要这个断言
         self._transaction_context.__exit__(exc_type, exc_val, exc_tb)
-        # 发送通知
-        self._reactivable.notify()
         return False  # 不抑制异常，让异常直接抛出
 
 
+class Change(NamedTuple):
+    """一条结构化变更记录
+
+    add / set / delete: 容器 target 中的键 key 从 old 变为 new（不存在时为 None）；
+    splice: 容器 target 中从 key 开始的区间 [key, stop) 的元素 old 被替换为 new，
+    old / new 为元素序列。其中的容器为记录生成时的不可变快照（见 snapshot），
+    其余值为对象本身。
+    """
+
+    op: str
+    # 被修改的容器
+    target: object
+    # 被修改的容器相对订阅者的键路径
+    path: tuple
+    key: object
+    old: object
+    new: object
+
+    @property
+    def stop(self):
+        """splice 被替换区间的终点（替换前）"""
+        return self.key + len(self.old)
+
+
 class Command(ABC):
-    """命令基类，定义 undo() 和 redo() 方法"""
+    """命令基类，定义 undo() 和 redo() 方法
+
+    历史中可能同时存在大量命令，所有子类都使用 __slots__，不创建实例 __dict__。
+
+    命令只弱引用被修改的对象（target）：历史不会让应用已经丢弃的文档继续存活。
+    目标已被回收的命令视为失效（alive 为 False），撤销、重做时被跳过。
+    """
+
+    __slots__ = ()
+
+    @property
+    def target(self):
+        """被修改的响应式对象，已被回收时为 None"""
+        return self._target()
+
+    @target.setter
+    def target(self, target):
+        self._target = weakref.ref(target)
+
+    @property
+    def alive(self) -> bool:
+        """被修改的对象是否仍然存活"""
+        return self._target() is not None
 
     @abstractmethod
     def execute(self):
@@ -54,10 +144,32 @@ class Command(ABC):
         """重做命令"""
         pass
 
+    def targets(self):
+        """返回命令修改的响应式对象"""
+        return (self.target,)
+
+    def changes(self):
+        """返回命令修改的位置 (target, key)；key 为 None 表示整个容器（如列表结构变化）"""
+        return ((self.target, None),)
+
+    def records(self, inverse: bool = False) -> list[Change]:
+        """返回命令刚刚产生的变更记录，path 为从根对象到被修改容器的路径
+
+        应在命令执行、撤销或重做后立即调用（列表位置按当前状态计算）。
+
+        Args:
+            inverse: True 表示撤销该命令产生的变更
+        """
+        return [
+            Change(CHANGE_RESET, self.target, self.target._path(), None, None, None)
+        ]
+
 
 class SetItemCommand(Command):
     """设置键值命令"""
 
+    __slots__ = ("_target", "key", "new_value", "old_value")
+
     def __init__(self, target, key, new_value, old_value):
         self.target = target
         self.key = key
@@ -69,17 +181,38 @@ class SetItemCommand(Command):
         self.target._value[self.key] = self.new_value
 
     def undo(self):
-        """撤销命令：恢复旧值"""
-        self.target._value[self.key] = self.old_value
+        """撤销命令：恢复旧值（键原来不存在时删除）"""
+        if self.old_value is _MISSING:
+            del self.target._value[self.key]
+        else:
+            self.target._value[self.key] = self.old_value
 
     def redo(self):
         """重做命令：再次设置新值"""
         self.target._value[self.key] = self.new_value
 
+    def changes(self):
+        """返回命令修改的位置"""
+        return ((self.target, self.key),)
+
+    def records(self, inverse: bool = False) -> list[Change]:
+        target = self.target
+        path = target._path()
+        old, new = self.old_value, self.new_value
+        if old is _MISSING:
+            if inverse:
+                return [Change(CHANGE_DELETE, target, path, self.key, new, None)]
+            return [Change(CHANGE_ADD, target, path, self.key, None, new)]
+        if inverse:
+            old, new = new, old
+        return [Change(CHANGE_SET, target, path, self.key, old, new)]
+
 
 class DelItemCommand(Command):
     """删除键值命令"""
 
+    __slots__ = ("_target", "key", "old_value")
+
     def __init__(self, target, key, old_value):
         self.target = target
         self.key = key
@@ -97,10 +230,106 @@ class DelItemCommand(Command):
         """重做命令：再次删除键值"""
         del self.target._value[self.key]
 
+    def changes(self):
+        """返回命令修改的位置"""
+        return ((self.target, self.key),)
+
+    def records(self, inverse: bool = False) -> list[Change]:
+        target = self.target
+        path = target._path()
+        if inverse:
+            return [Change(CHANGE_ADD, target, path, self.key, None, self.old_value)]
+        return [Change(CHANGE_DELETE, target, path, self.key, self.old_value, None)]
+
+
+class UpdateCommand(Command):
+    """批量修改字典的命令（update、clear 等）
+
+    只保存写入的新值、删除的键，以及其中原来存在的键的旧值；
+    撤销时原来不存在的键被删除，其余恢复旧值。
+    """
+
+    __slots__ = ("_target", "new", "removed", "old")
+
+    def __init__(self, target, new, removed, old):
+        """
+        Args:
+            target: 被修改的 ReactivableDict
+            new: 写入的键值
+            removed: 删除的键
+            old: new 和 removed 中原来存在的键的旧值
+        """
+        self.target = target
+        self.new = new
+        self.removed = tuple(removed)
+        self.old = old
+
+    def execute(self):
+        """执行命令：写入新值并删除键"""
+        data = self.target._value
+        data.update(self.new)
+        for key in self.removed:
+            del data[key]
+
+    def undo(self):
+        """撤销命令：删除新增的键，恢复旧值"""
+        data = self.target._value
+        old = self.old
+        for key in self.new:
+            if key not in old:
+                del data[key]
+        data.update(old)
+
+    def redo(self):
+        """重做命令"""
+        self.execute()
+
+    def changes(self):
+        """返回命令修改的位置"""
+        target = self.target
+        return [(target, key) for key in (*self.new, *self.removed)]
+
+    def records(self, inverse: bool = False) -> list[Change]:
+        target = self.target
+        path = target._path()
+        old = self.old
+        if inverse:
+            records = [
+                Change(CHANGE_DELETE, target, path, key, value, None)
+                for key, value in self.new.items()
+                if key not in old
+            ]
+            # old 中的键要么被写入（在 new 中），要么被删除；查 new 这个 dict 是 O(1)
+            new = self.new
+            records.extend(
+                (
+                    Change(CHANGE_SET, target, path, key, new[key], value)
+                    if key in new
+                    else Change(CHANGE_ADD, target, path, key, None, value)
+                )
+                for key, value in old.items()
+            )
+            return records
+        records = [
+            (
+                Change(CHANGE_SET, target, path, key, old[key], value)
+                if key in old
+                else Change(CHANGE_ADD, target, path, key, None, value)
+            )
+            for key, value in self.new.items()
+        ]
+        records.extend(
+            Change(CHANGE_DELETE, target, path, key, old[key], None)
+            for key in self.removed
+        )
+        return records
+
 
 class InsertCommand(Command):
     """插入元素命令"""
 
+    __slots__ = ("_target", "index", "value")
+
     def __init__(self, target, index, value):
         self.target = target
         self.index = index
@@ -118,17 +347,26 @@ class InsertCommand(Command):
         """重做命令：再次插入元素"""
         self.target._value.insert(self.index, self.value)
 
+    def records(self, inverse: bool = False) -> list[Change]:
+        return _splice(self.target, self.index, (), (self.value,), inverse)
+
 
 class AppendCommand(Command):
     """追加元素命令"""
 
+    __slots__ = ("_target", "value", "index")
+
     def __init__(self, target, value):
         self.target = target
         self.value = value
+        # 追加到的位置，执行时确定
+        self.index = None
 
     def execute(self):
         """执行命令：追加元素"""
-        self.target._value.append(self.value)
+        data = self.target._value
+        self.index = len(data)
+        data.append(self.value)
 
     def undo(self):
         """撤销命令：删除追加的元素"""
@@ -136,12 +374,17 @@ class AppendCommand(Command):
 
     def redo(self):
         """重做命令：再次追加元素"""
-        self.target._value.append(self.value)
+        self.execute()
+
+    def records(self, inverse: bool = False) -> list[Change]:
+        return _splice(self.target, self.index, (), (self.value,), inverse)
 
 
 class PopCommand(Command):
     """弹出元素命令"""
 
+    __slots__ = ("_target", "index", "old_value")
+
     def __init__(self, target, index, old_value):
         self.target = target
         self.index = index
@@ -159,12 +402,115 @@ class PopCommand(Command):
         """重做命令：再次弹出元素"""
         self.target._value.pop(self.index)
 
+    def records(self, inverse: bool = False) -> list[Change]:
+        return _splice(self.target, self.index, (self.old_value,), (), inverse)
+
+
+class SliceCommand(Command):
+    """替换列表连续区间的命令
+
+    extend、clear、切片赋值、sort、reverse 等批量操作都表示为一条命令：
+    只保存区间起点、被替换的旧元素和新元素，而不是逐个元素的命令。
+
+    sort() 和 reverse() 会移动几乎所有元素，目前保存整个列表的新旧两份元组，
+    长列表上每次排序的历史开销与列表长度成正比。
+    """
+
+    __slots__ = ("_target", "start", "stop", "items", "old_items")
+
+    def __init__(self, target, start, stop, items, old_items):
+        self.target = target
+        self.start = start
+        self.stop = stop
+        self.items = tuple(items)
+        self.old_items = tuple(old_items)
+
+    def execute(self):
+        """执行命令：用新元素替换 [start, stop)"""
+        self.target._value[self.start : self.stop] = self.items
+
+    def undo(self):
+        """撤销命令：把新元素所在区间恢复为旧元素"""
+        start = self.start
+        self.target._value[start : start + len(self.items)] = self.old_items
+
+    def redo(self):
+        """重做命令：再次替换"""
+        self.target._value[self.start : self.stop] = self.items
+
+    def records(self, inverse: bool = False) -> list[Change]:
+        return _splice(self.target, self.start, self.old_items, self.items, inverse)
+
+
+class ArrayRangeCommand(Command):
+    """替换 array 连续区间的命令
+
+    变更记录为 (start, old, new)：区间起点，以及被替换的旧元素和新元素的原始字节，
+    不为每个元素创建 Python 对象。
+    """
+
+    __slots__ = ("_target", "start", "old", "new")
+
+    def __init__(self, target, start: int, old: bytes, new: bytes):
+        self.target = target
+        self.start = start
+        self.old = old
+        self.new = new
+
+    @property
+    def stop(self) -> int:
+        """被替换区间的终点（执行前）"""
+        return self.start + len(self.old) // self.target._value.itemsize
+
+    def _replace(self, removed: bytes, added: bytes) -> None:
+        data = self.target._value
+        start = self.start
+        if len(removed) == len(added):
+            # 等长替换：直接写入底层缓冲区
+            itemsize = data.itemsize
+            memoryview(data).cast("B")[
+                start * itemsize : start * itemsize + len(added)
+            ] = added
+        else:
+            data[start : start + len(removed) // data.itemsize] = array(
+                data.typecode, added
+            )
+
+    def execute(self):
+        """执行命令：写入新元素"""
+        self._replace(self.old, self.new)
+
+    def undo(self):
+        """撤销命令：恢复旧元素"""
+        self._replace(self.new, self.old)
+
+    def redo(self):
+        """重做命令：再次写入新元素"""
+        self._replace(self.old, self.new)
+
+    def records(self, inverse: bool = False) -> list[Change]:
+        typecode = self.target.typecode
+        return _splice(
+            self.target,
+            self.start,
+            array(typecode, self.old),
+            array(typecode, self.new),
+            inverse,
+        )
+
 
 class CompositeCommand(Command):
     """复合命令（事务支持）"""
 
+    __slots__ = ("commands",)
+
     def __init__(self, commands):
-        self.commands = commands
+        self.commands = tuple(commands)
+
+    @property
+    def alive(self) -> bool:
+        """只要还有子命令的目标存活，复合命令就仍然有效"""
+        return any(command.alive for command in self.commands)
 
     def execute(self):
         """执行命令：执行所有子命令（正序）"""
@@ -172,14 +518,80 @@ class CompositeCommand(Command):
             command.execute()
 
     def undo(self):
-        """撤销命令：撤销所有子命令（逆序）"""
+        """撤销命令：撤销所有子命令（逆序），跳过目标已被回收的子命令"""
         for command in reversed(self.commands):
-            command.undo()
+            if command.alive:
+                command.undo()
 
     def redo(self):
-        """重做命令：重做所有子命令（正序）"""
+        """重做命令：重做所有子命令（正序），跳过目标已被回收的子命令"""
+        for command in self.commands:
+            if command.alive:
+                command.redo()
+
+    def targets(self):
+        """返回所有子命令修改的（仍然存活的）响应式对象"""
+        for command in self.commands:
+            if command.alive:
+                yield from command.targets()
+
+    def changes(self):
+        """返回所有子命令修改的（仍然存活的）位置"""
         for command in self.commands:
-            command.redo()
+            if command.alive:
+                yield from command.changes()
+
+    def records(self, inverse: bool = False) -> list[Change]:
+        """依次拼接子命令的变更记录（撤销时逆序）"""
+        commands = reversed(self.commands) if inverse else self.commands
+        records = []
+        for command in commands:
+            if command.alive:
+                records.extend(command.records(inverse))
+        return records
+
+
+def _splice(target, start: int, removed, added, inverse: bool) -> list[Change]:
+    """区间 [start, start + len(removed)) 被替换为 added 的变更记录"""
+    if inverse:
+        removed, added = added, removed
+    return [Change(CHANGE_SPLICE, target, target._path(), start, removed, added)]
+
+
+class CoalescePolicy:
+    """命令合并策略
+
+    连续写入同一 (target, key) 的 SetItemCommand 合并为一条历史：
+    保留第一次的旧值和最后一次的新值，一次撤销即可回到编辑前的状态。
+    """
+
+    def __init__(
+        self, window: float | None = 1.0, predicate=None, clock=time.monotonic
+    ):
+        """
+        Args:
+            window: 相邻两次写入的最大间隔（秒），超过则不再合并；None 表示不限
+            predicate: 额外的判定规则 predicate(previous, command) -> bool，
+                返回 False 时不合并
+            clock: 时间源，默认为 time.monotonic
+        """
+        self.window = window
+        self.predicate = predicate
+        self.clock = clock
+
+    def should_merge(self, previous: Command, command: Command, elapsed: float) -> bool:
+        """判断 command 是否可以合并到上一条历史 previous 中"""
+        if not isinstance(previous, SetItemCommand) or not isinstance(
+            command, SetItemCommand
+        ):
+            return False
+        if previous.target is not command.target or previous.key != command.key:
+            return False
+        if self.window is not None and elapsed > self.window:
+            return False
+        if self.predicate is not None and not self.predicate(previous, command):
+            return False
+        return True
 
 
 class TransactionContext:
@@ -197,77 +609,1007 @@ class TransactionContext:
         return False  # 不抑制异常，让异常直接抛出
 
 
-class CommandManager:
-    """命令管理器（全局单例）"""
+class _PathNode:
+    """订阅前缀树的节点"""
+
+    __slots__ = ("children", "callbacks")
+
+    def __init__(self):
+        self.children: dict[str, _PathNode] = {}
+        self.callbacks: dict = {}
+
 
-    _instance = None
+class PathIndex:
+    """路径订阅索引（前缀树）
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
+    路径以 "." 分隔，"*" 匹配任意一段，"**"（只能作为最后一段）匹配其下的任意路径。
+    变更路径 P 与订阅路径 S 满足以下任一条件即匹配：
+        - S 是 P 的前缀：变更发生在订阅位置之下
+        - P 是 S 的前缀：订阅位置所在的子树被整体替换
+    """
+
+    __slots__ = ("_root", "_size")
 
     def __init__(self):
-        # 避免重复初始化（单例模式）
-        if not hasattr(self, "undo_stack"):
-            self.undo_stack: list[Command] = []
-            self.redo_stack: list[Command] = []
-            self._transaction_commands: list[Command] | None = None
+        self._root = _PathNode()
+        self._size = 0
 
-    def execute(self, command: Command) -> None:
-        """执行命令，并添加到 undo_stack"""
-        command.execute()
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def split(pattern: str) -> list[str]:
+        segments = pattern.split(".") if pattern else ["**"]
+        if "**" in segments[:-1]:
+            raise ValueError(f"'**' 只能作为路径的最后一段: {pattern!r}")
+        return segments
+
+    def add(self, pattern: str, callback) -> None:
+        node = self._root
+        for segment in self.split(pattern):
+            node = node.children.setdefault(segment, _PathNode())
+        if callback not in node.callbacks:
+            node.callbacks[callback] = None
+            self._size += 1
+
+    def remove(self, pattern: str, callback) -> None:
+        node = self._root
+        for segment in self.split(pattern):
+            node = node.children.get(segment)
+            if node is None:
+                return
+        if callback in node.callbacks:
+            del node.callbacks[callback]
+            self._size -= 1
+
+    def match(self, path: tuple) -> dict:
+        """返回与变更路径匹配的回调（按注册顺序去重）"""
+        matched: dict = {}
+        self._match(self._root, path, 0, matched)
+        return matched
+
+    def _match(self, node: _PathNode, path: tuple, depth: int, matched: dict) -> None:
+        matched.update(node.callbacks)
+        if depth == len(path):
+            # 变更位置是订阅路径的祖先：子树中的所有订阅都受影响
+            self._collect(node, matched)
+            return
+        rest = node.children.get("**")
+        if rest is not None:
+            matched.update(rest.callbacks)
+        child = node.children.get(str(path[depth]))
+        if child is not None:
+            self._match(child, path, depth + 1, matched)
+        child = node.children.get("*")
+        if child is not None:
+            self._match(child, path, depth + 1, matched)
+
+    def _collect(self, node: _PathNode, matched: dict) -> None:
+        for child in node.children.values():
+            matched.update(child.callbacks)
+            self._collect(child, matched)
+
+
+class Histogram:
+    """固定分桶的直方图（Prometheus 风格，桶上界从小到大）"""
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        # 每个桶（最后一个为 +Inf）的非累计计数
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self) -> dict:
+        """{"count", "sum", "buckets": {上界: 累计计数}}，最后一个上界为 "+Inf" """
+        buckets = {}
+        total = 0
+        for bound, count in zip((*self.bounds, "+Inf"), self.counts):
+            total += count
+            buckets[bound] = total
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+# 回调耗时（秒）与数量类指标（扇出、冒泡深度、事务大小）的默认分桶
+LATENCY_BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 1)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096)
+
+
+class Metrics:
+    """响应式引擎的运行指标，由 enable_metrics() 开启
+
+    计数在持有 GIL 的情况下直接累加，多线程下可能有极少量误差。
+    """
+
+    def __init__(self):
+        # (动作, 命令类型) -> 次数，动作为 execute / undo / redo
+        self.commands: dict[tuple[str, str], int] = {}
+        self.flushes = 0
+        # 每次 flush 通知的节点数
+        self.fanout = Histogram(COUNT_BUCKETS)
+        # 每个脏节点向上冒泡经过的节点数（含自身）
+        self.bubble_depth = Histogram(COUNT_BUCKETS)
+        # (observer / controller, 回调名称) -> 回调耗时
+        self.callbacks: dict[tuple[str, str], Histogram] = {}
+        # 每次提交的事务包含的命令数
+        self.transaction_size = Histogram(COUNT_BUCKETS)
+        # 产生过命令的命令管理器，导出时读取其历史大小
+        self._managers: weakref.WeakSet = weakref.WeakSet()
+
+    def command(self, action: str, command: Command, manager=None) -> None:
+        key = (action, type(command).__name__)
+        self.commands[key] = self.commands.get(key, 0) + 1
+        if manager is not None:
+            self._managers.add(manager)
+
+    def callback(self, kind: str, callback, elapsed: float) -> None:
+        key = (kind, _callback_name(callback))
+        histogram = self.callbacks.get(key)
+        if histogram is None:
+            histogram = self.callbacks[key] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(elapsed)
+
+    def flush(self, dirty, chain) -> None:
+        self.flushes += 1
+        self.fanout.observe(len(chain))
+        for node in dirty:
+            depth = 0
+            while node is not None:
+                depth += 1
+                if node._controller is not None:
+                    break
+                node = node._parent
+            self.bubble_depth.observe(depth)
+
+    def history(self) -> dict:
+        """当前所有命令管理器的历史大小"""
+        managers = list(self._managers)
+        return {
+            "managers": len(managers),
+            "undo": sum(len(m.undo_stack) for m in managers),
+            "redo": sum(len(m.redo_stack) for m in managers),
+            # 只统计设置了字节预算（逐条记录大小）的管理器
+            "bytes": sum(m._history_bytes for m in managers if m.max_bytes),
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            "commands": {
+                f"{action}:{name}": count
+                for (action, name), count in self.commands.items()
+            },
+            "flushes": self.flushes,
+            "fanout": self.fanout.as_dict(),
+            "bubble_depth": self.bubble_depth.as_dict(),
+            "callbacks": {
+                f"{kind}:{name}": histogram.as_dict()
+                for (kind, name), histogram in self.callbacks.items()
+            },
+            "transaction_size": self.transaction_size.as_dict(),
+            "history": self.history(),
+        }
+
+    def to_prometheus(self, prefix: str = "reactive") -> str:
+        """导出为 Prometheus 文本格式"""
+        lines = [
+            f"# HELP {prefix}_commands_total 执行、撤销、重做的命令数",
+            f"# TYPE {prefix}_commands_total counter",
+        ]
+        for (action, name), count in self.commands.items():
+            lines.append(
+                f'{prefix}_commands_total{{action="{action}",type="{name}"}} {count}'
+            )
+        lines.append(f"# TYPE {prefix}_flushes_total counter")
+        lines.append(f"{prefix}_flushes_total {self.flushes}")
+        for name, histogram in (
+            ("notify_fanout", self.fanout),
+            ("bubble_depth", self.bubble_depth),
+            ("transaction_commands", self.transaction_size),
+        ):
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            lines.extend(_prometheus_histogram(f"{prefix}_{name}", histogram, ""))
+        lines.append(f"# TYPE {prefix}_callback_seconds histogram")
+        for (kind, name), histogram in self.callbacks.items():
+            labels = f'kind="{kind}",callback="{_prometheus_escape(name)}"'
+            lines.extend(
+                _prometheus_histogram(f"{prefix}_callback_seconds", histogram, labels)
+            )
+        history = self.history()
+        for key in ("undo", "redo", "bytes"):
+            lines.append(f"# TYPE {prefix}_history_{key} gauge")
+            lines.append(f"{prefix}_history_{key} {history[key]}")
+        return "\n".join(lines) + "\n"
+
+
+def _callback_name(callback) -> str:
+    return getattr(callback, "__qualname__", None) or type(callback).__qualname__
+
+
+def _prometheus_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prometheus_histogram(name: str, histogram: Histogram, labels: str) -> list[str]:
+    prefix = labels + "," if labels else ""
+    lines = [
+        f'{name}_bucket{{{prefix}le="{bound}"}} {count}'
+        for bound, count in histogram.as_dict()["buckets"].items()
+    ]
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram.sum}")
+    lines.append(f"{name}_count{suffix} {histogram.count}")
+    return lines
+
+
+# 指标默认关闭：关闭时各处只多一次全局变量的 None 判断
+_metrics: Metrics | None = None
+
+
+def enable_metrics() -> Metrics:
+    """开启指标收集（已开启时返回现有的 Metrics）"""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
+
+
+def disable_metrics() -> Metrics | None:
+    """关闭指标收集，返回此前收集的 Metrics"""
+    global _metrics
+    metrics, _metrics = _metrics, None
+    return metrics
 
-        # 如果在事务中，记录命令；否则，直接添加到 undo_stack
-        if self._transaction_commands is not None:
-            self._transaction_commands.append(command)
+
+def get_metrics() -> Metrics | None:
+    """当前的 Metrics，未开启时为 None"""
+    return _metrics
+
+
+class NotifyScheduler:
+    """通知调度器
+
+    变更时只标记被修改的节点（脏节点），flush 时沿父链合并去重，
+    每个观察者和控件在一次 flush 中至多被通知一次。
+    """
+
+    MODES = (NOTIFY_SYNC, NOTIFY_MANUAL, NOTIFY_ASYNCIO)
+
+    def __init__(self, mode: str = NOTIFY_SYNC, loop=None):
+        """
+        Args:
+            mode: 调度模式，sync / manual / asyncio
+            loop: asyncio 模式使用的事件循环，默认使用当前运行中的循环；
+                没有运行中的循环时退化为立即 flush
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"未知的通知模式 {mode!r}，可选: {', '.join(self.MODES)}")
+        self.mode = mode
+        self._loop = loop
+        self._dirty: dict["Reactivable", None] = {}
+        # 只有存在路径订阅时才记录变更位置
+        self._changes: dict[tuple, None] = {}
+        # 已失效且有观察者的派生值，flush 时重新计算
+        self._computeds: dict["Computed", None] = {}
+        self.path_subscriptions = 0
+        # 只有存在变更记录订阅时才记录变更
+        self._records: list[Change] = []
+        self.change_subscriptions = 0
+        self._flush_handle = None
+        # 异步观察者：每个观察者至多一个运行中的任务和一个待运行的协程
+        self._running: dict = {}
+        self._waiting: dict = {}
+        # 因消费者落后而被合并丢弃的通知数
+        self.dropped = 0
+
+    def schedule(self, command: Command) -> None:
+        """标记命令修改的节点，并按调度模式安排 flush"""
+        self.mark(command)
+        self.request_flush()
+
+    def mark(self, command: Command) -> None:
+        """只标记脏节点，不触发 flush"""
+        for target in command.targets():
+            self._dirty[target] = None
+        if self.path_subscriptions:
+            for change in command.changes():
+                self._changes[change] = None
+
+    def record(self, records: list[Change]) -> None:
+        """登记已经产生的变更记录，flush 时投递给变更记录观察者"""
+        self._records.extend(records)
+
+    def request_flush(self) -> None:
+        """按调度模式安排一次 flush"""
+        if self.mode == NOTIFY_SYNC:
+            self.flush()
+        elif self.mode == NOTIFY_ASYNCIO and self._flush_handle is None:
+            loop = self._loop
+            if loop is None:
+                try:
+                    loop = asyncio.get_running_loop()
+                except RuntimeError:
+                    self.flush()
+                    return
+            self._flush_handle = loop.call_soon(self.flush)
+
+    def mark_computed(self, computed: "Computed") -> None:
+        """标记失效的派生值，flush 时重新计算并通知其观察者"""
+        self._computeds[computed] = None
+
+    @property
+    def pending(self) -> int:
+        """等待 flush 的脏节点数量"""
+        return len(self._dirty)
+
+    def call(self, callback, arg, merge: bool = False, kind: str = "observer") -> None:
+        """调用观察者；返回协程（async 观察者）时在事件循环上作为任务运行
+
+        背压：同一个观察者的任务仍在运行时，新的通知只保留最新的一个，
+        任务结束后再运行它，中间过时的通知被丢弃。
+        merge=True 时 arg 为变更记录列表：积压的记录不丢弃，而是合并后一次投递。
+        kind 为指标中回调的类别（observer / controller）。
+        """
+        if merge and callback in self._running:
+            pending = self._waiting.get(callback)
+            if pending is None:
+                self._waiting[callback] = list(arg)
+            else:
+                pending.extend(arg)
+            return
+        if _metrics is None:
+            result = callback(arg)
+        else:
+            started = time.perf_counter()
+            result = callback(arg)
+            _metrics.callback(kind, callback, time.perf_counter() - started)
+        if result is None or not inspect.isawaitable(result):
+            return
+        if callback in self._running:
+            stale = self._waiting.get(callback)
+            if stale is not None:
+                stale.close()
+                self.dropped += 1
+            self._waiting[callback] = result
+            return
+        self._start(callback, result)
+
+    def _start(self, callback, coroutine) -> None:
+        loop = self._loop
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                coroutine.close()
+                raise RuntimeError("异步观察者需要运行中的事件循环") from None
+        task = loop.create_task(coroutine)
+        self._running[callback] = task
+        started = time.perf_counter() if _metrics is not None else None
+        task.add_done_callback(lambda task: self._finished(callback, task, started))
+
+    def _finished(self, callback, task: asyncio.Task, started=None) -> None:
+        del self._running[callback]
+        if started is not None and _metrics is not None:
+            # 异步观察者从开始运行到完成的耗时
+            _metrics.callback("async", callback, time.perf_counter() - started)
+        if not task.cancelled() and task.exception() is not None:
+            task.get_loop().call_exception_handler(
+                {
+                    "message": f"异步观察者 {callback!r} 抛出异常",
+                    "exception": task.exception(),
+                    "task": task,
+                }
+            )
+        if callback in self._waiting:
+            pending = self._waiting.pop(callback)
+            if isinstance(pending, list):
+                # 合并后的变更记录，现在才调用观察者
+                pending = callback(pending)
+                if not inspect.isawaitable(pending):
+                    return
+            self._start(callback, pending)
+
+    async def wait(self) -> None:
+        """等待所有异步观察者（包括合并后待运行的）完成"""
+        while self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+
+    def flush(self) -> "FlushResult":
+        """通知所有脏节点及其祖先，返回被通知的节点数
+
+        返回值可以直接当作 int 使用；await 它会等待本次触发的异步观察者完成。
+        """
+        self._flush_handle = None
+        dirty, self._dirty = self._dirty, {}
+        changes, self._changes = self._changes, {}
+        computeds, self._computeds = self._computeds, {}
+        records, self._records = self._records, []
+
+        # 沿父链收集需要通知的节点：遇到已收集的节点（其祖先已处理）
+        # 或绑定了控件的节点（冒泡在控件处终止）即停止
+        chain: dict["Reactivable", None] = {}
+        for node in dirty:
+            while node is not None and node not in chain:
+                chain[node] = None
+                if node._controller is not None:
+                    break
+                node = node._parent
+
+        grouped = self._group_records(records, chain) if records else None
+        if _metrics is not None:
+            _metrics.flush(dirty, chain)
+        for node in chain:
+            node._fire(grouped.get(node, ()) if grouped else ())
+        if changes:
+            self._dispatch_paths(changes)
+        # 所有失效都已完成后再按需重新计算，观察者看到的是一致的状态（无毛刺）
+        for computed in computeds:
+            computed._refresh()
+        return FlushResult(len(chain), self)
+
+    @staticmethod
+    def _group_records(records: list[Change], chain: dict) -> dict:
+        """把变更记录分给被修改的容器及其祖先（路径改为相对该节点）
+
+        只为有变更记录观察者的节点收集，冒泡同样在绑定了控件的节点处终止
+        """
+        grouped: dict["Reactivable", list[Change]] = {}
+        for change in records:
+            path = change.path
+            node = change.target
+            depth = len(path)
+            while node is not None and node in chain:
+                if DELIVER_CHANGES in node._observers.values():
+                    grouped.setdefault(node, []).append(
+                        change._replace(path=path[depth:]) if depth else change
+                    )
+                if node._controller is not None:
+                    break
+                node = node._parent
+                depth -= 1
+        return grouped
+
+    @staticmethod
+    def _dispatch_paths(changes: dict) -> None:
+        """沿父链查找路径订阅索引，只通知与变更路径匹配的回调"""
+        for node, key in changes:
+            value = node if key is None else _value_at(node, key)
+            relative = [] if key is None else [key]
+            owner = node
+            while True:
+                index = owner._path_index
+                if index is not None:
+                    path = tuple(reversed(relative))
+                    dotted = ".".join(str(segment) for segment in path)
+                    for callback in index.match(path):
+                        callback(dotted, value)
+                if owner._parent is None:
+                    break
+                relative.append(owner._key_in_parent())
+                owner = owner._parent
+
+
+class FlushResult(int):
+    """flush 的返回值：被通知的节点数，同时可以 await 以等待异步观察者完成"""
+
+    def __new__(cls, count: int, scheduler: NotifyScheduler):
+        result = super().__new__(cls, count)
+        result._scheduler = scheduler
+        return result
+
+    def __await__(self):
+        return self._wait().__await__()
+
+    async def _wait(self) -> int:
+        await self._scheduler.wait()
+        return int(self)
+
+
+def _value_at(node: "Reactivable", key):
+    """读取 node 中 key 处的当前值，不存在（已删除）时返回 None"""
+    try:
+        return node._value[key]
+    except (KeyError, IndexError):
+        return None
+
+
+def _command_records(command: Command, inverse: bool) -> list[Change]:
+    """变更记录的捕获函数，供变更记录观察者使用
+
+    记录中的响应式对象替换为此刻的快照：同一次 flush 中后面的修改不会改变前面的
+    记录，按顺序重放到副本上得到与实时树相同的结果。
+    """
+    records = command.records(inverse)
+    for index, record in enumerate(records):
+        if record.op == CHANGE_SPLICE:
+            old, new = _freeze_items(record.old), _freeze_items(record.new)
         else:
-            self.undo_stack.append(command)
+            old, new = _freeze_value(record.old), _freeze_value(record.new)
+        if old is not record.old or new is not record.new:
+            records[index] = record._replace(old=old, new=new)
+    return records
+
+
+def _freeze_value(value):
+    return value._freeze() if isinstance(value, Reactivable) else value
+
+
+def _freeze_items(items):
+    if isinstance(items, array) or not any(map(isinstance, items, repeat(Reactivable))):
+        return items
+    return tuple(map(_freeze_value, items))
+
+
+class _Transaction:
+    """某个上下文中某个命令管理器上正在进行的事务"""
+
+    __slots__ = ("depth", "commands", "captured")
+
+    def __init__(self):
+        self.depth = 0
+        self.commands: list[Command] = []
+        # 事务期间逐条捕获的变更记录和补丁等，提交时再交给调度器和监听器
+        self.captured: dict = {}
+
+
+# 事务状态按上下文（线程 / asyncio 任务）隔离：命令管理器 -> 进行中的事务。
+# 字典只替换不原地修改，避免复制出的上下文之间互相影响
+_transactions: ContextVar[dict | None] = ContextVar(
+    "reactive_transactions", default=None
+)
+
+
+class CommandManager:
+    """命令管理器
+
+    每棵响应式数据树（文档）默认拥有独立的 CommandManager，
+    多个文档之间的历史互不影响；也可以显式传入同一实例让多棵树共享历史。
+
+    undo_stack / redo_stack 使用带 maxlen 的 deque 实现环形缓冲，
+    超出深度时自动丢弃最旧的命令，裁剪开销为 O(1)。
+
+    设置 max_bytes 后还按字节预算淘汰：每条命令进入历史时用 sizer 估算一次大小，
+    历史总大小超出预算时从最旧的命令开始丢弃（最新的一条总是保留）。
+    创建后再修改 max_bytes 会重新估算已有的历史，并立即按新预算淘汰。
+
+    事务按上下文隔离：每个线程（或 asyncio 任务）有自己的事务，互不干扰。
+    thread_safe=True 时写入历史的操作（执行、撤销、重做、提交）持有一把可重入锁，
+    读取数据不加锁；同一个键的并发写入仍需调用方自行协调。
+    """
+
+    def __init__(
+        self,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+        scheduler: NotifyScheduler | None = None,
+        coalesce: CoalescePolicy | None = None,
+        thread_safe: bool = False,
+        max_bytes: int | None = None,
+        sizer=None,
+    ):
+        """
+        Args:
+            max_depth: 最大历史深度，必须大于 0
+            scheduler: 通知调度器，默认为同步模式
+            coalesce: 命令合并策略，默认不合并
+            thread_safe: 是否允许多个线程同时修改
+            max_bytes: 历史的字节预算，None 表示只按深度淘汰
+            sizer: 估算命令大小的函数 sizer(command) -> int，默认为 estimate_size
+        """
+        if max_depth <= 0:
+            raise ValueError(f"max_depth 必须大于 0，实际为 {max_depth}")
+        self.max_depth = max_depth
+        self.scheduler = scheduler if scheduler is not None else NotifyScheduler()
+        self.coalesce = coalesce
+        # 历史监听器：listener(action, command)，action 为 execute / undo / redo
+        self._listeners: list = []
+        # 监听器的 capture 函数（去重），每条子命令执行后立即调用
+        self._captures: tuple = ()
+        # 最近一次由 execute 压入的命令及时间，只有它可以被后续命令合并
+        self._last_pushed: Command | None = None
+        self._last_pushed_at = 0.0
+        self.undo_stack: deque[Command] = deque(maxlen=max_depth)
+        self.redo_stack: deque[Command] = deque(maxlen=max_depth)
+        self.thread_safe = thread_safe
+        self._lock = threading.RLock() if thread_safe else nullcontext()
+        self.sizer = sizer if sizer is not None else estimate_size
+        # 被淘汰（按深度或字节预算）的命令数
+        self.eviction_count = 0
+        # 设置了字节预算时，记录历史中每条命令的估算大小
+        self._sizes: dict[Command, int] = {}
+        self._history_bytes = 0
+        # 已从 undo_stack 底部淘汰的命令数，position = _base + len(undo_stack)
+        self._base = 0
+        self._max_bytes: int | None = None
+        self.max_bytes = max_bytes
+        # 命名检查点：名称 -> 历史位置
+        self.checkpoints: dict[str, int] = {}
+
+    def set_max_depth(self, max_depth: int) -> None:
+        """调整历史深度，超出部分从最旧的命令开始丢弃
+
+        Args:
+            max_depth: 新的最大历史深度，必须大于 0
+        """
+        if max_depth <= 0:
+            raise ValueError(f"max_depth 必须大于 0，实际为 {max_depth}")
+        with self._lock:
+            self.max_depth = max_depth
+            for stack in (self.undo_stack, self.redo_stack):
+                # 最旧的命令在左端，新 deque 只保留右端的 max_depth 条
+                for index in range(len(stack) - max_depth):
+                    self._evicted(stack[index])
+            self._base += max(0, len(self.undo_stack) - max_depth)
+            self.undo_stack = deque(self.undo_stack, maxlen=max_depth)
+            self.redo_stack = deque(self.redo_stack, maxlen=max_depth)
+
+    @property
+    def max_bytes(self) -> int | None:
+        """历史的字节预算，None 表示只按深度淘汰"""
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes: int | None) -> None:
+        # 之前没有逐条记录大小（或预算变了），重新估算当前历史，超出新预算时立即淘汰
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError(f"max_bytes 必须大于 0，实际为 {max_bytes}")
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._sizes.clear()
+            self._history_bytes = 0
+            if max_bytes is None:
+                return
+            sizer = self.sizer
+            for command in (*self.undo_stack, *self.redo_stack):
+                size = self._sizes[command] = sizer(command)
+                self._history_bytes += size
+            self._evict_over_budget()
+
+    @property
+    def history_bytes(self) -> int:
+        """历史中所有命令的估算总字节数"""
+        if self._max_bytes is not None:
+            return self._history_bytes
+        # 没有字节预算时不逐条记录，按需计算
+        sizer = self.sizer
+        return sum(sizer(command) for command in (*self.undo_stack, *self.redo_stack))
+
+    def _push(self, stack: deque, command: Command) -> None:
+        """压栈；栈满时 deque 会丢弃最旧的命令，先记录这次淘汰"""
+        if len(stack) == stack.maxlen:
+            self._evicted(stack[0])
+            if stack is self.undo_stack:
+                self._base += 1
+        stack.append(command)
+
+    def _evicted(self, command: Command) -> None:
+        self.eviction_count += 1
+        self._forget(command)
+
+    def _forget(self, command: Command) -> None:
+        """命令离开历史，扣除它的大小"""
+        if self._sizes:
+            self._history_bytes -= self._sizes.pop(command, 0)
+
+    def _measure(self, command: Command) -> None:
+        """命令进入历史时估算大小，并按字节预算淘汰最旧的命令"""
+        size = self.sizer(command)
+        self._history_bytes += size - self._sizes.get(command, 0)
+        self._sizes[command] = size
+        self._evict_over_budget()
+
+    def _evict_over_budget(self) -> None:
+        # 先淘汰最旧的撤销历史，再淘汰最远的重做历史；最新的一条撤销历史总是保留
+        while self._history_bytes > self._max_bytes:
+            if len(self.undo_stack) > 1:
+                self._evicted(self.undo_stack.popleft())
+                self._base += 1
+            elif self.redo_stack:
+                self._evicted(self.redo_stack.popleft())
+            else:
+                break
+
+    def _clear_redo(self) -> None:
+        if self._sizes:
+            for command in self.redo_stack:
+                self._forget(command)
+        self.redo_stack.clear()
+
+    def _current_transaction(self) -> _Transaction | None:
+        """当前上下文中本管理器上进行中的事务"""
+        active = _transactions.get()
+        if active is None:
+            return None
+        return active.get(self)
+
+    @property
+    def in_transaction(self) -> bool:
+        """当前上下文是否处于事务中"""
+        return self._current_transaction() is not None
+
+    def execute(self, command: Command) -> None:
+        """执行命令，并添加到 undo_stack"""
+        # 如果在事务中，记录命令，提交时再进入历史
+        if _metrics is not None:
+            _metrics.command("execute", command, self)
+        transaction = self._current_transaction()
+        if transaction is not None:
+            with self._lock:
+                self._apply("execute", command, transaction.captured)
+                _invalidate_caches(command)
+            transaction.commands.append(command)
+            return
+
+        with self._lock:
+            captured = self._apply("execute", command)
+            _invalidate_caches(command)
+            if not self._merge(command):
+                # deque 达到 maxlen 时自动丢弃最旧的命令
+                self._push(self.undo_stack, command)
+                self._last_pushed = command
             # 清空 redo_stack
-            self.redo_stack.clear()
-            # 深度限制200
-            if len(self.undo_stack) > 200:
-                self.undo_stack.pop(0)
+            self._clear_redo()
+            if self._max_bytes is not None:
+                # 合并时新值变了，重新估算被合并的上一条命令
+                self._measure(self._last_pushed)
+            self._emit("execute", command, captured)
+            self.scheduler.schedule(command)
+
+    def _apply(
+        self, action: str, command: Command, captured: dict | None = None
+    ) -> dict | None:
+        """执行、撤销或重做命令（action 为方法名），返回各捕获函数的结果
+
+        变更记录和监听器的 capture 在每条命令刚结束时调用，路径按那一刻的树计算；
+        复合命令逐条处理子命令，后面的子命令移动了节点也不会影响前面子命令的结果。
+
+        Returns:
+            捕获函数 -> 按顺序拼接的结果；没有需要捕获的内容时返回传入的 captured
+        """
+        captures = self._captures
+        if self.scheduler.change_subscriptions:
+            captures = (_command_records, *captures)
+        if not captures:
+            getattr(command, action)()
+            return captured
+        if captured is None:
+            captured = {}
+        self._capture(action, command, captures, captured)
+        return captured
+
+    def _capture(
+        self, action: str, command: Command, captures: tuple, captured: dict
+    ) -> None:
+        if isinstance(command, CompositeCommand):
+            children = command.commands
+            for child in reversed(children) if action == "undo" else children:
+                # 与 CompositeCommand 一致：撤销和重做跳过目标已被回收的子命令
+                if action == "execute" or child.alive:
+                    self._capture(action, child, captures, captured)
+            return
+        getattr(command, action)()
+        inverse = action == "undo"
+        for capture in captures:
+            captured.setdefault(capture, []).extend(capture(command, inverse))
+
+    def add_listener(self, listener) -> None:
+        """注册历史监听器，命令进入历史、被撤销或重做时同步调用
 
-    def undo(self) -> None:
-        """撤销命令"""
-        if self.undo_stack:
-            command: Command = self.undo_stack.pop()
-            command.undo()
-            self.redo_stack.append(command)
+        Args:
+            listener: 回调 listener(action, command)，action 为 "execute" / "undo" / "redo"；
+                事务内的命令在提交时以一个 CompositeCommand 的形式通知。
+                listener 带有 capture 属性时，每条（子）命令执行、撤销或重做后立即调用
+                capture(command, inverse) -> list，结果按顺序拼接后作为第三个参数传入：
+                listener(action, command, captured)
+        """
+        self._listeners.append(listener)
+        self._update_captures()
+
+    def remove_listener(self, listener) -> None:
+        """移除历史监听器"""
+        self._listeners.remove(listener)
+        self._update_captures()
+
+    def _update_captures(self) -> None:
+        captures = (getattr(listener, "capture", None) for listener in self._listeners)
+        self._captures = tuple(dict.fromkeys(c for c in captures if c is not None))
+
+    def _emit(self, action: str, command: Command, captured: dict | None) -> None:
+        captured = captured or {}
+        records = captured.get(_command_records)
+        if records:
+            self.scheduler.record(records)
+        for listener in self._listeners:
+            capture = getattr(listener, "capture", None)
+            if capture is None:
+                listener(action, command)
+                continue
+            result = captured.get(capture)
+            if result is None:
+                # 命令执行时监听器尚未注册，只能按当前的树计算
+                result = capture(command, action == "undo")
+            listener(action, command, result)
+
+    def _merge(self, command: Command) -> bool:
+        """按合并策略尝试把命令并入上一条历史，成功返回 True"""
+        if self.coalesce is None:
+            return False
+        now = self.coalesce.clock()
+        elapsed = now - self._last_pushed_at
+        self._last_pushed_at = now
+        previous = self._last_pushed
+        if (
+            previous is None
+            or not self.undo_stack
+            or self.undo_stack[-1] is not previous
+            or not self.coalesce.should_merge(previous, command, elapsed)
+        ):
+            return False
+        # 保留最早的旧值，只更新新值
+        previous.new_value = command.new_value
+        return True
 
-        # 深度限制200
-        if len(self.redo_stack) > 200:
-            self.redo_stack.pop(0)
+    def undo(self) -> None:
+        """撤销命令（目标已被回收的历史被直接丢弃，继续撤销下一条）"""
+        with self._lock:
+            command = self._undo_step()
+            if command is not None:
+                self.scheduler.schedule(command)
 
     def redo(self) -> None:
-        """重做命令"""
-        if self.redo_stack:
-            command: Command = self.redo_stack.pop()
-            command.redo()
-            self.undo_stack.append(command)
+        """重做命令（目标已被回收的历史被直接丢弃，继续重做下一条）"""
+        with self._lock:
+            command = self._redo_step()
+            if command is not None:
+                self.scheduler.schedule(command)
+
+    def _undo_step(self) -> Command | None:
+        """撤销一条命令，不调度通知"""
+        self._last_pushed = None
+        command = self._pop_alive(self.undo_stack)
+        if command is not None:
+            if _metrics is not None:
+                _metrics.command("undo", command, self)
+            captured = self._apply("undo", command)
+            _invalidate_caches(command)
+            self._push(self.redo_stack, command)
+            self._emit("undo", command, captured)
+        return command
+
+    def _redo_step(self) -> Command | None:
+        """重做一条命令，不调度通知"""
+        self._last_pushed = None
+        command = self._pop_alive(self.redo_stack)
+        if command is not None:
+            if _metrics is not None:
+                _metrics.command("redo", command, self)
+            captured = self._apply("redo", command)
+            _invalidate_caches(command)
+            self._push(self.undo_stack, command)
+            self._emit("redo", command, captured)
+        return command
+
+    @property
+    def position(self) -> int:
+        """当前历史位置：从创建（或清空历史）以来生效的命令数，撤销时减小、重做时增大"""
+        return self._base + len(self.undo_stack)
+
+    def checkpoint(self, name: str) -> int:
+        """把当前历史位置记为命名检查点，返回该位置"""
+        with self._lock:
+            # 检查点之后的修改不能再合并进检查点之前的命令
+            self._last_pushed = None
+            position = self.checkpoints[name] = self.position
+            return position
+
+    def _resolve_position(self, position: int | str) -> int:
+        if isinstance(position, str):
+            try:
+                return self.checkpoints[position]
+            except KeyError:
+                raise KeyError(f"未知的检查点 {position!r}") from None
+        return position
+
+    def undo_to(self, position: int | str) -> int:
+        """连续撤销到指定历史位置（或检查点），所有变更合并为一次通知
 
-        # 深度限制200
-        if len(self.undo_stack) > 200:
-            self.undo_stack.pop(0)
+        Args:
+            position: 目标位置或检查点名称，必须在 [最早可撤销的位置, 当前位置] 之间
+
+        Returns:
+            实际撤销的命令数
+        """
+        with self._lock:
+            target = self._resolve_position(position)
+            if not self._base <= target <= self.position:
+                raise ValueError(
+                    f"无法撤销到位置 {target}，可撤销范围为 {self._base}~{self.position}"
+                )
+            steps = 0
+            while self.position > target:
+                # 失效的命令也占一个位置，逐条处理以免越过目标
+                if not self.undo_stack[-1].alive:
+                    self._discard(self.undo_stack)
+                    continue
+                command = self._undo_step()
+                self.scheduler.mark(command)
+                steps += 1
+            if steps:
+                self.scheduler.request_flush()
+            return steps
+
+    def redo_to(self, position: int | str) -> int:
+        """连续重做到指定历史位置（或检查点），所有变更合并为一次通知
+
+        Args:
+            position: 目标位置或检查点名称，必须在 [当前位置, 最远可重做的位置] 之间
+
+        Returns:
+            实际重做的命令数
+        """
+        with self._lock:
+            target = self._resolve_position(position)
+            farthest = self.position + len(self.redo_stack)
+            if not self.position <= target <= farthest:
+                raise ValueError(
+                    f"无法重做到位置 {target}，可重做范围为 {self.position}~{farthest}"
+                )
+            steps = 0
+            while self.position < target:
+                if not self.redo_stack[-1].alive:
+                    # 丢弃的位置在目标之前，目标随之前移
+                    self._discard(self.redo_stack)
+                    target -= 1
+                    continue
+                command = self._redo_step()
+                self.scheduler.mark(command)
+                steps += 1
+            if steps:
+                self.scheduler.request_flush()
+            return steps
 
     def begin_transaction(self):
-        """开始事务"""
-        self._transaction_commands = []
+        """开始事务（可嵌套，只有最外层事务提交时才记录历史）"""
+        active = _transactions.get()
+        transaction = None if active is None else active.get(self)
+        if transaction is None:
+            transaction = _Transaction()
+            _transactions.set({**(active or {}), self: transaction})
+        transaction.depth += 1
 
     def commit(self) -> None:
-        """提交事务"""
-        if self._transaction_commands:
-            # 将事务期间的多个命令合并为一个 CompositeCommand
-            composite: Command = CompositeCommand(self._transaction_commands)
-            self.undo_stack.append(composite)
-            # 清空 redo_stack
-            self.redo_stack.clear()
-            # 深度限制200
-            if len(self.undo_stack) > 200:
-                self.undo_stack.pop(0)
-            # 清空事务命令列表
-            self._transaction_commands = None
+        """提交事务，最外层提交时统一调度一次通知"""
+        active = _transactions.get()
+        transaction = None if active is None else active.get(self)
+        if transaction is None:
+            return
+        transaction.depth -= 1
+        if transaction.depth > 0:
+            return
+
+        # 结束本上下文中的事务
+        remaining = {m: t for m, t in active.items() if m is not self}
+        _transactions.set(remaining or None)
+        commands = transaction.commands
+        if _metrics is not None:
+            _metrics.transaction_size.observe(len(commands))
+        if commands:
+            with self._lock:
+                self._last_pushed = None
+                # 将事务期间的多个命令合并为一个 CompositeCommand
+                composite: Command = CompositeCommand(commands)
+                self._push(self.undo_stack, composite)
+                # 清空 redo_stack
+                self._clear_redo()
+                if self._max_bytes is not None:
+                    self._measure(composite)
+                self._emit("execute", composite, transaction.captured)
+                self.scheduler.schedule(composite)
 
     def transaction(self):
         """返回事务上下文管理器"""
@@ -275,53 +1617,292 @@ class CommandManager:
 
     def clear_history(self) -> None:
         """清空 undo_stack 和 redo_stack"""
-        self.undo_stack.clear()
-        self.redo_stack.clear()
+        with self._lock:
+            self._last_pushed = None
+            # 位置保持连续，已记录的检查点都无法再到达
+            self._base += len(self.undo_stack)
+            self.undo_stack.clear()
+            self.redo_stack.clear()
+            self._sizes.clear()
+            self._history_bytes = 0
+
+    def _pop_alive(self, stack: deque) -> Command | None:
+        """从栈顶弹出第一条仍然有效的命令，沿途丢弃失效的命令"""
+        while stack:
+            if stack[-1].alive:
+                return stack.pop()
+            self._discard(stack)
+        return None
+
+    def _discard(self, stack: deque) -> None:
+        """丢弃栈顶失效的命令，它占据的历史位置随之消失"""
+        # undo_stack 栈顶就是当前位置，redo_stack 栈顶是下一个位置
+        position = self.position + (stack is self.redo_stack)
+        self._forget(stack.pop())
+        self._shift_checkpoints([position])
+
+    def _shift_checkpoints(self, removed: list[int]) -> None:
+        """移除若干历史位置后，让之后的检查点前移，仍指向原来的命令"""
+        removed.sort()
+        for name, position in self.checkpoints.items():
+            self.checkpoints[name] = position - bisect_right(removed, position)
+
+    def prune(self) -> int:
+        """移除目标已被回收的历史，返回移除的条数
+
+        每条被移除的命令让之后的历史位置（包括当前位置和检查点）前移一位。
+        """
+        with self._lock:
+            current = self.position
+            removed = []
+            undo_alive = []
+            for position, command in enumerate(self.undo_stack, self._base + 1):
+                if command.alive:
+                    undo_alive.append(command)
+                else:
+                    removed.append(position)
+                    self._forget(command)
+            redo_alive = []
+            # redo_stack 的栈顶（右端）是紧接当前位置的下一步
+            for position, command in enumerate(reversed(self.redo_stack), current + 1):
+                if command.alive:
+                    redo_alive.append(command)
+                else:
+                    removed.append(position)
+                    self._forget(command)
+            redo_alive.reverse()
+            self.undo_stack = deque(undo_alive, maxlen=self.undo_stack.maxlen)
+            self.redo_stack = deque(redo_alive, maxlen=self.redo_stack.maxlen)
+            if removed:
+                self._last_pushed = None
+                self._shift_checkpoints(removed)
+            return len(removed)
+
+    def memory_usage(self) -> int:
+        """估算历史记录占用的字节数（栈结构 + 命令对象本身，不含命令引用的数据）"""
+        total = sys.getsizeof(self.undo_stack) + sys.getsizeof(self.redo_stack)
+        for stack in (self.undo_stack, self.redo_stack):
+            for command in stack:
+                total += _command_overhead(command)
+        return total
+
+
+def _invalidate_caches(command: Command) -> None:
+    """命令修改数据后，使受影响的快照和派生值失效"""
+    targets = tuple(command.targets())
+    for node in targets:
+        # 快照和序列化缓存沿父链失效；整体编码时只有子树的根有缓存，
+        # 未缓存的节点之上仍可能有缓存，所以一直走到根。
+        # 编码过的节点留下空字典，表示编码后被修改过，下次按成员编码并缓存子节点
+        while node is not None:
+            node._frozen = None
+            if node._encoded:
+                node._encoded = {}
+            node = node._parent
+    if any(target._dependents for target in targets):
+        _invalidate_dependents(command)
+
+
+def _invalidate_dependents(command: Command) -> None:
+    """使依赖于被修改位置的派生值失效（推送失效，读取时再计算）"""
+    for target, key in command.changes():
+        dependents = target._dependents
+        if not dependents:
+            continue
+        if key is None or isinstance(target._value, list):
+            # 整个容器变化（或列表索引整体移动）：所有依赖都失效
+            affected = [c for computeds in dependents.values() for c in computeds]
+        else:
+            affected = [*dependents.get(key, ()), *dependents.get(None, ())]
+        for computed in affected:
+            computed._invalidate()
+
+
+# 估算容器大小时每层采样的元素数，以及递归采样的最大深度
+_SIZE_SAMPLE = 8
+_SIZE_DEPTH = 4
+# 不需要递归估算的值类型
+_SCALAR_TYPES = frozenset({int, float, str, bytes, bool, type(None)})
+# 命令类型 -> 保存数据的字段名（None 表示使用实例 __dict__）
+_PAYLOAD_FIELDS: dict[type, tuple[str, ...] | None] = {}
+
+
+def estimate_size(command: Command) -> int:
+    """估算命令占用的字节数：命令对象本身 + 它引用的新旧数据
+
+    大容器只采样前几个元素并按元素数外推，估算开销与数据规模无关；
+    多条命令共享的数据会被重复计入，估算偏大。
+    """
+    cls = type(command)
+    if cls not in _PAYLOAD_FIELDS:
+        if hasattr(command, "__dict__"):
+            _PAYLOAD_FIELDS[cls] = None
+        else:
+            _PAYLOAD_FIELDS[cls] = tuple(
+                name
+                for klass in cls.__mro__
+                for name in getattr(klass, "__slots__", ())
+                if name not in ("_target", "__weakref__")
+            )
+    if isinstance(command, CompositeCommand):
+        return (
+            sys.getsizeof(command)
+            + sys.getsizeof(command.commands)
+            + sum(estimate_size(child) for child in command.commands)
+        )
+    fields = _PAYLOAD_FIELDS[cls]
+    if fields is None:
+        values = vars(command).values()
+        size = sys.getsizeof(command) + sys.getsizeof(vars(command))
+    else:
+        values = [getattr(command, name) for name in fields]
+        size = sys.getsizeof(command)
+    for value in values:
+        if type(value) in _SCALAR_TYPES:
+            size += sys.getsizeof(value)
+        else:
+            size += _approximate_size(value)
+    return size
+
+
+def _approximate_size(value, depth: int = 0) -> int:
+    """估算值占用的字节数，容器按采样元素的平均大小外推"""
+    size = 0
+    if isinstance(value, Reactivable):
+        size = sys.getsizeof(value)
+        value = value._value
+    size += sys.getsizeof(value)
+    if isinstance(value, dict):
+        items = value.values()
+        # 键通常是短字符串，按一个典型值估算
+        key_size = 56
+    elif isinstance(value, (list, tuple)):
+        items = value
+        key_size = 0
+    else:
+        return size
+    count = len(items)
+    if not count or depth >= _SIZE_DEPTH:
+        return size
+    sample = 0
+    sampled = 0
+    for item in items:
+        if type(item) in _SCALAR_TYPES:
+            sample += sys.getsizeof(item)
+        else:
+            sample += _approximate_size(item, depth + 1)
+        sampled += 1
+        if sampled == _SIZE_SAMPLE:
+            break
+    return size + (sample // sampled + key_size) * count
+
+
+def _command_overhead(command: Command) -> int:
+    """计算单个命令对象的结构开销（字节）"""
+    size = sys.getsizeof(command)
+    if hasattr(command, "__dict__"):
+        size += sys.getsizeof(command.__dict__)
+    if isinstance(command, CompositeCommand):
+        size += sys.getsizeof(command.commands)
+        for child in command.commands:
+            size += _command_overhead(child)
+    return size
+
+
+def _find_near(items: list, item, start: int) -> int | None:
+    """从 start 附近向两侧按身份查找 item 的位置，找不到时返回 None"""
+    size = len(items)
+    start = min(max(start, 0), size)
+    for offset in range(max(start, size - start) + 1):
+        after = start + offset
+        if after < size and items[after] is item:
+            return after
+        before = start - offset - 1
+        if before >= 0 and items[before] is item:
+            return before
+    return None
 
 
 class Reactivable:
-    __exclude_attr = {
+    """响应式数据基类
+
+    内部状态全部存放在 __slots__ 中：内部属性和方法走常规（C 实现的）属性查找，
+    只有查找失败时才进入 __getattr__，从 _value 中读取数据键。某个名称第一次作为
+    数据键读到后，类上会安装同名的 _DataKey 描述符，之后按属性读取该键不再经过
+    失败的查找和 AttributeError。
+    子对象只弱引用父对象，被整体替换或删除的子树不会让原来的树继续存活。
+    """
+
+    __slots__ = (
         "_value",
-        "_parent",
+        "_parent_ref",
         "_key",
         "_controller",
         "_observers",
         "_command_manager",
-        "_batching",
-        "_batch_record",
-        "_wrap_reactive",
-        "_execute_command",
-        "notify",
-        "subscribe",
-        "bind_controller",
-        "undo",
-        "redo",
-        "switch",
-        "batch_update",
-        # ReactivableList 方法
-        "append",
-        "insert",
-        "pop",
-        # ReactivableDict 方法
-        "keys",
-        "values",
-        "items",
-        "get",
-    }
-
-    _command_manager = CommandManager()
-
-    def __init__(self, value, parent=None, key=None):
-        self._value = self._wrap_reactive(value)
+        "_lazy",
+        "_path_index",
+        "_dependents",
+        "_computed",
+        "_frozen",
+        "_encoded",
+        "__weakref__",
+    )
+
+    _command_manager: CommandManager
+
+    def __init__(self, value, parent=None, key=None, command_manager=None, lazy=False):
+        """
+        Args:
+            value: 被封装的普通数据（dict / list）
+            parent: 父对象，根对象为 None
+            key: 在父对象中的键或索引
+            command_manager: 根对象使用的命令管理器，默认新建一个；
+                子对象总是沿用父对象的命令管理器
+            lazy: 惰性封装，嵌套的 dict / list 在首次访问时才封装；
+                子对象总是沿用父对象的设置
+        """
         self._parent = parent
         self._key = key
+        # 整棵树共享根对象的命令管理器，通过直接引用访问
+        if parent is not None:
+            command_manager = parent._command_manager
+            lazy = parent._lazy
+        elif command_manager is None:
+            command_manager = CommandManager()
+        self._command_manager = command_manager
+        self._lazy = lazy
         self._controller = None
-        self._observers = set()
+        # 观察者 -> 投递方式（DELIVER_VALUE / DELIVER_CHANGES）
+        self._observers = {}
+        self._path_index = None
+        # 派生值依赖索引：键 -> 读取过该键的 Computed（None 表示整个容器）
+        self._dependents = None
+        self._computed = None
+        # 缓存的不可变快照，数据变化时沿父链清除
+        self._frozen = None
+        # 缓存的序列化结果：格式 -> bytes，与快照一同失效；
+        # None 表示从未编码过，空字典表示编码后被修改过
+        self._encoded = None
+        self._value = self._wrap_reactive(value)
+
+    @property
+    def _parent(self):
+        """父对象，根对象或父对象已被回收时为 None"""
+        ref = self._parent_ref
+        return None if ref is None else ref()
+
+    @_parent.setter
+    def _parent(self, parent):
+        self._parent_ref = None if parent is None else weakref.ref(parent)
 
     def _wrap_reactive(self, value):
         """
-        将普通数据递归封装为响应式对象
+        将普通数据递归封装为响应式对象（惰性模式下保持原样，访问时再封装）
         """
+        if self._lazy:
+            return value
+
         iterable = None
         if isinstance(value, list):
             iterable = enumerate(value)
@@ -332,38 +1913,77 @@ class Reactivable:
             return value
 
         for k, v in iterable:
-            if isinstance(v, list):
-                value[k] = ReactivableList(v, parent=self, key=k)
-            if isinstance(v, dict):
-                value[k] = ReactivableDict(v, parent=self, key=k)
+            if isinstance(v, _CONTAINER_TYPES):
+                value[k] = self._wrap_child(k, v)
         return value
 
-    def __getattribute__(self, item):
-        if item in Reactivable.__exclude_attr:
-            return object.__getattribute__(self, item)
+    def _wrap_child(self, key, value):
+        """将赋给 key 的新值封装为子响应式对象（惰性模式下保持原样）"""
+        if self._lazy or isinstance(value, Reactivable):
+            return value
+        if isinstance(value, list):
+            return ReactivableList(value, parent=self, key=key)
+        if isinstance(value, dict):
+            return ReactivableDict(value, parent=self, key=key)
+        if isinstance(value, array):
+            return ReactivableArray(value, parent=self, key=key)
+        return value
+
+    def _lazy_child(self, key, value):
+        """惰性模式：首次访问时封装子容器，并把封装结果缓存回 _value"""
+        if isinstance(value, Reactivable):
+            return value
+        if isinstance(value, list):
+            wrapped = ReactivableList(value, parent=self, key=key)
+        elif isinstance(value, dict):
+            wrapped = ReactivableDict(value, parent=self, key=key)
+        elif isinstance(value, array):
+            wrapped = ReactivableArray(value, parent=self, key=key)
+        else:
+            return value
+        self._value[key] = wrapped
+        return wrapped
+
+    def __getattr__(self, item):
+        # 只有常规属性查找（slots、方法）失败时才会调用：先查数据键，再查底层容器的属性
+        if item in _INTERNAL_ATTRS:
+            # 内部属性尚未赋值（如初始化过程中），避免递归
+            raise AttributeError(item)
+        if _tracking_count:
+            _track(self, item)
         try:
-            return self._value[item]
+            value = self._value[item]
         except (KeyError, TypeError):
-            return object.__getattribute__(self._value, item)
+            computed = self._computed
+            if computed is not None and item in computed:
+                return computed[item].value
+            return getattr(self._value, item)
+        cls = type(self)
+        if getattr(cls, item, _MISSING) is _MISSING:
+            # 只为不与方法、内部属性重名的键安装描述符
+            setattr(cls, item, _DataKey(item))
+        if self._lazy:
+            return self._lazy_child(item, value)
+        return value
 
     def __setattr__(self, key, value):
-        if key not in Reactivable.__exclude_attr:
+        if key not in _INTERNAL_ATTRS:
             # 检查属性是否已存在于 _value 中
             if key in self._value:
                 # 属性已存在，获取旧值并更新
                 old_value = self._value[key]
                 if old_value != value:
                     # 包装新值（如果是字典或列表）
-                    wrapped_value = self._wrap_reactive(value)
+                    wrapped_value = self._wrap_child(key, value)
                     # 创建并执行命令
                     command = SetItemCommand(self, key, wrapped_value, old_value)
                     self._execute_command(command)
             else:
                 # 属性不存在（新增属性），设置值
                 # 包装新值（如果是字典或列表）
-                wrapped_value = self._wrap_reactive(value)
-                # 创建并执行命令（old_value 为 None）
-                command = SetItemCommand(self, key, wrapped_value, None)
+                wrapped_value = self._wrap_child(key, value)
+                # 创建并执行命令（撤销时删除该键）
+                command = SetItemCommand(self, key, wrapped_value, _MISSING)
                 self._execute_command(command)
         else:
             object.__setattr__(self, key, value)
@@ -371,27 +1991,76 @@ class Reactivable:
     def __str__(self):
         return str(self._value)
 
+    def _key_in_parent(self):
+        """当前对象在父对象中的键，列表中的位置按当前索引计算
+
+        列表插入、删除后不逐个更新兄弟节点的 _key：位置变了时从旧索引附近向两侧
+        按身份查找（通常只移动了几位），找到后写回 _key，之后直接命中。
+        """
+        key = self._key
+        siblings = self._parent._value
+        if not isinstance(siblings, list):
+            return key
+        if isinstance(key, int) and 0 <= key < len(siblings) and siblings[key] is self:
+            return key
+        index = _find_near(siblings, self, key if isinstance(key, int) else 0)
+        if index is None:
+            return key
+        self._key = index
+        return index
+
+    def _path(self) -> tuple:
+        """从根对象到当前对象的键路径"""
+        keys = []
+        node = self
+        while node._parent is not None:
+            keys.append(node._key_in_parent())
+            node = node._parent
+        keys.reverse()
+        return tuple(keys)
+
     def _execute_command(self, command):
-        """执行命令并提交到命令管理器"""
+        """执行命令并提交到命令管理器（通知由调度器负责）"""
         self._command_manager.execute(command)
-        # 如果不在事务中，发送通知
-        if self._command_manager._transaction_commands is None:
-            self.notify()
 
     def undo(self):
         """撤销操作：委托给 CommandManager"""
         self._command_manager.undo()
-        self.notify()
 
     def redo(self):
         """重做操作：委托给 CommandManager"""
         self._command_manager.redo()
-        self.notify()
 
-    def notify(self):
-        # 通知自己的观察者
-        for observer in self._observers:
-            observer(self._value)
+    def undo_to(self, position):
+        """撤销到指定历史位置或检查点：委托给 CommandManager"""
+        return self._command_manager.undo_to(position)
+
+    def redo_to(self, position):
+        """重做到指定历史位置或检查点：委托给 CommandManager"""
+        return self._command_manager.redo_to(position)
+
+    def flush(self) -> "FlushResult":
+        """立即投递所有待处理的通知，返回被通知的节点数
+
+        await root.flush() 会额外等待异步观察者和异步控件处理完毕
+        """
+        return self._command_manager.scheduler.flush()
+
+    def _fire(self, records=None):
+        """通知自己的观察者和控件（不冒泡）
+
+        Args:
+            records: 本次 flush 中与自己有关的变更记录；None 表示变更未知（如手动 notify），
+                变更记录观察者收到 None，应全量刷新
+        """
+        scheduler = self._command_manager.scheduler
+        for observer, delivery in self._observers.items():
+            if delivery == DELIVER_VALUE:
+                scheduler.call(observer, self._value)
+            elif records is None:
+                scheduler.call(observer, None)
+            elif records:
+                scheduler.call(observer, records, merge=True)
 
         # 如果绑定了控件，直接通知控件
         if self._controller is not None:
@@ -400,14 +2069,132 @@ class Reactivable:
                 raise TypeError(
                     f"控件 {type(self._controller).__name__} 必须实现 update(reactive_data) 方法"
                 )
-            self._controller.update(self)
-        else:
+            scheduler.call(self._controller.update, self, kind="controller")
+
+    def notify(self):
+        """立即通知自己，并向上冒泡直到绑定了控件的节点或根对象"""
+        node = self
+        while node is not None:
+            node._fire()
+            if node._controller is not None:
+                break
             # 没有绑定控件，通知父对象（变更冒泡）
-            if self._parent is not None:
-                self._parent.notify()
+            node = node._parent
+
+    def subscribe(self, callback_or_path, callback=None, delivery=DELIVER_VALUE):
+        """订阅变更
+
+        subscribe(callback)：任何变更（含子对象冒泡）时调用 callback(value)
+        subscribe(callback, delivery=DELIVER_CHANGES)：每次 flush 调用一次
+        callback(changes)，changes 为按发生顺序排列的 Change 列表，路径相对当前对象，
+        其中的容器是记录生成时的快照；渲染端可以按顺序重放，而不必比较整个容器
+        subscribe("address.city", callback)：只在匹配路径发生变更时调用
+        callback(path, value)，path 为相对当前对象的变更路径，value 为变更后的值；
+        路径中 "*" 匹配任意一段，"**" 匹配其下的任意路径
+        """
+        if callback is None:
+            if delivery not in (DELIVER_VALUE, DELIVER_CHANGES):
+                raise ValueError(f"未知的投递方式 {delivery!r}")
+            scheduler = self._command_manager.scheduler
+            previous = self._observers.get(callback_or_path)
+            if previous == DELIVER_CHANGES:
+                scheduler.change_subscriptions -= 1
+            if delivery == DELIVER_CHANGES:
+                scheduler.change_subscriptions += 1
+            self._observers[callback_or_path] = delivery
+            return
+        if self._path_index is None:
+            self._path_index = PathIndex()
+        size = len(self._path_index)
+        self._path_index.add(callback_or_path, callback)
+        self._command_manager.scheduler.path_subscriptions += (
+            len(self._path_index) - size
+        )
+
+    def unsubscribe(self, callback_or_path, callback=None):
+        """取消订阅，参数与 subscribe 相同"""
+        if callback is None:
+            if self._observers.pop(callback_or_path, None) == DELIVER_CHANGES:
+                self._command_manager.scheduler.change_subscriptions -= 1
+            return
+        if self._path_index is None:
+            return
+        size = len(self._path_index)
+        self._path_index.remove(callback_or_path, callback)
+        self._command_manager.scheduler.path_subscriptions -= size - len(
+            self._path_index
+        )
+
+    def snapshot(self):
+        """返回当前状态的不可变快照（dict -> MappingProxyType，list -> tuple）
+
+        快照按节点缓存并共享结构：没有变化时直接返回缓存，变化后只重建从被修改节点
+        到根的路径，未变化的子树复用原来的快照。快照之后的修改不会影响已取得的快照，
+        可以安全地交给其他线程只读使用。
+        """
+        frozen = self._frozen
+        if frozen is not None:
+            return frozen
+        with self._command_manager._lock:
+            return self._freeze()
+
+    def _freeze(self):
+        frozen = self._frozen
+        if frozen is not None:
+            return frozen
+        value = self._value
+        is_dict = isinstance(value, dict)
+        children = []
+        for key, child in value.items() if is_dict else enumerate(value):
+            if isinstance(child, Reactivable):
+                # 未变化的子树直接复用缓存的快照
+                child = child._frozen or child._freeze()
+            elif self._lazy and isinstance(child, _CONTAINER_TYPES):
+                # 惰性模式：先封装子容器，使其也能缓存快照
+                child = self._lazy_child(key, child)._freeze()
+            children.append((key, child) if is_dict else child)
+        frozen = MappingProxyType(dict(children)) if is_dict else tuple(children)
+        self._frozen = frozen
+        return frozen
+
+    def to_plain(self):
+        """返回普通 dict / list 形式的深拷贝（array 转为 list），直接遍历 _value"""
+        return to_plain(self)
+
+    @classmethod
+    def from_plain(cls, data, **kwargs) -> "Reactivable":
+        """从普通数据创建响应式对象，不修改传入的数据
 
-    def subscribe(self, callback):
-        self._observers.add(callback)
+        Args:
+            data: dict / list / array.array；在 Reactivable 上调用时按 data 的类型选择子类
+            **kwargs: 传给构造函数的其他参数（如 command_manager、lazy）
+        """
+        if cls is Reactivable:
+            if isinstance(data, dict):
+                cls = ReactivableDict
+            elif isinstance(data, list):
+                cls = ReactivableList
+            elif isinstance(data, array):
+                cls = ReactivableArray
+            else:
+                raise TypeError(f"不支持的数据类型: {type(data).__name__}")
+        return cls(_copy_plain(data), **kwargs)
+
+    def computed(self, name: str, fn) -> "Computed":
+        """声明派生值，之后可以通过 self.<name> 读取
+
+        Args:
+            name: 派生值名称（数据中不存在同名键时才能通过属性访问）
+            fn: 计算函数 fn(self)，读取到的响应式键会被自动记录为依赖
+
+        Returns:
+            Computed 对象
+        """
+        computed = Computed(fn, self)
+        if self._computed is None:
+            self._computed = {}
+        self._computed[name] = computed
+        return computed
 
     def bind_controller(self, controller: ControllerProtocol) -> None:
         """绑定控件，并验证接口
@@ -429,15 +2216,54 @@ class Reactivable:
         return BatchUpdate(self)
 
 
+class _LazyValuesView(ValuesView):
+    """惰性模式下 values() 的视图：迭代到的子容器经 _lazy_child 封装"""
+
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self._mapping._value)
+
+    def __iter__(self):
+        node = self._mapping
+        # 只替换已有键的值，不改变字典大小，迭代中写回是安全的
+        for key, value in node._value.items():
+            yield node._lazy_child(key, value)
+
+    def __contains__(self, value):
+        return any(item is value or item == value for item in self)
+
+
+class _LazyItemsView(ItemsView):
+    """惰性模式下 items() 的视图：迭代到的子容器经 _lazy_child 封装"""
+
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self._mapping._value)
+
+    def __iter__(self):
+        node = self._mapping
+        for key, value in node._value.items():
+            yield key, node._lazy_child(key, value)
+
+
 class ReactivableDict(Reactivable):
+    __slots__ = ()
+
     _value: dict
 
     def __getitem__(self, key):
-        return self._value[key]
+        if _tracking_count:
+            _track(self, key)
+        value = self._value[key]
+        if self._lazy:
+            return self._lazy_child(key, value)
+        return value
 
     def __setitem__(self, key, value):
-        old_value = self._value.get(key)
-        wrapped_value = self._wrap_reactive(value)
+        old_value = self._value.get(key, _MISSING)
+        wrapped_value = self._wrap_child(key, value)
         command = SetItemCommand(self, key, wrapped_value, old_value)
         self._execute_command(command)
 
@@ -447,60 +2273,554 @@ class ReactivableDict(Reactivable):
         self._execute_command(command)
 
     def __len__(self):
+        if _tracking_count:
+            _track(self, None)
         return len(self._value)
 
     def __contains__(self, key):
+        if _tracking_count:
+            _track(self, key)
         return key in self._value
 
     def keys(self):
+        if _tracking_count:
+            _track(self, None)
         return self._value.keys()
 
+    def get(self, key, default=None):
+        if _tracking_count:
+            _track(self, key)
+        if key not in self._value:
+            return default
+        return self[key]
+
+    def update(self, other=(), **kwargs):
+        """批量写入，记录为一条命令、通知一次；没有任何键变化时什么也不做"""
+        data = self._value
+        new = {}
+        for key, value in dict(other, **kwargs).items():
+            current = data.get(key, _MISSING)
+            # 值没有变化的键不进入命令；类型也要相同，1 和 True 视为不同的值
+            if current is value or (type(current) is type(value) and current == value):
+                continue
+            new[key] = value
+        if not new:
+            return
+        if not self._lazy:
+            for key, value in new.items():
+                if isinstance(value, _CONTAINER_TYPES):
+                    new[key] = self._wrap_child(key, value)
+        old = {key: data[key] for key in data.keys() & new.keys()}
+        self._execute_command(UpdateCommand(self, new, (), old))
+
+    def setdefault(self, key, default=None):
+        """键不存在时写入 default，返回键的当前值"""
+        if key not in self._value:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        """删除并返回键的值；键不存在时返回 default，未提供 default 则抛出 KeyError"""
+        if key not in self._value:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self._value[key]
+        self._execute_command(DelItemCommand(self, key, value))
+        return value
+
+    def popitem(self):
+        """删除并返回最后插入的键值对"""
+        if not self._value:
+            raise KeyError("popitem(): 字典为空")
+        key = next(reversed(self._value))
+        return key, self.pop(key)
+
+    def clear(self):
+        """清空字典，记录为一条命令"""
+        if self._value:
+            data = self._value
+            self._execute_command(UpdateCommand(self, {}, data.keys(), dict(data)))
+
     def values(self):
+        if _tracking_count:
+            _track(self, None)
+        if self._lazy:
+            # 迭代时才封装子容器，与 __getitem__ 一样缓存回 _value
+            return _LazyValuesView(self)
         return self._value.values()
 
     def items(self):
+        if _tracking_count:
+            _track(self, None)
+        if self._lazy:
+            return _LazyItemsView(self)
         return self._value.items()
 
 
 class ReactivableList(Reactivable):
+    __slots__ = ()
+
     _value: list
 
     def __getitem__(self, index):
-        return self._value[index]
+        if _tracking_count:
+            _track(self, None)
+        value = self._value[index]
+        if self._lazy:
+            # 子对象的键用非负索引，路径订阅和补丁路径才能对上
+            if isinstance(index, slice):
+                indices = range(len(self._value))[index]
+                return [self._lazy_child(i, item) for i, item in zip(indices, value)]
+            if index < 0:
+                index += len(self._value)
+            return self._lazy_child(index, value)
+        return value
 
     def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self._assign_slice(index, value)
+            return
+        # 规范化为非负索引，路径订阅和补丁路径才能对上
+        index = range(len(self._value))[index]
         old_value = self._value[index]
-        wrapped_value = self._wrap_reactive(value)
+        wrapped_value = self._wrap_child(index, value)
         command = SetItemCommand(self, index, wrapped_value, old_value)
         self._execute_command(command)
 
     def __delitem__(self, index):
+        if isinstance(index, slice):
+            self._assign_slice(index, None)
+            return
+        # 规范化为非负索引，撤销和导出时位置才明确
+        index = range(len(self._value))[index]
         old_value = self._value[index]
         command = PopCommand(self, index, old_value)
         self._execute_command(command)
 
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def _assign_slice(self, index: slice, values) -> None:
+        """切片赋值（values 为 None 表示删除），转换为一条 SliceCommand"""
+        start, stop, step = index.indices(len(self._value))
+        if step == 1:
+            stop = max(start, stop)
+            old_items = self._value[start:stop]
+            items = [] if values is None else self._wrap_items(start, values)
+        else:
+            # 扩展切片：在覆盖的连续区间的副本上完成赋值或删除，再整体替换该区间
+            positions = range(start, stop, step)
+            if not positions:
+                return
+            start, stop = min(positions), max(positions) + 1
+            old_items = self._value[start:stop]
+            items = list(old_items)
+            if values is None:
+                for position in sorted(positions, reverse=True):
+                    del items[position - start]
+            else:
+                values = list(values)
+                if len(values) != len(positions):
+                    raise ValueError(
+                        f"扩展切片长度为 {len(positions)}，"
+                        f"不能赋值长度为 {len(values)} 的序列"
+                    )
+                for position, value in zip(positions, values):
+                    items[position - start] = self._wrap_child(position, value)
+        if not items and not old_items:
+            return
+        self._execute_command(SliceCommand(self, start, stop, items, old_items))
+
+    def _wrap_items(self, start: int, values) -> list:
+        """封装将要放在 start 起的连续位置上的新元素（只有容器需要封装）"""
+        items = list(values)
+        if not self._lazy:
+            for i, value in enumerate(items):
+                if isinstance(value, _CONTAINER_TYPES):
+                    items[i] = self._wrap_child(start + i, value)
+        return items
+
     def __len__(self):
+        if _tracking_count:
+            _track(self, None)
         return len(self._value)
 
     def __contains__(self, item):
+        if _tracking_count:
+            _track(self, None)
         return item in self._value
 
     def append(self, value):
-        wrapped_value = self._wrap_reactive(value)
+        wrapped_value = self._wrap_child(len(self._value), value)
         command = AppendCommand(self, wrapped_value)
         self._execute_command(command)
 
     def insert(self, index, value):
-        wrapped_value = self._wrap_reactive(value)
+        # 与 list.insert 一致地截断越界索引，撤销时才能删除正确的位置
+        length = len(self._value)
+        index = max(0, index + length) if index < 0 else min(index, length)
+        wrapped_value = self._wrap_child(index, value)
         command = InsertCommand(self, index, wrapped_value)
         self._execute_command(command)
 
     def pop(self, index=-1):
+        index = range(len(self._value))[index]
         old_value = self._value[index]
         command = PopCommand(self, index, old_value)
         self._execute_command(command)
         return old_value
 
+    def extend(self, values):
+        """追加多个元素，记录为一条命令、通知一次"""
+        start = len(self._value)
+        items = self._wrap_items(start, values)
+        if items:
+            self._execute_command(SliceCommand(self, start, start, items, ()))
+
+    def clear(self):
+        """清空列表，记录为一条命令"""
+        if self._value:
+            old_items = self._value[:]
+            self._execute_command(SliceCommand(self, 0, len(old_items), (), old_items))
+
+    def remove(self, value):
+        """删除第一个等于 value 的元素，不存在时抛出 ValueError"""
+        self.pop(self._value.index(value))
+
+    def sort(self, *, key=None, reverse=False):
+        """原地排序，记录为一条命令"""
+        old_items = self._value[:]
+        items = sorted(old_items, key=key, reverse=reverse)
+        if any(a is not b for a, b in zip(items, old_items)):
+            self._execute_command(
+                SliceCommand(self, 0, len(old_items), items, old_items)
+            )
+
+    def reverse(self):
+        """原地反转，记录为一条命令"""
+        if len(self._value) > 1:
+            old_items = self._value[:]
+            self._execute_command(
+                SliceCommand(self, 0, len(old_items), old_items[::-1], old_items)
+            )
+
+
+class ReactivableArray(Reactivable):
+    """基于 array.array 的类型化数值序列
+
+    元素以原始数值存放在连续缓冲区中，不为每个元素创建 Python 对象；
+    每次写入（单个元素或一个区间）记录为一条 ArrayRangeCommand，只保存该区间的旧字节。
+    控件可以通过 view() 零拷贝地读取数据。
+    """
+
+    __slots__ = ()
+
+    _value: array
+
+    def __init__(
+        self,
+        value=(),
+        typecode: str = "d",
+        parent=None,
+        key=None,
+        command_manager=None,
+        lazy=False,
+    ):
+        """
+        Args:
+            value: array.array，或用于初始化的可迭代对象 / 字节
+            typecode: value 不是 array.array 时使用的类型码，默认为 "d"（double）
+        """
+        if not isinstance(value, array):
+            value = array(typecode, value)
+        super().__init__(value, parent, key, command_manager, lazy)
+
+    @property
+    def typecode(self) -> str:
+        return self._value.typecode
+
+    def view(self) -> memoryview:
+        """只读的零拷贝视图
+
+        视图存在期间数组不能改变长度（append、insert 等会抛出 BufferError），
+        用完后应调用 release() 或使用 with 语句。
+        """
+        return memoryview(self._value).toreadonly()
+
+    def tolist(self) -> list:
+        return self._value.tolist()
+
+    def _freeze(self):
+        """快照为数据副本的只读视图（memcpy，无逐元素开销）"""
+        frozen = self._frozen
+        if frozen is None:
+            frozen = self._frozen = memoryview(
+                array(self.typecode, self._value)
+            ).toreadonly()
+        return frozen
+
+    def __getitem__(self, index):
+        if _tracking_count:
+            _track(self, None)
+        return self._value[index]
+
+    def __len__(self):
+        if _tracking_count:
+            _track(self, None)
+        return len(self._value)
+
+    def __contains__(self, item):
+        if _tracking_count:
+            _track(self, None)
+        return item in self._value
+
+    def _range(self, start: int, stop: int, values) -> None:
+        """用 values 替换 [start, stop)，记录为一条命令"""
+        data = self._value
+        new = array(data.typecode, values).tobytes()
+        old = data[start:stop].tobytes()
+        if old == new:
+            return
+        self._execute_command(ArrayRangeCommand(self, start, old, new))
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self._value))
+            if step != 1:
+                raise ValueError("ReactivableArray 只支持连续切片赋值")
+            self._range(start, max(start, stop), value)
+            return
+        index = range(len(self._value))[index]
+        self._range(index, index + 1, (value,))
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self._value))
+            if step != 1:
+                raise ValueError("ReactivableArray 只支持删除连续切片")
+            self._range(start, max(start, stop), ())
+            return
+        index = range(len(self._value))[index]
+        self._range(index, index + 1, ())
+
+    def write(self, start: int, values) -> None:
+        """从 start 起覆盖写入 values（不改变长度），记录为一条命令
+
+        Args:
+            start: 起始下标
+            values: 可迭代对象、array.array 或其他支持缓冲区协议的同类型数据
+        """
+        values = array(self.typecode, values)
+        if start < 0 or start + len(values) > len(self._value):
+            raise IndexError("写入区间超出数组范围")
+        self._range(start, start + len(values), values)
+
+    def append(self, value):
+        end = len(self._value)
+        self._range(end, end, (value,))
+
+    def extend(self, values):
+        end = len(self._value)
+        self._range(end, end, values)
+
+    def insert(self, index, value):
+        length = len(self._value)
+        index = max(0, index + length) if index < 0 else min(index, length)
+        self._range(index, index, (value,))
+
+    def pop(self, index=-1):
+        index = range(len(self._value))[index]
+        value = self._value[index]
+        self._range(index, index + 1, ())
+        return value
+
+
+# 需要递归处理的值类型
+_NESTED_TYPES = (Reactivable, *_CONTAINER_TYPES)
+
+
+def to_plain(value):
+    """把响应式对象（或包含响应式对象的数据）还原为普通 dict / list 的深拷贝"""
+    if isinstance(value, Reactivable):
+        value = value._value
+    if isinstance(value, dict):
+        return {
+            k: to_plain(v) if isinstance(v, _NESTED_TYPES) else v
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [to_plain(v) if isinstance(v, _NESTED_TYPES) else v for v in value]
+    if isinstance(value, array):
+        return value.tolist()
+    return value
+
+
+def _copy_plain(value):
+    """复制普通数据中的容器（array 保持为 array），标量共享"""
+    if isinstance(value, dict):
+        return {
+            k: _copy_plain(v) if isinstance(v, _CONTAINER_TYPES) else v
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [_copy_plain(v) if isinstance(v, _CONTAINER_TYPES) else v for v in value]
+    if isinstance(value, array):
+        return array(value.typecode, value)
+    return value
+
+
+# 当前上下文（线程 / asyncio 任务）中正在计算的派生值，它记录本次计算读取的依赖；
+# 嵌套计算结束时通过 token 恢复外层的派生值
+_tracking: ContextVar["Computed | None"] = ContextVar("reactive_tracking", default=None)
+# 所有上下文中正在进行的计算数，为 0 时读取路径不必查询 ContextVar
+_tracking_count = 0
+_tracking_lock = threading.Lock()
+
+
+def _track(node: Reactivable, key) -> None:
+    computed = _tracking.get()
+    if computed is not None:
+        computed._depend(node, key)
+
+
+class Computed:
+    """派生值
+
+    计算时自动记录读取过的 (节点, 键) 作为依赖并缓存结果；依赖变化时只标记失效
+    （推送失效），下次读取时才重新计算（拉取计算）。与依赖无关的变更不会触发重新计算。
+    """
+
+    __slots__ = (
+        "_fn",
+        "_owner",
+        "_cache",
+        "_dirty",
+        "_deps",
+        "_dependents",
+        "_observers",
+    )
+
+    def __init__(self, fn, owner: Reactivable):
+        """
+        Args:
+            fn: 计算函数 fn(owner)
+            owner: 派生值所属的响应式对象
+        """
+        self._fn = fn
+        self._owner = owner
+        self._cache = None
+        self._dirty = True
+        # 本派生值依赖的 (节点, 键)
+        self._deps: set[tuple] = set()
+        # 依赖本派生值的其他派生值
+        self._dependents: set[Computed] = set()
+        self._observers: list = []
+
+    @property
+    def value(self):
+        """读取派生值，失效时重新计算"""
+        if _tracking_count:
+            # 派生值之间的依赖
+            current = _tracking.get()
+            if current is not None:
+                self._dependents.add(current)
+        if self._dirty:
+            self._recompute()
+        return self._cache
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def subscribe(self, callback) -> None:
+        """派生值变化时调用 callback(value)，在 flush 时统一重新计算并通知"""
+        self._observers.append(callback)
+        if self._dirty:
+            self._recompute()
+
+    def _recompute(self) -> None:
+        self._clear_deps()
+        global _tracking_count
+        with _tracking_lock:
+            _tracking_count += 1
+        token = _tracking.set(self)
+        try:
+            self._cache = self._fn(self._owner)
+        finally:
+            _tracking.reset(token)
+            with _tracking_lock:
+                _tracking_count -= 1
+        self._dirty = False
+
+    def _depend(self, node: Reactivable, key) -> None:
+        if (node, key) in self._deps:
+            return
+        self._deps.add((node, key))
+        if node._dependents is None:
+            node._dependents = {}
+        node._dependents.setdefault(key, set()).add(self)
+
+    def _clear_deps(self) -> None:
+        """依赖可能随分支变化，每次重新计算前解除旧的依赖"""
+        for node, key in self._deps:
+            computeds = node._dependents.get(key)
+            if computeds is not None:
+                computeds.discard(self)
+                if not computeds:
+                    del node._dependents[key]
+        self._deps.clear()
+
+    def _invalidate(self) -> None:
+        if self._dirty:
+            return
+        self._dirty = True
+        if self._observers:
+            self._owner._command_manager.scheduler.mark_computed(self)
+        dependents, self._dependents = self._dependents, set()
+        for computed in dependents:
+            computed._invalidate()
+
+    def _refresh(self) -> None:
+        """flush 时调用：重新计算，值变化时通知观察者"""
+        old = self._cache
+        value = self.value
+        if value != old:
+            scheduler = self._owner._command_manager.scheduler
+            for observer in self._observers:
+                scheduler.call(observer, value)
+
+
+class _DataKey:
+    """按属性读取数据键的描述符，由 Reactivable.__getattr__ 按需安装到类上
+
+    实例上没有这个键时退回 __getattr__（派生值、底层容器的属性）。
+    """
+
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        name = self.name
+        try:
+            value = instance._value[name]
+        except KeyError:
+            return instance.__getattr__(name)
+        if _tracking_count:
+            _track(instance, name)
+        if instance._lazy:
+            return instance._lazy_child(name, value)
+        return value
+
+
+# 写入实例本身（而不是写入 _value）的内部属性名
+_INTERNAL_ATTRS = frozenset(Reactivable.__slots__) | {"_parent"}
+
 
 if __name__ == "__main__":
     data = {
@@ -0,0 +1,582 @@
+"""
+响应式树的快速序列化：JSON 与类 msgpack 的二进制格式
+
+直接遍历各节点的 _value，不经过 __getattr__ 等代理。从未编码过的子树和成员不超过
+_INLINE_LIMIT 的小子树整体交给 C 编码器（遇到响应式对象时取其 _value），只在子树的
+根上缓存。数据变化时缓存与快照一起沿父链失效；编码后被修改过的大容器再次编码时
+逐个成员编码并缓存子节点，之后只重新编码被修改的节点及其祖先，未变化的子树直接
+复用缓存的字节。缓存因此只落在实际被修改的路径上。
+
+    data = encode(root)                    # JSON bytes，增量缓存
+    data = encode(root, FORMAT_BINARY)     # 二进制
+    dump(root, f)                          # 流式写入文件，不拼接整个文档
+    plain = decode(data, FORMAT_BINARY)    # -> 普通 dict / list
+    root = Reactivable.from_plain(plain)   # 重新封装为响应式对象
+
+二进制格式是 msgpack 的子集：nil、bool、int（最多 64 位）、float64、str、bin、
+array、map；array.array 编码为扩展类型 1（类型码 + 原始字节），解码为 array.array。
+"""
+
+import json
+import struct
+import sys
+from array import array
+from itertools import repeat
+from json.encoder import c_make_encoder, encode_basestring
+from math import isfinite
+
+from reactive.reactive import Reactivable, ReactivableArray
+
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
+
+# array.array 的扩展类型编号
+EXT_ARRAY = 1
+
+# 子树成员总数不超过该值时整体编码，只在子树的根上缓存
+_INLINE_LIMIT = 64
+# 子节点类型：出现时按子树大小决定整体编码还是逐个成员编码
+_NESTED_TYPES = (Reactivable, dict, list, array)
+# 供 map(isinstance, values, _NESTED) 使用的无限迭代器，不保存状态，可以共享
+_NESTED = repeat(_NESTED_TYPES)
+
+
+def _json_default(value):
+    # C 编码器遇到响应式对象时取其内部值继续编码
+    if isinstance(value, Reactivable):
+        return value._value
+    if isinstance(value, array):
+        return value.tolist()
+    raise TypeError(f"无法编码的类型: {type(value).__name__}")
+
+
+_json = json.JSONEncoder(
+    ensure_ascii=False, separators=(",", ":"), default=_json_default
+)
+
+# JSONEncoder.encode 每次调用都会新建 C 编码器，这里只创建一次
+_c_encoder = (
+    None
+    if c_make_encoder is None
+    else c_make_encoder(
+        None, _json_default, encode_basestring, None, ":", ",", False, False, True
+    )
+)
+
+
+def _subtree_size(value, limit: int) -> int:
+    """子树的成员总数，超过 limit 后不再继续统计"""
+    size = len(value)
+    if size > limit or isinstance(value, array):
+        return size
+    for child in value.values() if isinstance(value, dict) else value:
+        if isinstance(child, _NESTED_TYPES):
+            if isinstance(child, Reactivable):
+                child = child._value
+            size += _subtree_size(child, limit - size)
+            if size > limit:
+                break
+    return size
+
+
+def _inline(value) -> bool:
+    """没有子容器或子树很小时整体编码，即使节点编码后被修改过"""
+    members = value.values() if isinstance(value, dict) else value
+    return (
+        not any(map(isinstance, members, _NESTED))
+        or _subtree_size(value, _INLINE_LIMIT) <= _INLINE_LIMIT
+    )
+
+
+def _json_plain(value) -> str:
+    """整体编码一个值（可以含普通容器和响应式对象）"""
+    if _c_encoder is None:
+        return _json.encode(value)
+    return "".join(_c_encoder(value, 0))
+
+
+def _json_scalar(value) -> bytes:
+    # 常见的标量类型直接转换，不经过编码器
+    cls = type(value)
+    if cls is str:
+        return encode_basestring(value).encode()
+    if cls is int:
+        return int.__repr__(value).encode()
+    if cls is float and isfinite(value):
+        return float.__repr__(value).encode()
+    return _json_plain(value).encode()
+
+
+def _json_key(key) -> bytes:
+    # 与标准库 json 的键规则一致，嵌套在普通容器里的键由 C 编码器按同样的规则处理
+    if isinstance(key, str):
+        pass
+    elif key is True:
+        key = "true"
+    elif key is False:
+        key = "false"
+    elif key is None:
+        key = "null"
+    elif isinstance(key, int):
+        key = int.__repr__(key)
+    elif isinstance(key, float):
+        key = _json_plain(key)
+    else:
+        raise TypeError(
+            f"键必须是 str、int、float、bool 或 None，实际为 {type(key).__name__}"
+        )
+    return encode_basestring(key).encode()
+
+
+def _json_container(is_dict: bool, parts: list) -> bytes:
+    if is_dict:
+        return b"{" + b",".join(parts) + b"}"
+    return b"[" + b",".join(parts) + b"]"
+
+
+def _json_array(value: array) -> bytes:
+    return _json_scalar(value.tolist())
+
+
+_pack_float = struct.Struct(">Bd").pack
+
+
+def _pack_header(size: int, fix: int, fix_limit: int, code16: int) -> bytes:
+    """array / map / str 等的长度头：fix 类型、16 位或 32 位长度"""
+    if size < fix_limit:
+        return bytes((fix | size,))
+    if size < 0x10000:
+        return struct.pack(">BH", code16, size)
+    return struct.pack(">BI", code16 + 1, size)
+
+
+def _pack_int(value: int) -> bytes:
+    if 0 <= value < 0x80:
+        return bytes((value,))
+    if -32 <= value < 0:
+        return bytes((value & 0xFF,))
+    if value >= 0:
+        for code, fmt, limit in _UINTS:
+            if value < limit:
+                return struct.pack(fmt, code, value)
+    else:
+        for code, fmt, limit in _INTS:
+            if value >= limit:
+                return struct.pack(fmt, code, value)
+    raise OverflowError(f"整数超出 64 位范围: {value}")
+
+
+_UINTS = (
+    (0xCC, ">BB", 1 << 8),
+    (0xCD, ">BH", 1 << 16),
+    (0xCE, ">BI", 1 << 32),
+    (0xCF, ">BQ", 1 << 64),
+)
+_INTS = (
+    (0xD0, ">Bb", -(1 << 7)),
+    (0xD1, ">Bh", -(1 << 15)),
+    (0xD2, ">Bi", -(1 << 31)),
+    (0xD3, ">Bq", -(1 << 63)),
+)
+
+
+def _pack_str(value: str) -> bytes:
+    data = value.encode()
+    size = len(data)
+    if size < 32:
+        return bytes((0xA0 | size,)) + data
+    if size < 0x100:
+        return bytes((0xD9, size)) + data
+    if size < 0x10000:
+        return struct.pack(">BH", 0xDA, size) + data
+    return struct.pack(">BI", 0xDB, size) + data
+
+
+def _pack_bin(value: bytes) -> bytes:
+    size = len(value)
+    if size < 0x100:
+        return bytes((0xC4, size)) + value
+    if size < 0x10000:
+        return struct.pack(">BH", 0xC5, size) + value
+    return struct.pack(">BI", 0xC6, size) + value
+
+
+def _binary_array(value: array) -> bytes:
+    """扩展类型 1：1 字节类型码 + 小端原始字节"""
+    if sys.byteorder != "little":
+        value = array(value.typecode, value)
+        value.byteswap()
+    payload = value.typecode.encode() + value.tobytes()
+    size = len(payload)
+    if size < 0x100:
+        header = bytes((0xC7, size, EXT_ARRAY))
+    elif size < 0x10000:
+        header = struct.pack(">BHB", 0xC8, size, EXT_ARRAY)
+    else:
+        header = struct.pack(">BIB", 0xC9, size, EXT_ARRAY)
+    return header + payload
+
+
+def _binary_scalar(value) -> bytes:
+    """整体编码一个值（可以含普通容器和响应式对象）"""
+    if value is None:
+        return b"\xc0"
+    if value is True:
+        return b"\xc3"
+    if value is False:
+        return b"\xc2"
+    cls = type(value)
+    if cls is str:
+        return _pack_str(value)
+    if cls is int:
+        return _pack_int(value)
+    if cls is float:
+        return _pack_float(0xCB, value)
+    if isinstance(value, Reactivable):
+        value = value._value
+    if isinstance(value, dict):
+        parts = [_binary_header(True, len(value))]
+        for key, item in value.items():
+            parts.append(_binary_scalar(key))
+            parts.append(_binary_scalar(item))
+        return b"".join(parts)
+    if isinstance(value, (list, tuple)):
+        parts = [_binary_header(False, len(value))]
+        parts.extend(_binary_scalar(item) for item in value)
+        return b"".join(parts)
+    if isinstance(value, array):
+        return _binary_array(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return _pack_bin(bytes(value))
+    if isinstance(value, str):
+        return _pack_str(value)
+    if isinstance(value, int):
+        return _pack_int(value)
+    if isinstance(value, float):
+        return _pack_float(0xCB, value)
+    raise TypeError(f"无法编码的类型: {type(value).__name__}")
+
+
+def _binary_header(is_dict: bool, size: int) -> bytes:
+    if is_dict:
+        return _pack_header(size, 0x80, 16, 0xDE)
+    return _pack_header(size, 0x90, 16, 0xDC)
+
+
+def _binary_container(is_dict: bool, parts: list) -> bytes:
+    size = len(parts) // 2 if is_dict else len(parts)
+    return _binary_header(is_dict, size) + b"".join(parts)
+
+
+def _children(node: Reactivable):
+    """遍历节点的成员 (键, 值)；惰性模式下先封装子容器，使其也能缓存编码结果"""
+    value = node._value
+    items = value.items() if isinstance(value, dict) else enumerate(value)
+    if not node._lazy:
+        return items
+    return [
+        (
+            key,
+            node._lazy_child(key, child) if isinstance(child, _NESTED_TYPES) else child,
+        )
+        for key, child in list(items)
+    ]
+
+
+def _cache(node: Reactivable, cached, name: str, data: bytes) -> bytes:
+    if cached is None:
+        node._encoded = {name: data}
+    else:
+        cached[name] = data
+    return data
+
+
+def _encode_json(node: Reactivable) -> bytes:
+    """编码一个节点为 JSON 并缓存；未变化的子节点复用缓存"""
+    cached = node._encoded
+    if cached:
+        data = cached.get(FORMAT_JSON)
+        if data is not None:
+            return data
+
+    value = node._value
+    if isinstance(node, ReactivableArray):
+        return _cache(node, cached, FORMAT_JSON, _json_array(value))
+    if cached is None or _inline(value):
+        # 从未编码过（_encoded 为 None）或很小：整体交给 C 编码器，只在本节点缓存
+        return _cache(node, cached, FORMAT_JSON, _json_plain(value).encode())
+    is_dict = isinstance(value, dict)
+
+    parts = []
+    append = parts.append
+    for key, child in _children(node):
+        if isinstance(child, Reactivable):
+            encoded = _encode_json(child)
+        else:
+            encoded = _json_scalar(child)
+        if is_dict:
+            append(_json_key(key) + b":" + encoded)
+        else:
+            append(encoded)
+    return _cache(node, cached, FORMAT_JSON, _json_container(is_dict, parts))
+
+
+def _encode_binary(node: Reactivable) -> bytes:
+    """编码一个节点为二进制格式并缓存；未变化的子节点复用缓存"""
+    cached = node._encoded
+    if cached:
+        data = cached.get(FORMAT_BINARY)
+        if data is not None:
+            return data
+
+    value = node._value
+    if isinstance(node, ReactivableArray):
+        return _cache(node, cached, FORMAT_BINARY, _binary_array(value))
+    if cached is None or _inline(value):
+        return _cache(node, cached, FORMAT_BINARY, _binary_scalar(value))
+    is_dict = isinstance(value, dict)
+
+    parts = []
+    append = parts.append
+    for key, child in _children(node):
+        if is_dict:
+            append(_binary_scalar(key))
+        if isinstance(child, Reactivable):
+            append(_encode_binary(child))
+        else:
+            append(_binary_scalar(child))
+    return _cache(node, cached, FORMAT_BINARY, _binary_container(is_dict, parts))
+
+
+class _Format:
+    """一种编码格式"""
+
+    __slots__ = ("name", "node", "scalar", "key", "array", "separator")
+
+    def __init__(self, name, node, scalar, key, array, separator):
+        self.name = name
+        # 编码并缓存一个节点
+        self.node = node
+        # 整体编码一个值（可以含普通容器和响应式对象）
+        self.scalar = scalar
+        # 编码 dict 的键
+        self.key = key
+        # 编码 array.array
+        self.array = array
+        # JSON 中键与值、成员之间有分隔符；二进制格式没有
+        self.separator = separator
+
+
+_FORMATS = {
+    FORMAT_JSON: _Format(
+        FORMAT_JSON, _encode_json, _json_scalar, _json_key, _json_array, True
+    ),
+    FORMAT_BINARY: _Format(
+        FORMAT_BINARY,
+        _encode_binary,
+        _binary_scalar,
+        _binary_scalar,
+        _binary_array,
+        False,
+    ),
+}
+
+
+def _get_format(name: str) -> _Format:
+    try:
+        return _FORMATS[name]
+    except KeyError:
+        raise ValueError(f"未知的格式 {name!r}，可选: {', '.join(_FORMATS)}") from None
+
+
+def encode(node: Reactivable, format: str = FORMAT_JSON) -> bytes:
+    """编码响应式树，结果按节点缓存
+
+    只有被修改的节点及其祖先需要重新编码，其余子树直接复用上次的结果。
+
+    Args:
+        node: 要编码的响应式对象（可以是子树）
+        format: FORMAT_JSON 或 FORMAT_BINARY
+
+    Raises:
+        ValueError: 未知的格式
+        TypeError: 数据中有无法编码的值
+    """
+    fmt = _get_format(format)
+    with node._command_manager._lock:
+        return fmt.node(node)
+
+
+def iter_encode(node: Reactivable, format: str = FORMAT_JSON):
+    """流式编码：逐段产生 bytes，拼接结果与 encode 相同
+
+    有缓存的子树和小子树整段产生，其余部分边遍历边编码，不拼接整个文档，也不写入缓存，
+    适合一次性导出很大的文档。遍历期间不应修改数据。
+    """
+    fmt = _get_format(format)
+    yield from _iter_node(node, fmt)
+
+
+def _iter_node(node: Reactivable, fmt: _Format):
+    cached = node._encoded
+    if cached is not None and fmt.name in cached:
+        yield cached[fmt.name]
+        return
+    value = node._value
+    if isinstance(node, ReactivableArray):
+        yield fmt.array(value)
+        return
+    if cached is None or _inline(value):
+        yield fmt.scalar(value)
+        return
+    is_dict = isinstance(value, dict)
+    if fmt.separator:
+        yield b"{" if is_dict else b"["
+    else:
+        yield _binary_header(is_dict, len(value))
+    for index, (key, child) in enumerate(_children(node)):
+        if fmt.separator and index:
+            yield b","
+        if is_dict:
+            yield fmt.key(key) + b":" if fmt.separator else fmt.key(key)
+        if isinstance(child, Reactivable):
+            yield from _iter_node(child, fmt)
+        else:
+            yield fmt.scalar(child)
+    if fmt.separator:
+        yield b"}" if is_dict else b"]"
+
+
+def dump(node: Reactivable, fp, format: str = FORMAT_JSON) -> None:
+    """流式编码并写入二进制文件对象 fp"""
+    write = fp.write
+    for chunk in iter_encode(node, format):
+        write(chunk)
+
+
+def decode(data: bytes, format: str = FORMAT_JSON):
+    """解码为普通数据（dict / list / 标量，二进制格式中的数组为 array.array）
+
+    Raises:
+        ValueError: 未知的格式或数据损坏
+    """
+    _get_format(format)
+    if format == FORMAT_JSON:
+        return json.loads(data)
+    view = memoryview(data)
+    value, offset = _unpack(view, 0)
+    if offset != len(view):
+        raise ValueError(f"解码后有 {len(view) - offset} 字节多余数据")
+    return value
+
+
+def _unpack(data: memoryview, offset: int):
+    """从 offset 处解码一个值，返回 (值, 下一个值的位置)"""
+    try:
+        code = data[offset]
+    except IndexError:
+        raise ValueError("数据不完整") from None
+    offset += 1
+    if code < 0x80:
+        return code, offset
+    if code >= 0xE0:
+        return code - 0x100, offset
+    if code < 0x90:
+        return _unpack_map(data, offset, code & 0x0F)
+    if code < 0xA0:
+        return _unpack_list(data, offset, code & 0x0F)
+    if code < 0xC0:
+        return _unpack_str(data, offset, code & 0x1F)
+    if code == 0xC0:
+        return None, offset
+    if code == 0xC2:
+        return False, offset
+    if code == 0xC3:
+        return True, offset
+    if code == 0xCB:
+        return _unpack_fixed(data, offset, ">d")
+    if code in _FIXED_CODES:
+        return _unpack_fixed(data, offset, _FIXED_CODES[code])
+    if code in _LENGTH_CODES:
+        kind, fmt = _LENGTH_CODES[code]
+        size, offset = _unpack_fixed(data, offset, fmt)
+        if kind == "str":
+            return _unpack_str(data, offset, size)
+        if kind == "bin":
+            return _take(data, offset, size).tobytes(), offset + size
+        if kind == "list":
+            return _unpack_list(data, offset, size)
+        if kind == "map":
+            return _unpack_map(data, offset, size)
+        return _unpack_ext(data, offset + 1, size, data[offset])
+    raise ValueError(f"不支持的类型字节 0x{code:02x}（位置 {offset - 1}）")
+
+
+_FIXED_CODES = {
+    0xCA: ">f",
+    0xCC: ">B",
+    0xCD: ">H",
+    0xCE: ">I",
+    0xCF: ">Q",
+    0xD0: ">b",
+    0xD1: ">h",
+    0xD2: ">i",
+    0xD3: ">q",
+}
+_LENGTH_CODES = {
+    0xC4: ("bin", ">B"),
+    0xC5: ("bin", ">H"),
+    0xC6: ("bin", ">I"),
+    0xC7: ("ext", ">B"),
+    0xC8: ("ext", ">H"),
+    0xC9: ("ext", ">I"),
+    0xD9: ("str", ">B"),
+    0xDA: ("str", ">H"),
+    0xDB: ("str", ">I"),
+    0xDC: ("list", ">H"),
+    0xDD: ("list", ">I"),
+    0xDE: ("map", ">H"),
+    0xDF: ("map", ">I"),
+}
+
+
+def _take(data: memoryview, offset: int, size: int) -> memoryview:
+    if offset + size > len(data):
+        raise ValueError("数据不完整")
+    return data[offset : offset + size]
+
+
+def _unpack_fixed(data: memoryview, offset: int, fmt: str):
+    size = struct.calcsize(fmt)
+    return struct.unpack(fmt, _take(data, offset, size))[0], offset + size
+
+
+def _unpack_str(data: memoryview, offset: int, size: int):
+    return str(_take(data, offset, size), "utf-8"), offset + size
+
+
+def _unpack_list(data: memoryview, offset: int, size: int):
+    items = []
+    for _ in range(size):
+        item, offset = _unpack(data, offset)
+        items.append(item)
+    return items, offset
+
+
+def _unpack_map(data: memoryview, offset: int, size: int):
+    result = {}
+    for _ in range(size):
+        key, offset = _unpack(data, offset)
+        result[key], offset = _unpack(data, offset)
+    return result, offset
+
+
+def _unpack_ext(data: memoryview, offset: int, size: int, ext_type: int):
+    payload = _take(data, offset, size)
+    if ext_type != EXT_ARRAY or size < 1:
+        raise ValueError(f"不支持的扩展类型 {ext_type}")
+    value = array(chr(payload[0]))
+    value.frombytes(payload[1:])
+    if sys.byteorder != "little":
+        value.byteswap()
+    return value, offset + size
@@ -5,11 +5,6 @@ from reactive.reactive import Reactivable
 
 class TestObservable(unittest.TestCase):
     def setUp(self):
-        # 清理 CommandManager 的历史栈，避免测试间干扰
-        from reactive.reactive import CommandManager
-
-        CommandManager().clear_history()
-
         self.data = {
             "name": "Alice",
             "age": 30,
@@ -80,9 +75,8 @@ class TestObservable(unittest.TestCase):
             self.reactivable.age = 25
             self.reactivable.address.city = "Hangzhou"
 
-        # 批量更新期间每个操作都会触发通知，但只在结束时发送一次
-        # 注意：当前实现中，每个操作都会触发通知，但只在批量更新结束时发送一次额外通知
-        self.assertGreater(len(callback_calls), 0)
+        # 批量更新期间不触发通知，结束时只发送一次
+        self.assertEqual(len(callback_calls), 1)
         self.assertEqual(self.reactivable.name, "David")
         self.assertEqual(self.reactivable.age, 25)
         self.assertEqual(self.reactivable.address.city, "Hangzhou")
@@ -104,6 +98,56 @@ class TestObservable(unittest.TestCase):
         self.assertEqual(self.reactivable.age, initial_age)
         self.assertEqual(self.reactivable.name, initial_name)
 
+    def test_batch_update_notifies_each_observer_once(self):
+        """验证批量更新结束时每个受影响的观察者只通知一次"""
+        root_calls, address_calls, hobbies_calls = [], [], []
+        self.reactivable.subscribe(root_calls.append)
+        self.reactivable.address.subscribe(address_calls.append)
+        self.reactivable.hobbies.subscribe(hobbies_calls.append)
+
+        with self.reactivable.batch_update():
+            self.reactivable.address.city = "Hangzhou"
+            self.reactivable.address.zip = "310000"
+            self.reactivable.hobbies.append("gaming")
+            self.reactivable.hobbies.append("hiking")
+            self.assertEqual(root_calls, [])
+
+        self.assertEqual(len(root_calls), 1)
+        self.assertEqual(len(address_calls), 1)
+        self.assertEqual(len(hobbies_calls), 1)
+
+    def test_nested_batch_update(self):
+        """验证嵌套批量更新只在最外层结束时通知，并记录为一条历史"""
+        callback_calls = []
+        self.reactivable.subscribe(callback_calls.append)
+
+        with self.reactivable.batch_update():
+            self.reactivable.name = "Frank"
+            with self.reactivable.address.batch_update():
+                self.reactivable.address.city = "Xian"
+            self.assertEqual(callback_calls, [])
+            self.reactivable.age = 60
+
+        self.assertEqual(len(callback_calls), 1)
+        self.assertEqual(len(self.reactivable._command_manager.undo_stack), 1)
+
+        self.reactivable.undo()
+        self.assertEqual(self.reactivable.name, "Alice")
+        self.assertEqual(self.reactivable.address.city, "Beijing")
+
+    def test_empty_batch_update_does_not_notify(self):
+        """验证没有变更的批量更新不发送通知，且事务正常关闭"""
+        callback_calls = []
+        self.reactivable.subscribe(callback_calls.append)
+
+        with self.reactivable.batch_update():
+            pass
+        self.assertEqual(callback_calls, [])
+
+        # 事务已关闭，后续变更立即通知
+        self.reactivable.name = "Grace"
+        self.assertEqual(len(callback_calls), 1)
+
     def test_setattr_for_non_existent_attribute(self):
         """测试设置不存在的属性时不会抛出 AttributeError"""
         # 这个测试验证 __setattr__ 在第一次设置属性时不会崩溃
@@ -151,6 +195,73 @@ class TestObservable(unittest.TestCase):
         self.assertIsNotNone(hobbies._parent)
         self.assertEqual(hobbies._key, "hobbies")
 
+    def test_documents_have_independent_history(self):
+        """验证不同文档的撤销互不影响"""
+        from reactive.reactive import ReactivableDict
+
+        doc1 = ReactivableDict({"title": "a", "meta": {"tag": "x"}})
+        doc2 = ReactivableDict({"title": "b"})
+
+        doc1.title = "a2"
+        doc2.title = "b2"
+        doc1.undo()
+
+        self.assertEqual(doc1.title, "a")
+        self.assertEqual(doc2.title, "b2")
+        # 子对象沿用根对象的命令管理器
+        self.assertIs(doc1.meta._command_manager, doc1._command_manager)
+        self.assertIsNot(doc1._command_manager, doc2._command_manager)
+
+    def test_shared_command_manager(self):
+        """验证显式传入同一个命令管理器时共享历史"""
+        from reactive.reactive import CommandManager, ReactivableDict
+
+        manager = CommandManager()
+        doc1 = ReactivableDict({"title": "a"}, command_manager=manager)
+        doc2 = ReactivableDict({"title": "b"}, command_manager=manager)
+
+        doc1.title = "a2"
+        doc2.title = "b2"
+        self.assertEqual(len(manager.undo_stack), 2)
+
+        doc1.undo()
+        self.assertEqual(doc2.title, "b")
+
+    def test_attribute_falls_back_to_container(self):
+        """验证数据键优先，其次回退到底层容器的属性"""
+        from reactive.reactive import ReactivableDict, ReactivableList
+
+        self.assertEqual(self.reactivable.hobbies.count("reading"), 1)
+        self.assertEqual(list(self.reactivable.address.keys()), ["city", "zip"])
+        with self.assertRaises(AttributeError):
+            _ = self.reactivable.missing
+
+        # 内部状态存放在 slots 中，不会写入数据
+        self.assertFalse(hasattr(ReactivableDict({}), "__dict__"))
+        self.assertFalse(hasattr(ReactivableList([]), "__dict__"))
+        self.assertNotIn("_controller", self.data)
+
+    def test_data_key_descriptor(self):
+        """验证读到过的数据键安装描述符后，其他实例缺少该键时仍按原规则回退"""
+        from reactive.reactive import ReactivableDict
+
+        first = ReactivableDict({"label": "a", "items": 1})
+        self.assertEqual(first.label, "a")
+        self.assertEqual(first.label, "a")
+        first.label = "b"
+        self.assertEqual(first.label, "b")
+        # 与方法重名的键仍然是方法优先
+        self.assertTrue(callable(first.items))
+
+        other = ReactivableDict({"n": 2})
+        with self.assertRaises(AttributeError):
+            _ = other.label
+        other.computed("label", lambda r: r.n * 10)
+        self.assertEqual(other.label, 20)
+        del first["label"]
+        with self.assertRaises(AttributeError):
+            _ = first.label
+
     def test_change_bubbling(self):
         """验证变更冒泡：子对象变更时，父对象是否收到通知"""
         callback_calls = []
@@ -168,6 +279,851 @@ class TestObservable(unittest.TestCase):
         self.assertEqual(len(callback_calls), 1)
 
 
+class TestLazyWrapping(unittest.TestCase):
+    """测试惰性封装模式"""
+
+    def setUp(self):
+        from reactive.reactive import ReactivableDict
+
+        self.address = {"city": "Beijing", "zip": "100000"}
+        self.hobbies = ["reading", {"name": "coding"}]
+        self.data = {"name": "Alice", "address": self.address, "hobbies": self.hobbies}
+        self.reactivable = ReactivableDict(self.data, lazy=True)
+
+    def test_children_are_not_wrapped_on_construction(self):
+        """验证构造时不封装嵌套容器"""
+        self.assertIs(self.data["address"], self.address)
+        self.assertIs(self.data["hobbies"], self.hobbies)
+
+    def test_child_wrapped_on_first_access_and_cached(self):
+        """验证首次访问时封装并缓存，封装对象直接使用原始容器"""
+        from reactive.reactive import ReactivableDict, ReactivableList
+
+        address = self.reactivable.address
+        self.assertIsInstance(address, ReactivableDict)
+        self.assertIs(address._value, self.address)
+        self.assertIs(self.reactivable.address, address)
+        self.assertIs(self.reactivable["address"], address)
+
+        hobbies = self.reactivable["hobbies"]
+        self.assertIsInstance(hobbies, ReactivableList)
+        self.assertIsInstance(hobbies[1], ReactivableDict)
+        self.assertEqual(hobbies[1].name, "coding")
+
+    def test_lazy_child_mutation_bubbles_and_undoes(self):
+        """验证惰性封装的子对象变更会冒泡并可撤销"""
+        calls = []
+        self.reactivable.subscribe(calls.append)
+
+        self.reactivable.address.city = "Shanghai"
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.address["city"], "Shanghai")
+
+        self.reactivable.undo()
+        self.assertEqual(self.reactivable.address.city, "Beijing")
+
+    def test_values_and_items_wrap_children(self):
+        """验证惰性模式下 values() / items() 迭代到的子容器也被封装，修改可撤销"""
+        from reactive.reactive import ReactivableDict
+
+        calls = []
+        self.reactivable.subscribe(calls.append)
+        for key, value in self.reactivable.items():
+            if key == "address":
+                value["city"] = "Shanghai"
+        self.assertEqual(len(calls), 1)
+        self.assertIn(self.reactivable.address, self.reactivable.values())
+        self.assertEqual(len(self.reactivable.values()), 3)
+        self.assertTrue(
+            all(
+                isinstance(value, ReactivableDict)
+                for value in self.reactivable.values()
+                if isinstance(value, dict)
+            )
+        )
+        self.reactivable.undo()
+        self.assertEqual(self.address["city"], "Beijing")
+
+    def test_negative_index_child_path(self):
+        """验证用负索引首次访问列表元素时，子对象的键是规范化后的位置"""
+        from reactive.patch import patch_listener
+
+        sent = []
+        self.reactivable._command_manager.add_listener(patch_listener(sent.append))
+        paths = []
+        self.reactivable.subscribe(
+            "hobbies.1.name", lambda path, value: paths.append(path)
+        )
+        self.reactivable["hobbies"][-1]["name"] = "chess"
+
+        self.assertEqual(
+            sent, [[{"op": "add", "path": "/hobbies/1/name", "value": "chess"}]]
+        )
+        self.assertEqual(paths, ["hobbies.1.name"])
+        self.assertEqual(self.reactivable.hobbies[-2:][1].name, "chess")
+
+    def test_assigned_container_is_wrapped(self):
+        """验证赋值的新容器会被封装为子对象（非惰性模式）"""
+        from reactive.reactive import ReactivableDict
+
+        reactivable = ReactivableDict({"name": "Alice"})
+        reactivable.address = {"city": "Beijing"}
+
+        self.assertIsInstance(reactivable.address, ReactivableDict)
+        self.assertIs(reactivable.address._parent, reactivable)
+        self.assertEqual(reactivable.address.city, "Beijing")
+
+
+class TestListBulkOperations(unittest.TestCase):
+    """测试列表批量操作：一条命令、一次通知、一次撤销"""
+
+    def setUp(self):
+        from reactive.reactive import ReactivableDict
+
+        self.root = ReactivableDict({"nums": [3, 1, 2]})
+        self.nums = self.root.nums
+        self.calls = []
+        self.nums.subscribe(self.calls.append)
+
+    def _check_single_command(self, expected, original=(3, 1, 2)):
+        manager = self.root._command_manager
+        self.assertEqual(list(self.nums._value), expected)
+        self.assertEqual(len(manager.undo_stack), 1)
+        self.assertEqual(len(self.calls), 1)
+        self.root.undo()
+        self.assertEqual(list(self.nums._value), list(original))
+        self.root.redo()
+        self.assertEqual(list(self.nums._value), expected)
+
+    def test_extend(self):
+        """验证 extend 和 += 记录为一条命令"""
+        self.nums.extend(range(4, 100))
+        self._check_single_command([3, 1, 2, *range(4, 100)])
+
+    def test_iadd(self):
+        """验证 += 记录为一条命令"""
+        self.root.nums += [4, 5]
+        self._check_single_command([3, 1, 2, 4, 5])
+
+    def test_clear(self):
+        """验证 clear 记录为一条命令"""
+        self.nums.clear()
+        self._check_single_command([])
+
+    def test_sort_and_reverse(self):
+        """验证 sort 和 reverse 各记录为一条命令，顺序不变时不记录"""
+        self.nums.sort()
+        self._check_single_command([1, 2, 3])
+        self.nums.reverse()
+        self.assertEqual(list(self.nums._value), [3, 2, 1])
+        self.nums.sort(key=lambda n: -n)
+        # 已有序时不产生命令
+        self.assertEqual(len(self.root._command_manager.undo_stack), 2)
+
+    def test_remove(self):
+        """验证 remove 记录为一条命令，元素不存在时抛出 ValueError"""
+        self.nums.remove(1)
+        self._check_single_command([3, 2])
+        with self.assertRaises(ValueError):
+            self.nums.remove(42)
+
+    def test_slice_assignment(self):
+        """验证切片赋值、扩展切片赋值和切片删除"""
+        self.nums[1:2] = ["a", "b", "c"]
+        self._check_single_command([3, "a", "b", "c", 2])
+
+    def test_extended_slice(self):
+        """验证扩展切片赋值记录为一条命令，长度不符时抛出 ValueError"""
+        self.nums[::2] = ["x", "y"]
+        self._check_single_command(["x", 1, "y"])
+        with self.assertRaises(ValueError):
+            self.nums[::2] = [1]
+
+    def test_slice_delete(self):
+        """验证扩展切片删除记录为一条命令"""
+        del self.nums[::-2]
+        self._check_single_command([1])
+
+    def test_added_containers_are_wrapped(self):
+        """验证批量加入的 dict / list 被封装为子响应式对象"""
+        from reactive.reactive import ReactivableDict
+
+        self.nums.extend([{"v": 1}, {"v": 2}])
+        self.assertIsInstance(self.nums[4], ReactivableDict)
+        self.nums[4].v = 3
+        self.assertEqual(len(self.calls), 2)
+
+
+class TestDictOperations(unittest.TestCase):
+    """测试字典 API：批量操作为一条命令、一次通知"""
+
+    def setUp(self):
+        from reactive.reactive import ReactivableDict
+
+        self.root = ReactivableDict({"a": 1, "b": 2})
+        self.calls = []
+        self.root.subscribe(self.calls.append)
+
+    def _history(self):
+        return len(self.root._command_manager.undo_stack)
+
+    def test_undo_new_key_removes_it(self):
+        """验证撤销新增键时删除该键，而不是写回 None"""
+        self.root["c"] = 3
+        self.root.d = 4
+        self.root.undo()
+        self.root.undo()
+        self.assertEqual(dict(self.root._value), {"a": 1, "b": 2})
+
+    def test_update(self):
+        """验证 update 为一条命令，撤销恢复旧值并删除新增的键"""
+        self.root.update({"a": 10, "c": {"nested": True}}, d=4)
+        self.assertEqual(self._history(), 1)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.root.c.nested, True)
+
+        self.root.undo()
+        self.assertEqual(dict(self.root._value), {"a": 1, "b": 2})
+        self.root.redo()
+        self.assertEqual(self.root.a, 10)
+        self.assertEqual(self.root.d, 4)
+
+    def test_update_from_pairs(self):
+        """验证 update 接受键值对序列，不带参数时不产生命令"""
+        self.root.update([("x", 1), ("y", 2)])
+        self.assertEqual(self.root["y"], 2)
+        self.root.update()
+        self.assertEqual(self._history(), 1)
+
+    def test_update_without_changes(self):
+        """验证所有键的值都没有变化时 update 不产生命令、不通知"""
+        self.root.update(a=1, b=2)
+        self.assertEqual(self._history(), 0)
+        self.assertEqual(self.calls, [])
+        # 只有变化的键进入命令；相等但类型不同的值仍算变化
+        self.root.update(a=1, b=True)
+        self.assertEqual(self._history(), 1)
+        self.assertEqual(self.root._command_manager.undo_stack[-1].new, {"b": True})
+
+    def test_setdefault(self):
+        """验证 setdefault 只在键不存在时写入，并返回封装后的值"""
+        from reactive.reactive import ReactivableList
+
+        self.assertEqual(self.root.setdefault("a", 100), 1)
+        self.assertEqual(self._history(), 0)
+        self.assertIsInstance(self.root.setdefault("c", []), ReactivableList)
+        self.assertEqual(self._history(), 1)
+
+    def test_pop_and_popitem(self):
+        """验证 pop、popitem 的返回值、默认值和 KeyError，以及撤销"""
+        self.assertEqual(self.root.pop("a"), 1)
+        self.assertEqual(self.root.pop("missing", None), None)
+        with self.assertRaises(KeyError):
+            self.root.pop("missing")
+        self.assertEqual(self.root.popitem(), ("b", 2))
+        with self.assertRaises(KeyError):
+            self.root.popitem()
+        self.root.undo()
+        self.root.undo()
+        self.assertEqual(dict(self.root._value), {"a": 1, "b": 2})
+
+    def test_clear(self):
+        """验证 clear 记录为一条命令、通知一次，撤销后恢复全部键"""
+        self.root.clear()
+        self.assertEqual(len(self.root), 0)
+        self.assertEqual(len(self.calls), 1)
+        self.root.undo()
+        self.assertEqual(dict(self.root._value), {"a": 1, "b": 2})
+
+
+class TestSnapshot(unittest.TestCase):
+    """测试写时复制快照"""
+
+    def setUp(self):
+        from reactive.reactive import ReactivableDict
+
+        self.root = ReactivableDict(
+            {
+                "title": "doc",
+                "address": {"city": "Beijing"},
+                "users": [{"name": "a"}, {"name": "b"}],
+            }
+        )
+
+    def test_snapshot_is_immutable_and_isolated(self):
+        """验证快照只读，且不受之后修改的影响"""
+        snap = self.root.snapshot()
+        self.assertEqual(snap["address"]["city"], "Beijing")
+        self.assertEqual(snap["users"][1]["name"], "b")
+        with self.assertRaises(TypeError):
+            snap["title"] = "x"
+
+        self.root.address.city = "Shanghai"
+        self.root.users.append({"name": "c"})
+        self.assertEqual(snap["address"]["city"], "Beijing")
+        self.assertEqual(len(snap["users"]), 2)
+
+        latest = self.root.snapshot()
+        self.assertEqual(latest["address"]["city"], "Shanghai")
+        self.assertEqual(latest["users"][2]["name"], "c")
+
+    def test_unchanged_snapshot_is_cached(self):
+        """验证没有变化时返回同一个快照"""
+        self.assertIs(self.root.snapshot(), self.root.snapshot())
+
+    def test_structural_sharing(self):
+        """验证修改后只重建被修改的路径，未变化的子树复用原快照"""
+        before = self.root.snapshot()
+        self.root.users[0].name = "z"
+        after = self.root.snapshot()
+
+        self.assertIsNot(after, before)
+        self.assertIsNot(after["users"], before["users"])
+        self.assertIsNot(after["users"][0], before["users"][0])
+        self.assertIs(after["users"][1], before["users"][1])
+        self.assertIs(after["address"], before["address"])
+
+    def test_undo_invalidates_snapshot(self):
+        self.root.address.city = "Shanghai"
+        self.assertEqual(self.root.snapshot()["address"]["city"], "Shanghai")
+        self.root.undo()
+        self.assertEqual(self.root.snapshot()["address"]["city"], "Beijing")
+
+    def test_lazy_snapshot(self):
+        """验证惰性模式下的快照"""
+        from reactive.reactive import ReactivableDict
+
+        root = ReactivableDict({"a": {"b": [1, {"c": 2}]}}, lazy=True)
+        snap = root.snapshot()
+        self.assertEqual(snap["a"]["b"][1]["c"], 2)
+        root.a.b[1].c = 3
+        self.assertEqual(root.snapshot()["a"]["b"][1]["c"], 3)
+        self.assertEqual(snap["a"]["b"][1]["c"], 2)
+
+
+class TestReactivableArray(unittest.TestCase):
+    """测试基于 array.array 的类型化数值序列"""
+
+    def setUp(self):
+        from array import array
+
+        from reactive.reactive import ReactivableDict
+
+        self.root = ReactivableDict({"series": array("d", [0.0] * 10)})
+        self.series = self.root.series
+        self.calls = []
+        self.root.subscribe(self.calls.append)
+
+    def test_assigned_array_is_wrapped(self):
+        from reactive.reactive import ReactivableArray
+
+        self.assertIsInstance(self.series, ReactivableArray)
+        self.assertEqual(self.series.typecode, "d")
+        self.root.other = ReactivableArray(range(3), typecode="i")
+        self.assertEqual(self.root.other.tolist(), [0, 1, 2])
+
+    def test_range_write_is_one_command(self):
+        """验证区间写入记录为一条命令，只保存区间的旧字节"""
+        self.series.write(2, [1.0, 2.0, 3.0])
+        self.assertEqual(self.series.tolist()[:6], [0.0, 0.0, 1.0, 2.0, 3.0, 0.0])
+        self.assertEqual(len(self.calls), 1)
+
+        command = self.root._command_manager.undo_stack[-1]
+        self.assertEqual((command.start, command.stop), (2, 5))
+        self.assertEqual(command.old, bytes(3 * 8))
+
+        self.root.undo()
+        self.assertEqual(self.series.tolist(), [0.0] * 10)
+        self.root.redo()
+        self.assertEqual(self.series[4], 3.0)
+
+        with self.assertRaises(IndexError):
+            self.series.write(8, [1.0, 2.0, 3.0])
+
+    def test_item_and_slice_assignment(self):
+        self.series[-1] = 9.5
+        self.series[0:2] = [1.0, 1.5]
+        self.assertEqual(self.series[9], 9.5)
+        self.assertEqual(self.series[1], 1.5)
+        with self.assertRaises(ValueError):
+            self.series[::2] = [0.0] * 5
+        self.root.undo()
+        self.root.undo()
+        self.assertEqual(self.series.tolist(), [0.0] * 10)
+
+    def test_resize_operations(self):
+        self.series.append(1.0)
+        self.series.extend([2.0, 3.0])
+        self.series.insert(0, -1.0)
+        self.assertEqual(self.series.pop(), 3.0)
+        del self.series[1:5]
+        self.assertEqual(len(self.series), 9)
+        self.assertEqual(self.series[0], -1.0)
+        self.root.undo_to(0)
+        self.assertEqual(self.series.tolist(), [0.0] * 10)
+
+    def test_view_is_zero_copy_and_read_only(self):
+        """验证 view() 零拷贝地反映最新数据且只读"""
+        with self.series.view() as view:
+            self.series[3] = 4.0
+            self.assertEqual(view[3], 4.0)
+            with self.assertRaises(TypeError):
+                view[0] = 1.0
+            # 视图存在期间不能改变长度
+            with self.assertRaises(BufferError):
+                self.series.append(1.0)
+
+    def test_snapshot_and_patch(self):
+        """验证快照和补丁导出"""
+        from array import array
+
+        from reactive.patch import _plain, apply_patch, patch_listener
+        from reactive.reactive import ReactivableDict
+
+        snap = self.root.snapshot()
+        self.series[0] = 1.0
+        self.assertEqual(snap["series"][0], 0.0)
+        self.assertEqual(self.root.snapshot()["series"][0], 1.0)
+
+        remote = ReactivableDict({"series": array("d", self.series._value)})
+        sent = []
+        self.root._command_manager.add_listener(patch_listener(sent.append))
+        self.series.write(5, [5.0, 6.0])
+        self.series.extend([7.0])
+        del self.series[0]
+        self.root.undo()
+        for ops in sent:
+            apply_patch(remote, ops)
+        self.assertEqual(_plain(remote), _plain(self.root))
+
+
+class TestChangeRecords(unittest.TestCase):
+    """测试以结构化变更记录投递的观察者"""
+
+    def _make(self, mode="manual"):
+        from reactive.reactive import (
+            DELIVER_CHANGES,
+            CommandManager,
+            NotifyScheduler,
+            ReactivableDict,
+        )
+
+        root = ReactivableDict(
+            {"title": "", "address": {"city": "Beijing"}, "rows": [1, 2, 3]},
+            command_manager=CommandManager(scheduler=NotifyScheduler(mode)),
+        )
+        batches = []
+        root.subscribe(batches.append, delivery=DELIVER_CHANGES)
+        return root, batches
+
+    def test_records_aggregated_per_flush(self):
+        """验证一次 flush 收到按顺序排列的全部记录，路径相对订阅者"""
+        root, batches = self._make()
+        root.title = "hello"
+        root.address.zip = "100000"
+        del root.address["city"]
+        self.assertEqual(batches, [])
+        root.flush()
+
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(
+            [(c.op, c.path, c.key, c.old, c.new) for c in batches[0]],
+            [
+                ("set", (), "title", "", "hello"),
+                ("add", ("address",), "zip", None, "100000"),
+                ("delete", ("address",), "city", "Beijing", None),
+            ],
+        )
+        self.assertIs(batches[0][1].target, root.address)
+
+        # 没有变更时不调用
+        root.flush()
+        self.assertEqual(len(batches), 1)
+
+    def test_splice_records_replay_list(self):
+        """验证列表的 splice 记录（含撤销）可以在普通列表上重放"""
+        root, batches = self._make("sync")
+        mirror = [1, 2, 3]
+        rows = root.rows
+        rows.append(4)
+        rows.insert(0, 0)
+        rows.pop(2)
+        rows.extend([5, 6])
+        rows[1:3] = [9]
+        rows.sort()
+        root.undo()
+        root.undo()
+        with root.batch_update():
+            rows.append(7)
+            rows.append(8)
+
+        for batch in batches:
+            for change in batch:
+                self.assertEqual(change.op, "splice")
+                self.assertEqual(change.path, ("rows",))
+                self.assertEqual(list(change.old), mirror[change.key : change.stop])
+                mirror[change.key : change.stop] = change.new
+        self.assertEqual(mirror, list(rows))
+        # 事务中的两次追加在一次通知中，位置各自正确
+        self.assertEqual([(c.key, c.new) for c in batches[-1]], [(6, (7,)), (7, (8,))])
+
+    def test_records_freeze_containers(self):
+        """验证记录中的容器是当时的快照：跨排序和子对象修改撤销后，按顺序重放与实时树一致"""
+        import copy
+
+        from reactive.reactive import DELIVER_CHANGES, ReactivableDict
+
+        root = ReactivableDict({"rows": [{"k": 2}, {"k": 1}]})
+        batches = []
+        root.subscribe(batches.append, delivery=DELIVER_CHANGES)
+        root._command_manager.checkpoint("start")
+        root.rows[0]["z"] = 1
+        root.rows.sort(key=lambda row: row["k"])
+        mirror = copy.deepcopy(root.to_plain())
+        root.undo_to("start")
+
+        rows = mirror["rows"]
+        for change in batches[-1]:
+            if change.op == "splice":
+                rows[change.key : change.stop] = [dict(row) for row in change.new]
+            else:
+                self.assertEqual(change.op, "delete")
+                del rows[change.path[-1]][change.key]
+        self.assertEqual(mirror, root.to_plain())
+
+    def test_undo_records_and_child_subscription(self):
+        """验证撤销产生逆向记录，子对象上的订阅只收到自己的变更"""
+        from reactive.reactive import DELIVER_CHANGES
+
+        root, batches = self._make("sync")
+        child = []
+        root.address.subscribe(child.append, delivery=DELIVER_CHANGES)
+        root.update(title="x", extra=1)
+        root.address.city = "Shanghai"
+        root.undo()
+        root.undo()
+
+        self.assertEqual(
+            [(c.op, c.key, c.old, c.new) for c in batches[-1]],
+            [("delete", "extra", 1, None), ("set", "title", "x", "")],
+        )
+        self.assertEqual(len(child), 2)
+        self.assertEqual(
+            [(c.op, c.path, c.old, c.new) for c in child[1]],
+            [("set", (), "Shanghai", "Beijing")],
+        )
+
+    def test_undo_clear_records(self):
+        """验证撤销 clear 时被删除的键产生 add 记录，并保持原来的顺序"""
+        root, batches = self._make("sync")
+        root.address.clear()
+        root.undo()
+        self.assertEqual(
+            [(c.op, c.key, c.old, c.new) for c in batches[-1]],
+            [("add", "city", None, "Beijing")],
+        )
+
+    def test_batch_paths_computed_when_each_command_runs(self):
+        """验证批量更新和撤销时，每条记录的路径按该命令执行那一刻的树计算"""
+        from reactive.reactive import DELIVER_CHANGES, ReactivableDict
+
+        root = ReactivableDict({"users": [{"name": "A"}, {"name": "b"}]})
+        batches = []
+        root.subscribe(batches.append, delivery=DELIVER_CHANGES)
+        with root.batch_update():
+            root.users[1].name = "B"
+            root.users.insert(0, {"name": "Z"})
+        root.undo()
+
+        self.assertEqual(
+            [(c.op, c.path, c.key) for c in batches[0]],
+            [("set", ("users", 1), "name"), ("splice", ("users",), 0)],
+        )
+        self.assertEqual(
+            [(c.op, c.path, c.key) for c in batches[1]],
+            [("splice", ("users",), 0), ("set", ("users", 1), "name")],
+        )
+
+    def test_value_mode_and_unsubscribe(self):
+        """验证旧的投递方式不变，取消订阅后不再记录变更"""
+        root, batches = self._make("sync")
+        values = []
+        root.subscribe(values.append)
+        scheduler = root._command_manager.scheduler
+        self.assertEqual(scheduler.change_subscriptions, 1)
+
+        root.title = "a"
+        self.assertIs(values[0], root._value)
+        self.assertEqual(len(batches), 1)
+
+        root.notify()
+        self.assertIsNone(batches[-1])
+
+        root.unsubscribe(batches.append)
+        self.assertEqual(scheduler.change_subscriptions, 0)
+        root.title = "b"
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(scheduler._records, [])
+
+        with self.assertRaises(ValueError):
+            root.subscribe(print, delivery="diff")
+
+    def test_lagging_async_observer_receives_merged_records(self):
+        """验证异步变更记录观察者落后时记录被合并而不是丢弃"""
+        import asyncio
+
+        from reactive.reactive import DELIVER_CHANGES
+
+        root, _ = self._make("sync")
+        seen = []
+
+        async def observer(changes):
+            await asyncio.sleep(0.01)
+            seen.append([change.new for change in changes])
+
+        root.subscribe(observer, delivery=DELIVER_CHANGES)
+
+        async def main():
+            for i in range(1, 6):
+                root.title = str(i)
+            await root.flush()
+
+        asyncio.run(main())
+        self.assertEqual(seen, [["1"], ["2", "3", "4", "5"]])
+        self.assertEqual(root._command_manager.scheduler.dropped, 0)
+
+
+class TestPathSubscription(unittest.TestCase):
+    """测试按路径订阅"""
+
+    def setUp(self):
+        from reactive.reactive import ReactivableDict
+
+        self.root = ReactivableDict(
+            {
+                "name": "Alice",
+                "address": {"city": "Beijing", "zip": "100000"},
+                "users": [{"name": "a", "age": 1}, {"name": "b", "age": 2}],
+            }
+        )
+        self.calls = []
+
+    def _record(self, path, value):
+        self.calls.append((path, value))
+
+    def test_exact_path(self):
+        """验证只有匹配路径的变更才通知"""
+        self.root.subscribe("address.city", self._record)
+
+        self.root.address.zip = "200000"
+        self.root.name = "Bob"
+        self.assertEqual(self.calls, [])
+
+        self.root.address.city = "Shanghai"
+        self.assertEqual(self.calls, [("address.city", "Shanghai")])
+
+    def test_negative_index(self):
+        """验证用负索引赋值时按规范化后的位置匹配路径"""
+        self.root.subscribe("users.1", self._record)
+        self.root.users[-1] = {"name": "c", "age": 3}
+
+        self.assertEqual([path for path, _ in self.calls], ["users.1"])
+        self.assertEqual(self.root._command_manager.undo_stack[-1].key, 1)
+
+    def test_ancestor_replacement(self):
+        """验证订阅路径的祖先被整体替换时也会通知"""
+        self.root.subscribe("address.city", self._record)
+
+        self.root.address = {"city": "Hangzhou"}
+        self.assertEqual(len(self.calls), 1)
+        path, value = self.calls[0]
+        self.assertEqual(path, "address")
+        self.assertEqual(value.city, "Hangzhou")
+
+    def test_wildcards(self):
+        """验证 * 匹配一段、** 匹配任意后代"""
+        names, anything = [], []
+        self.root.subscribe("users.*.name", lambda p, v: names.append(p))
+        self.root.subscribe("address.**", lambda p, v: anything.append(p))
+
+        self.root.users[1].name = "c"
+        self.root.users[0].age = 10
+        self.root.address.city = "Xian"
+
+        self.assertEqual(names, ["users.1.name"])
+        self.assertEqual(anything, ["address.city"])
+
+    def test_list_structure_change(self):
+        """验证列表增删时通知订阅了该列表的路径"""
+        self.root.subscribe("users", self._record)
+        self.root.users.append({"name": "d", "age": 4})
+        self.assertEqual(self.calls[0][0], "users")
+
+    def test_subscription_relative_to_child(self):
+        """验证在子对象上订阅时路径相对于该子对象"""
+        self.root.address.subscribe("city", self._record)
+        self.root.address.city = "Wuhan"
+        self.assertEqual(self.calls, [("city", "Wuhan")])
+
+    def test_batch_coalesces_path_notifications(self):
+        """验证批量更新中同一位置的多次变更只通知一次"""
+        self.root.subscribe("address.city", self._record)
+        with self.root.batch_update():
+            self.root.address.city = "A"
+            self.root.address.city = "B"
+        self.assertEqual(self.calls, [("address.city", "B")])
+
+    def test_unsubscribe(self):
+        """验证取消订阅后不再通知"""
+        self.root.subscribe("name", self._record)
+        self.root.unsubscribe("name", self._record)
+        self.root.name = "Eve"
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.root._command_manager.scheduler.path_subscriptions, 0)
+
+    def test_invalid_pattern_raises_error(self):
+        """验证 ** 不在末尾时抛出 ValueError"""
+        with self.assertRaises(ValueError):
+            self.root.subscribe("**.name", self._record)
+
+
+class TestComputed(unittest.TestCase):
+    """测试派生值"""
+
+    def setUp(self):
+        from reactive.reactive import ReactivableDict
+
+        self.root = ReactivableDict(
+            {"price": 10, "qty": 2, "note": "", "scores": [1, 2, 3]}
+        )
+        self.runs = []
+
+        def total(r):
+            self.runs.append("total")
+            return r.price * r.qty
+
+        self.total = self.root.computed("total", total)
+
+    def test_cached_until_dependency_changes(self):
+        """验证结果被缓存，无关键的变更不会触发重新计算"""
+        self.assertEqual(self.root.total, 20)
+        self.assertEqual(self.root.total, 20)
+        self.assertEqual(self.runs, ["total"])
+
+        self.root.note = "hello"
+        self.assertFalse(self.total.dirty)
+        self.assertEqual(self.root.total, 20)
+        self.assertEqual(self.runs, ["total"])
+
+        self.root.qty = 3
+        self.assertTrue(self.total.dirty)
+        self.assertEqual(self.root.total, 30)
+        self.assertEqual(self.runs, ["total", "total"])
+
+    def test_undo_invalidates(self):
+        """验证撤销、重做也会使派生值失效"""
+        self.root.price = 100
+        self.assertEqual(self.root.total, 200)
+        self.root.undo()
+        self.assertEqual(self.root.total, 20)
+        self.root.redo()
+        self.assertEqual(self.root.total, 200)
+
+    def test_dynamic_dependencies(self):
+        """验证依赖随分支变化：不再读取的键不会再触发失效"""
+        self.root.flag = True
+        self.root.a = 1
+        self.root.b = 2
+        runs = []
+
+        def pick(r):
+            runs.append(1)
+            return r.a if r.flag else r.b
+
+        choice = self.root.computed("choice", pick)
+        self.assertEqual(choice.value, 1)
+        self.root.b = 3
+        self.assertFalse(choice.dirty)
+
+        self.root.flag = False
+        self.assertEqual(choice.value, 3)
+        self.root.a = 5
+        self.assertFalse(choice.dirty)
+        self.assertEqual(len(runs), 2)
+
+    def test_tracking_is_per_thread(self):
+        """验证其他线程计算派生值期间，本线程的读取不会被记为它的依赖"""
+        import threading
+
+        started, release = threading.Event(), threading.Event()
+
+        def slow(r):
+            started.set()
+            release.wait(5)
+            return r.price
+
+        slow_value = self.root.computed("slow", slow)
+        worker = threading.Thread(target=lambda: slow_value.value)
+        worker.start()
+        started.wait(5)
+        self.root.note
+        release.set()
+        worker.join()
+
+        self.root.note = "hello"
+        self.assertFalse(slow_value.dirty)
+
+    def test_list_dependency(self):
+        """验证列表元素增删使依赖它的派生值失效"""
+        total = self.root.computed("sum", lambda r: sum(r.scores))
+        self.assertEqual(total.value, 6)
+        self.root.scores.append(4)
+        self.assertEqual(total.value, 10)
+        self.root.scores.pop(0)
+        self.assertEqual(total.value, 9)
+
+    def test_computed_of_computed(self):
+        """验证派生值可以依赖其他派生值"""
+        with_tax = self.root.computed("with_tax", lambda r: r.total * 2)
+        self.assertEqual(with_tax.value, 40)
+        self.root.price = 5
+        self.assertTrue(with_tax.dirty)
+        self.assertEqual(with_tax.value, 20)
+
+    def test_diamond_is_glitch_free(self):
+        """验证菱形依赖只通知一次，且观察者不会看到中间状态"""
+        self.root.computed("double", lambda r: r.price * 2)
+        self.root.computed("triple", lambda r: r.price * 3)
+        both = self.root.computed("both", lambda r: (r.price, r.double, r.triple))
+        seen = []
+        both.subscribe(seen.append)
+
+        self.root.price = 7
+        self.assertEqual(seen, [(7, 14, 21)])
+
+        with self.root.batch_update():
+            self.root.price = 8
+            self.root.price = 9
+            self.assertEqual(seen, [(7, 14, 21)])
+        self.assertEqual(seen, [(7, 14, 21), (9, 18, 27)])
+
+    def test_unchanged_value_not_notified(self):
+        """验证重新计算后值不变时不通知观察者"""
+        seen = []
+        parity = self.root.computed("parity", lambda r: r.qty % 2)
+        parity.subscribe(seen.append)
+        self.root.qty = 4
+        self.assertEqual(seen, [])
+        self.root.qty = 5
+        self.assertEqual(seen, [1])
+
+    def test_reads_in_transaction_are_consistent(self):
+        """验证事务中读取派生值得到的是最新状态"""
+        with self.root.batch_update():
+            self.root.qty = 5
+            self.assertEqual(self.root.total, 50)
+
+
 class TestCommand(unittest.TestCase):
     """测试 Command 基类和具体命令的实现"""
 
@@ -328,16 +1284,20 @@ class TestCommand(unittest.TestCase):
 
 
 class TestCommandManager(unittest.TestCase):
-    """测试 CommandManager 全局单例的实现"""
+    """测试 CommandManager 的实现"""
 
-    def test_command_manager_is_singleton(self):
-        """验证 CommandManager 是一个全局单例"""
-        from reactive.reactive import CommandManager
+    def test_command_manager_instances_are_independent(self):
+        """验证每个 CommandManager 实例拥有独立的历史"""
+        from reactive.reactive import CommandManager, ReactivableDict, SetItemCommand
 
-        # 多次获取 CommandManager 应该返回同一个实例
         manager1 = CommandManager()
         manager2 = CommandManager()
-        self.assertEqual(manager1, manager2)
+        self.assertIsNot(manager1, manager2)
+
+        reactivable = ReactivableDict({"name": "Alice"})
+        manager1.execute(SetItemCommand(reactivable, "name", "Bob", "Alice"))
+        self.assertEqual(len(manager1.undo_stack), 1)
+        self.assertEqual(len(manager2.undo_stack), 0)
 
     def test_command_manager_execute(self):
         """验证 execute() 方法执行命令并添加到 undo_stack"""
@@ -345,7 +1305,6 @@ class TestCommandManager(unittest.TestCase):
 
         # 创建一个 CommandManager
         manager = CommandManager()
-        manager.clear_history()
 
         # 创建一个 ReactivableDict
         data = {"name": "Alice"}
@@ -369,7 +1328,6 @@ class TestCommandManager(unittest.TestCase):
 
         # 创建一个 CommandManager
         manager = CommandManager()
-        manager.clear_history()
 
         # 创建一个 ReactivableDict
         data = {"name": "Alice"}
@@ -401,7 +1359,6 @@ class TestCommandManager(unittest.TestCase):
 
         # 创建一个 CommandManager
         manager = CommandManager()
-        manager.clear_history()
 
         # 创建一个 ReactivableDict
         data = {"name": "Alice", "age": 30}
@@ -424,6 +1381,1313 @@ class TestCommandManager(unittest.TestCase):
         # 验证事务期间的多个命令被合并为一个 CompositeCommand
         self.assertEqual(len(manager.undo_stack), 1)
 
+    def test_history_depth_limit_drops_oldest(self):
+        """验证历史超出深度时丢弃最旧的命令"""
+        from reactive.reactive import CommandManager, ReactivableDict, SetItemCommand
+
+        manager = CommandManager(max_depth=3)
+        reactivable = ReactivableDict({"n": 0})
+        for i in range(1, 6):
+            manager.execute(SetItemCommand(reactivable, "n", i, i - 1))
+
+        # 只保留最近 3 条命令
+        self.assertEqual(len(manager.undo_stack), 3)
+        self.assertEqual(manager.undo_stack[0].new_value, 3)
+        self.assertEqual(manager.undo_stack[-1].new_value, 5)
+
+    def test_set_max_depth_keeps_newest(self):
+        """验证缩小深度时保留最新的命令"""
+        from reactive.reactive import CommandManager, ReactivableDict, SetItemCommand
+
+        manager = CommandManager()
+        reactivable = ReactivableDict({"n": 0})
+        for i in range(1, 11):
+            manager.execute(SetItemCommand(reactivable, "n", i, i - 1))
+
+        manager.set_max_depth(4)
+        self.assertEqual([c.new_value for c in manager.undo_stack], [7, 8, 9, 10])
+
+        with self.assertRaises(ValueError):
+            manager.set_max_depth(0)
+        with self.assertRaises(ValueError):
+            CommandManager(max_depth=0)
+
+    def test_memory_usage_grows_with_history(self):
+        """验证 memory_usage() 随历史长度增长"""
+        from reactive.reactive import CommandManager, ReactivableDict, SetItemCommand
+
+        manager = CommandManager()
+        empty = manager.memory_usage()
+
+        reactivable = ReactivableDict({"n": 0})
+        for i in range(10):
+            manager.execute(SetItemCommand(reactivable, "n", i, i - 1))
+
+        self.assertGreater(manager.memory_usage(), empty)
+
+    def test_byte_budget_evicts_oldest(self):
+        """验证历史超出字节预算时从最旧的命令开始淘汰，最新的一条总是保留"""
+        from reactive.reactive import CommandManager, ReactivableDict
+
+        manager = CommandManager(max_depth=1000, max_bytes=1_000_000)
+        root = ReactivableDict({"data": []}, command_manager=manager)
+        for i in range(5):
+            # 每条命令的新旧值各约 180 KB
+            root.data = list(range(i, i + 5_000))
+
+        self.assertLessEqual(manager.history_bytes, 1_000_000)
+        self.assertLess(len(manager.undo_stack), 5)
+        self.assertEqual(manager.eviction_count, 5 - len(manager.undo_stack))
+        root.undo()
+        self.assertEqual(root.data[0], 3)
+
+        # 单条命令超出预算时仍然保留
+        manager.max_bytes = 1_000
+        root.data = list(range(100))
+        self.assertEqual(len(manager.undo_stack), 1)
+
+    def test_budget_set_after_construction(self):
+        """验证创建后才设置字节预算时，已有的历史也计入并按预算淘汰"""
+        from reactive.reactive import CommandManager, ReactivableDict
+
+        def len_sizer(command):
+            return len(command.new_value)
+
+        manager = CommandManager(sizer=len_sizer)
+        root = ReactivableDict({"s": ""}, command_manager=manager)
+        for i in range(1, 6):
+            root.s = "x" * i
+        root.undo()
+
+        manager.max_bytes = 100
+        self.assertEqual(manager.history_bytes, 15)
+        manager.max_bytes = 9
+        self.assertEqual([len(c.new_value) for c in manager.undo_stack], [4])
+        self.assertEqual(len(manager.redo_stack), 1)
+        self.assertEqual(manager.history_bytes, 9)
+        self.assertEqual(manager.eviction_count, 3)
+        with self.assertRaises(ValueError):
+            manager.max_bytes = 0
+
+    def test_small_edits_kept_within_budget(self):
+        """验证小命令不受字节预算影响，只受深度限制"""
+        from reactive.reactive import CommandManager, ReactivableDict
+
+        manager = CommandManager(max_depth=500, max_bytes=10_000_000)
+        root = ReactivableDict({"n": 0}, command_manager=manager)
+        for i in range(1, 1001):
+            root.n = i
+        self.assertEqual(len(manager.undo_stack), 500)
+        self.assertEqual(manager.eviction_count, 500)
+
+    def test_history_bytes_tracks_all_operations(self):
+        """验证撤销、重做、清空重做栈后 history_bytes 与逐条估算一致"""
+        from reactive.reactive import CommandManager, ReactivableDict
+
+        def len_sizer(command):
+            return len(command.new_value)
+
+        manager = CommandManager(max_depth=3, max_bytes=10_000_000, sizer=len_sizer)
+        root = ReactivableDict({"s": ""}, command_manager=manager)
+
+        def expected():
+            return sum(len_sizer(c) for c in (*manager.undo_stack, *manager.redo_stack))
+
+        for i in range(1, 6):
+            root.s = "x" * i
+            self.assertEqual(manager.history_bytes, expected())
+        root.undo()
+        root.undo()
+        self.assertEqual(manager.history_bytes, expected())
+        root.redo()
+        root.s = "new"
+        self.assertEqual(manager.history_bytes, expected())
+        manager.set_max_depth(1)
+        self.assertEqual(manager.history_bytes, expected())
+        manager.clear_history()
+        self.assertEqual(manager.history_bytes, 0)
+
+    def test_estimate_size_scales_with_payload(self):
+        """验证默认估算随数据规模增长"""
+        from reactive.reactive import ReactivableDict, SetItemCommand, estimate_size
+
+        root = ReactivableDict({"data": None})
+        small = estimate_size(SetItemCommand(root, "data", [1], None))
+        large = estimate_size(SetItemCommand(root, "data", list(range(100_000)), None))
+        self.assertGreater(large, 100_000 * 8)
+        self.assertLess(small, 1_000)
+
+
+class TestHistoryNavigation(unittest.TestCase):
+    """测试跳转到任意历史位置和命名检查点"""
+
+    def setUp(self):
+        from reactive.reactive import ReactivableDict
+
+        self.root = ReactivableDict({"n": 0, "todos": []})
+        self.manager = self.root._command_manager
+        self.calls = []
+        self.root.subscribe(self.calls.append)
+
+    def test_undo_to_and_redo_to(self):
+        """验证多步跳转只通知一次"""
+        for i in range(1, 51):
+            self.root.n = i
+        self.assertEqual(self.manager.position, 50)
+        self.calls.clear()
+
+        self.assertEqual(self.root.undo_to(10), 40)
+        self.assertEqual(self.root.n, 10)
+        self.assertEqual(self.manager.position, 10)
+        self.assertEqual(len(self.calls), 1)
+
+        self.assertEqual(self.root.redo_to(45), 35)
+        self.assertEqual(self.root.n, 45)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_checkpoints(self):
+        """验证命名检查点"""
+        self.root.todos.append("a")
+        self.manager.checkpoint("saved")
+        self.root.todos.append("b")
+        self.root.n = 1
+
+        self.root.undo_to("saved")
+        self.assertEqual(list(self.root.todos._value), ["a"])
+        self.assertEqual(self.root.n, 0)
+        self.root.redo_to(self.manager.position + 2)
+        self.assertEqual(self.root.n, 1)
+        with self.assertRaises(KeyError):
+            self.root.undo_to("missing")
+
+    def test_checkpoint_stops_coalescing(self):
+        """验证检查点之后的修改不会合并进检查点之前的命令"""
+        from reactive.reactive import CoalescePolicy, CommandManager, ReactivableDict
+
+        root = ReactivableDict(
+            {"text": ""},
+            command_manager=CommandManager(coalesce=CoalescePolicy(window=None)),
+        )
+        root.text = "a"
+        root._command_manager.checkpoint("a")
+        root.text = "ab"
+        root.undo_to("a")
+        self.assertEqual(root.text, "a")
+
+    def test_out_of_range_raises_error(self):
+        """验证跳转到不可达的位置抛出 ValueError"""
+        from reactive.reactive import CommandManager, ReactivableDict
+
+        root = ReactivableDict({"n": 0}, command_manager=CommandManager(max_depth=5))
+        for i in range(1, 11):
+            root.n = i
+        # 前 5 条已被淘汰
+        self.assertEqual(root._command_manager.position, 10)
+        with self.assertRaises(ValueError):
+            root.undo_to(4)
+        with self.assertRaises(ValueError):
+            root.redo_to(11)
+        root.undo_to(5)
+        self.assertEqual(root.n, 5)
+
+    def test_dead_entries_inside_range(self):
+        """验证跳转范围内有失效的历史时不会越过目标位置"""
+        from reactive.reactive import CommandManager, ReactivableDict
+
+        manager = CommandManager()
+        keep = ReactivableDict({"n": 0}, command_manager=manager)
+        dropped = ReactivableDict({"n": 0}, command_manager=manager)
+        for i in range(1, 4):
+            keep.n = i
+        manager.checkpoint("cp")
+        dropped.n = 1
+        del dropped
+        keep.n = 4
+
+        keep.undo_to("cp")
+        self.assertEqual(keep.n, 3)
+        self.assertEqual(manager.position, 3)
+        keep.undo_to(0)
+        # 失效的命令已丢弃，检查点之后的位置前移一位
+        keep.redo_to(manager.checkpoints["cp"])
+        self.assertEqual(keep.n, 3)
+        keep.redo_to(4)
+        self.assertEqual(keep.n, 4)
+
+    def test_prune_keeps_checkpoints(self):
+        """验证 prune() 之后检查点仍指向原来的状态"""
+        from reactive.reactive import CommandManager, ReactivableDict
+
+        manager = CommandManager()
+        keep = ReactivableDict({"n": 0}, command_manager=manager)
+        dropped = ReactivableDict({"n": 0}, command_manager=manager)
+        keep.n = 1
+        manager.checkpoint("one")
+        dropped.n = 1
+        keep.n = 2
+        manager.checkpoint("two")
+        keep.n = 3
+        manager.undo()
+        del dropped
+
+        self.assertEqual(manager.prune(), 1)
+        keep.undo_to("one")
+        self.assertEqual(keep.n, 1)
+        keep.redo_to("two")
+        self.assertEqual(keep.n, 2)
+        keep.redo_to(manager.position + 1)
+        self.assertEqual(keep.n, 3)
+
+    def test_listeners_see_every_step(self):
+        """验证历史监听器仍然逐条收到撤销的命令"""
+        actions = []
+        self.manager.add_listener(lambda action, command: actions.append(action))
+        for i in range(1, 4):
+            self.root.n = i
+        self.root.undo_to(0)
+        self.assertEqual(actions, ["execute"] * 3 + ["undo"] * 3)
+
+
+class TestWeakReferences(unittest.TestCase):
+    """测试命令和子对象的弱引用"""
+
+    def test_history_does_not_keep_documents_alive(self):
+        """验证共享历史不会让已丢弃的文档继续存活"""
+        import weakref
+
+        from reactive.reactive import CommandManager, ReactivableDict
+
+        manager = CommandManager()
+        doc = ReactivableDict(
+            {"title": "", "body": {"rev": 0}}, command_manager=manager
+        )
+        doc.body.rev = 1
+        ref = weakref.ref(doc)
+        del doc
+
+        self.assertIsNone(ref())
+        self.assertFalse(manager.undo_stack[-1].alive)
+
+    def test_undo_skips_dead_entries(self):
+        """验证撤销时跳过目标已被回收的历史"""
+        from reactive.reactive import CommandManager, ReactivableDict
+
+        manager = CommandManager()
+        kept = ReactivableDict({"n": 0}, command_manager=manager)
+        dropped = ReactivableDict({"n": 0}, command_manager=manager)
+        kept.n = 1
+        dropped.n = 1
+        del dropped
+
+        manager.undo()
+        self.assertEqual(kept.n, 0)
+        self.assertEqual(len(manager.undo_stack), 0)
+        self.assertEqual(len(manager.redo_stack), 1)
+
+    def test_prune(self):
+        """验证 prune() 移除失效历史，复合命令只要有存活目标就保留"""
+        from reactive.reactive import CommandManager, ReactivableDict
+
+        manager = CommandManager()
+        kept = ReactivableDict({"n": 0}, command_manager=manager)
+        dropped = ReactivableDict({"n": 0}, command_manager=manager)
+        dropped.n = 1
+        with manager.transaction():
+            kept.n = 1
+            dropped.n = 2
+        del dropped
+
+        self.assertEqual(manager.prune(), 1)
+        self.assertEqual(len(manager.undo_stack), 1)
+        manager.undo()
+        self.assertEqual(kept.n, 0)
+
+    def test_detached_child_does_not_keep_parent_alive(self):
+        """验证子对象只弱引用父对象"""
+        import weakref
+
+        from reactive.reactive import ReactivableDict
+
+        root = ReactivableDict({"address": {"city": "Beijing"}})
+        address = root.address
+        ref = weakref.ref(root)
+        del root
+
+        self.assertIsNone(ref())
+        self.assertIsNone(address._parent)
+        # 父对象已回收，修改子对象只通知到自己
+        address.city = "Shanghai"
+        self.assertEqual(address.city, "Shanghai")
+
+    def test_no_leak_across_edit_cycles(self):
+        """验证反复创建、编辑、丢弃文档时内存不随历史增长"""
+        import tracemalloc
+
+        from reactive.reactive import CommandManager, ReactivableDict
+
+        cycles = 1_000
+        manager = CommandManager(max_depth=cycles * 4)
+
+        def cycle():
+            doc = ReactivableDict(
+                {"rows": [{"v": i} for i in range(20)]}, command_manager=manager
+            )
+            doc.rows[0].v = -1
+            doc.title = "x"
+
+        tracemalloc.start()
+        try:
+            cycle()
+            baseline = tracemalloc.get_traced_memory()[0]
+            for _ in range(cycles):
+                cycle()
+            # 历史中只剩命令对象本身（文档约 5 KiB，命令远小于 1 KiB）
+            grown = tracemalloc.get_traced_memory()[0] - baseline
+            self.assertLess(grown, cycles * 1024)
+            self.assertEqual(manager.prune(), (cycles + 1) * 2)
+            pruned = tracemalloc.get_traced_memory()[0] - baseline
+            self.assertLess(pruned, 64 * 1024)
+        finally:
+            tracemalloc.stop()
+
+
+class TestConcurrentTransactions(unittest.TestCase):
+    """测试事务的上下文隔离与线程安全模式"""
+
+    def test_threads_have_independent_transactions(self):
+        """验证两个线程同时打开事务时各自只记录自己的命令"""
+        import threading
+
+        from reactive.reactive import CommandManager, ReactivableDict
+
+        root = ReactivableDict(
+            {"a": 0, "b": 0}, command_manager=CommandManager(thread_safe=True)
+        )
+        barrier = threading.Barrier(2)
+
+        def work(key):
+            with root.batch_update():
+                barrier.wait()
+                for i in range(1, 51):
+                    root[key] = i
+                barrier.wait()
+
+        threads = [threading.Thread(target=work, args=(k,)) for k in ("a", "b")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        manager = root._command_manager
+        self.assertEqual(len(manager.undo_stack), 2)
+        for composite in manager.undo_stack:
+            keys = {command.key for command in composite.commands}
+            self.assertEqual(len(keys), 1)
+            self.assertEqual(len(composite.commands), 50)
+        self.assertFalse(manager.in_transaction)
+
+    def test_asyncio_tasks_have_independent_transactions(self):
+        """验证 asyncio 任务之间的事务互不干扰"""
+        import asyncio
+
+        from reactive.reactive import ReactivableDict
+
+        root = ReactivableDict({"a": 0, "b": 0})
+
+        async def in_transaction():
+            with root.batch_update():
+                root.a = 1
+                await asyncio.sleep(0)
+                root.a = 2
+
+        async def outside():
+            root.b = 1
+
+        async def main():
+            await asyncio.gather(in_transaction(), outside())
+
+        asyncio.run(main())
+        history = root._command_manager.undo_stack
+        # b 的修改直接进入历史，a 的两次修改在事务提交时合并为一条
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history[0].key, "b")
+        self.assertEqual(len(history[1].commands), 2)
+
+    def test_thread_safe_stress(self):
+        """验证多线程并发修改后历史完整，全部撤销后回到初始状态"""
+        import threading
+
+        from reactive.reactive import CommandManager, ReactivableDict
+
+        threads, count = 8, 200
+        manager = CommandManager(max_depth=threads * count * 2, thread_safe=True)
+        root = ReactivableDict(
+            {"log": [], "counters": {str(t): 0 for t in range(threads)}},
+            command_manager=manager,
+        )
+
+        def work(t):
+            for i in range(1, count + 1):
+                root.counters[str(t)] = i
+                if i % 2:
+                    root.log.append(t)
+
+        workers = [threading.Thread(target=work, args=(t,)) for t in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(len(manager.undo_stack), threads * count * 3 // 2)
+        self.assertEqual(len(root.log), threads * count // 2)
+        self.assertTrue(all(v == count for v in root.counters.values()))
+        while manager.undo_stack:
+            manager.undo()
+        self.assertEqual(len(root.log), 0)
+        self.assertTrue(all(v == 0 for v in root.counters.values()))
+
+
+class TestNotifyScheduler(unittest.TestCase):
+    """测试通知调度器的合并与各调度模式"""
+
+    def _make(self, mode, **kwargs):
+        from reactive.reactive import CommandManager, NotifyScheduler, ReactivableDict
+
+        scheduler = NotifyScheduler(mode, **kwargs)
+        data = {"todos": [], "address": {"city": "Beijing"}}
+        root = ReactivableDict(
+            data, command_manager=CommandManager(scheduler=scheduler)
+        )
+        return scheduler, root
+
+    def test_sync_mode_notifies_on_every_change(self):
+        """验证同步模式下每次变更立即通知"""
+        _, root = self._make("sync")
+        calls = []
+        root.subscribe(calls.append)
+
+        for i in range(3):
+            root.todos.append(i)
+
+        self.assertEqual(len(calls), 3)
+
+    def test_manual_mode_coalesces_until_flush(self):
+        """验证手动模式下多次变更只在 flush 时合并通知一次"""
+        scheduler, root = self._make("manual")
+        root_calls, todos_calls, address_calls = [], [], []
+        root.subscribe(root_calls.append)
+        root.todos.subscribe(todos_calls.append)
+        root.address.subscribe(address_calls.append)
+
+        for i in range(100):
+            root.todos.append(i)
+        root.address.city = "Shanghai"
+
+        self.assertEqual(root_calls, [])
+        self.assertEqual(scheduler.pending, 2)
+
+        # todos、address 和 root 各通知一次
+        self.assertEqual(root.flush(), 3)
+        self.assertEqual(len(root_calls), 1)
+        self.assertEqual(len(todos_calls), 1)
+        self.assertEqual(len(address_calls), 1)
+
+        # 没有新变更时 flush 不通知任何节点
+        self.assertEqual(root.flush(), 0)
+
+    def test_flush_stops_bubbling_at_controller(self):
+        """验证合并通知在绑定控件的节点处停止冒泡"""
+
+        class Controller:
+            def __init__(self):
+                self.count = 0
+
+            def update(self, reactive_data):
+                self.count += 1
+
+        _, root = self._make("manual")
+        controller = Controller()
+        root_calls = []
+        root.subscribe(root_calls.append)
+        root.address.bind_controller(controller)
+
+        root.address.city = "Shanghai"
+        root.address.city = "Shenzhen"
+        root.flush()
+
+        self.assertEqual(controller.count, 1)
+        self.assertEqual(root_calls, [])
+
+    def test_asyncio_mode_flushes_on_next_tick(self):
+        """验证 asyncio 模式在事件循环的下一个 tick 合并通知"""
+        import asyncio
+
+        _, root = self._make("asyncio")
+        calls = []
+        root.subscribe(calls.append)
+
+        async def mutate():
+            for i in range(10):
+                root.todos.append(i)
+            self.assertEqual(calls, [])
+            await asyncio.sleep(0)
+            self.assertEqual(len(calls), 1)
+
+        asyncio.run(mutate())
+
+    def test_undo_notifies_command_target(self):
+        """验证撤销时通知被修改的节点并冒泡"""
+        scheduler, root = self._make("manual")
+        address_calls = []
+        root.address.subscribe(address_calls.append)
+
+        root.address.city = "Shanghai"
+        root.undo()
+        root.flush()
+
+        self.assertEqual(len(address_calls), 1)
+        self.assertEqual(root.address.city, "Beijing")
+
+    def test_invalid_mode_raises_error(self):
+        """验证未知模式抛出 ValueError"""
+        from reactive.reactive import NotifyScheduler
+
+        with self.assertRaises(ValueError):
+            NotifyScheduler("later")
+
+
+class TestAsyncObservers(unittest.TestCase):
+    """测试异步观察者、异步控件与背压"""
+
+    def _make(self, mode="sync"):
+        from reactive.reactive import CommandManager, NotifyScheduler, ReactivableDict
+
+        scheduler = NotifyScheduler(mode)
+        root = ReactivableDict(
+            {"count": 0, "address": {"city": "Beijing"}},
+            command_manager=CommandManager(scheduler=scheduler),
+        )
+        return scheduler, root
+
+    def test_async_observer_does_not_block_mutation(self):
+        """验证异步观察者作为任务运行，await flush() 等待其完成"""
+        import asyncio
+
+        _, root = self._make()
+        seen = []
+
+        async def observer(value):
+            await asyncio.sleep(0.01)
+            seen.append(value["count"])
+
+        root.subscribe(observer)
+
+        async def main():
+            root.count = 1
+            self.assertEqual(seen, [])
+            self.assertEqual(await root.flush(), 0)
+            self.assertEqual(seen, [1])
+
+        asyncio.run(main())
+
+    def test_lagging_observer_receives_latest_only(self):
+        """验证消费者落后时中间的通知被合并，只处理最新状态"""
+        import asyncio
+
+        scheduler, root = self._make()
+        seen = []
+
+        async def observer(value):
+            await asyncio.sleep(0.01)
+            seen.append(value["count"])
+
+        root.subscribe(observer)
+
+        async def main():
+            for i in range(1, 11):
+                root.count = i
+            await root.flush()
+
+        asyncio.run(main())
+        # 第一次通知立即运行，其余 9 次合并为最后一次
+        self.assertEqual(seen, [10, 10])
+        self.assertEqual(scheduler.dropped, 8)
+
+    def test_async_controller(self):
+        """验证 update 为 async 方法的控件"""
+        import asyncio
+
+        class Controller:
+            def __init__(self):
+                self.cities = []
+
+            async def update(self, reactive_data):
+                await asyncio.sleep(0)
+                self.cities.append(reactive_data.city)
+
+        _, root = self._make("asyncio")
+        controller = Controller()
+        root.address.bind_controller(controller)
+
+        async def main():
+            root.address.city = "Shanghai"
+            root.address.city = "Shenzhen"
+            self.assertEqual(await root.flush(), 1)
+
+        asyncio.run(main())
+        self.assertEqual(controller.cities, ["Shenzhen"])
+
+    def test_async_observer_without_loop_raises_error(self):
+        """验证没有运行中的事件循环时异步观察者抛出 RuntimeError"""
+
+        async def observer(value):
+            pass
+
+        _, root = self._make()
+        root.subscribe(observer)
+        with self.assertRaises(RuntimeError):
+            root.count = 1
+
+
+class TestMetrics(unittest.TestCase):
+    """测试可选的运行指标"""
+
+    def setUp(self):
+        from reactive.reactive import enable_metrics
+
+        self.metrics = enable_metrics()
+
+    def tearDown(self):
+        from reactive.reactive import disable_metrics
+
+        disable_metrics()
+
+    def test_disabled_by_default(self):
+        from reactive.reactive import disable_metrics, get_metrics
+
+        self.assertIs(disable_metrics(), self.metrics)
+        self.assertIsNone(get_metrics())
+
+    def test_commands_fanout_and_history(self):
+        from reactive.reactive import ReactivableDict
+
+        root = ReactivableDict({"count": 0, "address": {"city": "Beijing"}})
+        root.subscribe(lambda value: None)
+        root.count = 1
+        root.address.city = "Shanghai"
+        root.undo()
+        with root.batch_update():
+            root.count = 2
+            root.address.city = "Shenzhen"
+
+        metrics = self.metrics.as_dict()
+        self.assertEqual(metrics["commands"]["execute:SetItemCommand"], 4)
+        self.assertEqual(metrics["commands"]["undo:SetItemCommand"], 1)
+        self.assertEqual(metrics["flushes"], 4)
+        # address 的修改通知 address 和根两个节点，冒泡深度为 2
+        self.assertEqual(metrics["fanout"]["sum"], 1 + 2 + 2 + 2)
+        # 脏节点依次为：根、address、address（撤销）、事务中的根和 address
+        depth = metrics["bubble_depth"]
+        self.assertEqual((depth["count"], depth["sum"]), (5, 1 + 2 + 2 + 1 + 2))
+        self.assertEqual(depth["buckets"][1], 2)
+        self.assertEqual(metrics["transaction_size"]["count"], 1)
+        self.assertEqual(metrics["transaction_size"]["sum"], 2)
+        self.assertEqual(metrics["history"]["undo"], 2)
+        self.assertEqual(metrics["history"]["redo"], 0)
+
+    def test_callback_latency(self):
+        """验证观察者和控件分别记录回调耗时"""
+        from reactive.reactive import ReactivableDict
+
+        class Controller:
+            def update(self, reactive_data):
+                pass
+
+        def observer(value):
+            pass
+
+        root = ReactivableDict({"address": {"city": "Beijing"}})
+        root.subscribe(observer)
+        root.address.bind_controller(Controller())
+        root.title = "a"
+        root.address.city = "Shanghai"
+
+        callbacks = self.metrics.callbacks
+        observer_key = ("observer", observer.__qualname__)
+        self.assertEqual(callbacks[observer_key].count, 1)
+        self.assertEqual(
+            callbacks[("controller", Controller.update.__qualname__)].count, 1
+        )
+        self.assertGreaterEqual(callbacks[observer_key].sum, 0)
+
+    def test_prometheus_export(self):
+        from reactive.reactive import ReactivableDict
+
+        root = ReactivableDict({"count": 0})
+        root.subscribe(lambda value: None)
+        root.count = 1
+
+        text = self.metrics.to_prometheus()
+        self.assertIn(
+            'reactive_commands_total{action="execute",type="SetItemCommand"} 1\n',
+            text,
+        )
+        self.assertIn('reactive_notify_fanout_bucket{le="+Inf"} 1\n', text)
+        self.assertIn("reactive_notify_fanout_count 1\n", text)
+        self.assertIn('kind="observer",callback="TestMetrics.', text)
+        self.assertIn("reactive_history_undo 1\n", text)
+        self.assertTrue(text.endswith("\n"))
+
+
+class TestCoalescePolicy(unittest.TestCase):
+    """测试连续写入同一键时的命令合并"""
+
+    def setUp(self):
+        from reactive.reactive import CoalescePolicy, CommandManager, ReactivableDict
+
+        self.now = 0.0
+        self.policy = CoalescePolicy(window=1.0, clock=lambda: self.now)
+        self.manager = CommandManager(coalesce=self.policy)
+        self.form = ReactivableDict(
+            {"title": "", "body": ""}, command_manager=self.manager
+        )
+
+    def _type(self, field, text, interval=0.1):
+        for i in range(1, len(text) + 1):
+            self.now += interval
+            self.form[field] = text[:i]
+
+    def test_consecutive_writes_are_merged(self):
+        """验证连续写入同一键合并为一条历史，撤销回到第一次的旧值"""
+        self._type("title", "hello")
+
+        self.assertEqual(len(self.manager.undo_stack), 1)
+        self.assertEqual(self.manager.undo_stack[0].old_value, "")
+        self.assertEqual(self.manager.undo_stack[0].new_value, "hello")
+
+        self.form.undo()
+        self.assertEqual(self.form.title, "")
+        self.form.redo()
+        self.assertEqual(self.form.title, "hello")
+
+    def test_different_keys_are_not_merged(self):
+        """验证写入不同键时不合并"""
+        self._type("title", "ab")
+        self._type("body", "cd")
+        self._type("title", "abc")
+
+        self.assertEqual(len(self.manager.undo_stack), 3)
+
+    def test_writes_outside_window_are_not_merged(self):
+        """验证超过时间窗口的写入开始新的历史"""
+        self._type("title", "ab")
+        self.now += 5.0
+        self.form.title = "abc"
+
+        self.assertEqual(len(self.manager.undo_stack), 2)
+        self.form.undo()
+        self.assertEqual(self.form.title, "ab")
+
+    def test_no_merge_after_undo(self):
+        """验证撤销之后的写入不会并入更早的历史"""
+        self._type("title", "ab")
+        self.form.body = "x"
+        self.form.undo()
+        self.now += 0.1
+        self.form.title = "abc"
+
+        self.assertEqual(len(self.manager.undo_stack), 2)
+        self.form.undo()
+        self.assertEqual(self.form.title, "ab")
+
+    def test_predicate_rule(self):
+        """验证自定义规则可以阻止合并（例如按单词断开）"""
+        self.policy.predicate = lambda previous, command: not str(
+            previous.new_value
+        ).endswith(" ")
+        self._type("title", "ab cd")
+
+        # 每个单词（含其后的空格）一条历史
+        self.assertEqual(
+            [c.new_value for c in self.manager.undo_stack], ["ab ", "ab cd"]
+        )
+
+    def test_merged_writes_still_notify(self):
+        """验证被合并的写入仍然会发送通知"""
+        calls = []
+        self.form.subscribe(calls.append)
+        self._type("title", "abc")
+
+        self.assertEqual(len(calls), 3)
+
+
+class TestPatch(unittest.TestCase):
+    """测试命令历史导出为补丁并在远端重放"""
+
+    def setUp(self):
+        from reactive.patch import patch_listener
+        from reactive.reactive import ReactivableDict
+
+        def make():
+            return {
+                "name": "Alice",
+                "tags": ["a", "b"],
+                "address": {"city": "Beijing", "zip": "100000"},
+            }
+
+        self.local = ReactivableDict(make())
+        self.remote = ReactivableDict(make())
+        self.sent = []
+        self.local._command_manager.add_listener(patch_listener(self.sent.append))
+
+    def _replicate(self):
+        from reactive.patch import _plain, apply_patch
+
+        for ops in self.sent:
+            apply_patch(self.remote, ops)
+        self.sent.clear()
+        self.assertEqual(_plain(self.remote), _plain(self.local))
+
+    def test_command_to_patch_paths(self):
+        """验证补丁路径由 _parent / _key 推导"""
+        self.local.address.city = "Shanghai"
+        self.local.tags.append("c")
+        del self.local.tags[0]
+
+        self.assertEqual(
+            [op for ops in self.sent for op in ops],
+            [
+                {"op": "add", "path": "/address/city", "value": "Shanghai"},
+                {"op": "add", "path": "/tags/-", "value": "c"},
+                {"op": "remove", "path": "/tags/0"},
+            ],
+        )
+
+    def test_replicate_mutations(self):
+        """验证各类变更都能在远端重放"""
+        self.local.name = "Bob"
+        self.local.address.zip = "200000"
+        self.local.tags.insert(1, "x")
+        self.local.tags.pop()
+        self.local.tags[0] = {"label": "nested"}
+        self.local.tags[0].label = "changed"
+        del self.local.address["city"]
+        self._replicate()
+
+    def test_replicate_bulk_list_operations(self):
+        """验证列表批量操作及其撤销都能在远端重放"""
+        self.local.tags.extend(["c", "d", "e"])
+        self.local.tags.reverse()
+        self.local.tags[1:3] = ["x"]
+        self.local.tags.sort()
+        self._replicate()
+        for _ in range(4):
+            self.local.undo()
+            self._replicate()
+        self.local.tags.clear()
+        self._replicate()
+
+    def test_replicate_dict_operations(self):
+        """验证字典批量操作、新增键的撤销都能在远端重放"""
+        self.local.address.update({"city": "Shanghai", "street": "Nanjing Rd"})
+        self.local.email = "alice@example.com"
+        self._replicate()
+        self.local.undo()
+        self.local.undo()
+        self._replicate()
+        self.local.address.clear()
+        self.local.address.setdefault("zip", "200000")
+        self.local.address.update(zip="300000")
+        self._replicate()
+        self.local.undo()
+        self.local.undo()
+        self._replicate()
+
+    def test_replicate_transaction_undo_redo(self):
+        """验证事务、撤销和重做都能在远端重放"""
+        with self.local.batch_update():
+            self.local.name = "Carol"
+            self.local.tags.append("c")
+            self.local.tags.insert(0, "z")
+        self.assertEqual(len(self.sent), 1)
+        self._replicate()
+
+        self.local.undo()
+        self._replicate()
+        self.local.redo()
+        self._replicate()
+
+        # 远端作为一个事务应用，同样可以一次撤销
+        self.remote.undo()
+        self.assertEqual(self.remote.name, "Alice")
+        self.assertEqual(len(self.remote.tags), 2)
+
+    def test_transaction_paths_follow_index_shifts(self):
+        """验证事务内先改列表元素再移动它时，补丁路径按每条命令执行时的树计算"""
+        self.local.rows = [{"v": 0}]
+        self._replicate()
+        with self.local.batch_update():
+            self.local.rows[0].v = 1
+            self.local.rows.insert(0, {"v": 9})
+        self.assertEqual([op["path"] for op in self.sent[0]], ["/rows/0/v", "/rows/0"])
+        self._replicate()
+
+        self.local.undo()
+        self.assertEqual([op["path"] for op in self.sent[0]], ["/rows/0", "/rows/0/v"])
+        self._replicate()
+        self.local.redo()
+        self._replicate()
+
+    def test_paths_after_index_shifts(self):
+        """验证插入、删除、排序后子对象的路径正确，定位到的索引写回 _key"""
+        from reactive.reactive import ReactivableDict
+
+        root = ReactivableDict({"rows": [{"v": i} for i in range(10)]})
+        rows = root.rows
+        row = rows[5]
+        rows.insert(0, {"v": -1})
+        self.assertEqual(row._path(), ("rows", 6))
+        self.assertEqual(row._key, 6)
+        del rows[:3]
+        self.assertEqual(row._path(), ("rows", 3))
+        rows.reverse()
+        self.assertEqual(row._path(), ("rows", 4))
+        root.undo()
+        root.undo()
+        self.assertEqual(row._path(), ("rows", 6))
+        # 已移出列表的子对象保留原来的键
+        rows.remove(row)
+        self.assertEqual(row._key_in_parent(), 6)
+
+    def test_pointer_escaping(self):
+        """验证路径中的 / 和 ~ 被转义"""
+        from reactive.patch import from_pointer, to_pointer
+
+        pointer = to_pointer(("a/b", "c~d", 0))
+        self.assertEqual(pointer, "/a~1b/c~0d/0")
+        self.assertEqual(from_pointer(pointer), ["a/b", "c~d", "0"])
+
+    def test_unknown_op_raises_error(self):
+        """验证未知的补丁操作抛出 ValueError"""
+        from reactive.patch import apply_patch
+
+        with self.assertRaises(ValueError):
+            apply_patch(self.remote, [{"op": "move", "path": "/name"}])
+
+
+class TestSerialize(unittest.TestCase):
+    """测试 to_plain / from_plain 与 JSON、二进制编码"""
+
+    def setUp(self):
+        from array import array
+
+        from reactive.reactive import ReactivableDict
+
+        self.data = {
+            "title": "文档",
+            "count": -300,
+            "ratio": 0.5,
+            "done": False,
+            "owner": None,
+            "rows": [{"id": i, "tags": ["a", "b"]} for i in range(3)],
+            "series": array("d", [1.0, 2.5]),
+        }
+        self.root = ReactivableDict(self.data)
+
+    def test_to_plain_and_from_plain(self):
+        """验证 to_plain 得到普通容器，from_plain 复制数据并选择对应的子类"""
+        from array import array
+
+        from reactive.reactive import Reactivable, ReactivableDict, ReactivableList
+
+        plain = self.root.to_plain()
+        self.assertEqual(plain["rows"][1], {"id": 1, "tags": ["a", "b"]})
+        self.assertEqual(plain["series"], [1.0, 2.5])
+        self.assertIs(type(plain["rows"]), list)
+
+        source = {"rows": [[1, 2]], "series": array("i", [1])}
+        root = Reactivable.from_plain(source)
+        self.assertIsInstance(root, ReactivableDict)
+        self.assertIsInstance(Reactivable.from_plain([1]), ReactivableList)
+        # 不修改传入的数据
+        root.rows[0].append(3)
+        self.assertEqual(source["rows"], [[1, 2]])
+        self.assertIs(type(source["rows"][0]), list)
+        self.assertEqual(root.series.typecode, "i")
+
+    def test_json_matches_json_dumps(self):
+        """验证 JSON 编码与 json.dumps 的结果逐字节一致"""
+        import io
+        import json
+
+        from reactive.serialize import dump, encode, iter_encode
+
+        expected = json.dumps(
+            self.root.to_plain(), ensure_ascii=False, separators=(",", ":")
+        ).encode()
+        self.assertEqual(encode(self.root), expected)
+        self.assertEqual(b"".join(iter_encode(self.root)), expected)
+        buffer = io.BytesIO()
+        dump(self.root, buffer)
+        self.assertEqual(buffer.getvalue(), expected)
+
+    def test_json_non_string_keys(self):
+        """验证嵌套的非字符串键与 json.dumps 的规则一致，不支持的键抛出 TypeError"""
+        import json
+
+        from reactive.reactive import ReactivableDict
+        from reactive.serialize import encode
+
+        data = {"m": {True: 1, False: [1], None: 2, 7: [3], 1.5: {"x": 4}}}
+        expected = json.dumps(data, separators=(",", ":")).encode()
+        self.assertEqual(encode(ReactivableDict(data)), expected)
+        with self.assertRaises(TypeError):
+            encode(ReactivableDict({"m": {(1, 2): [1]}}))
+
+    def test_binary_round_trip(self):
+        """验证二进制编码可以解码回原数据，截断的数据和未知格式抛出 ValueError"""
+        from array import array
+
+        from reactive.serialize import FORMAT_BINARY, decode, encode, iter_encode
+
+        self.root.big = 2**40
+        self.root.text = "x" * 300
+        data = encode(self.root, FORMAT_BINARY)
+        self.assertEqual(b"".join(iter_encode(self.root, FORMAT_BINARY)), data)
+
+        plain = decode(data, FORMAT_BINARY)
+        self.assertEqual(plain["series"], array("d", [1.0, 2.5]))
+        plain["series"] = plain["series"].tolist()
+        self.assertEqual(plain, self.root.to_plain())
+
+        with self.assertRaises(ValueError):
+            decode(data[:-1], FORMAT_BINARY)
+        with self.assertRaises(ValueError):
+            encode(self.root, "xml")
+
+    def test_whole_subtree_encoding(self):
+        """验证从未编码过的子树整体编码，只在根上缓存，修改未缓存的后代也能使其失效"""
+        import json
+
+        from reactive.serialize import encode
+
+        encode(self.root)
+        self.assertIsNotNone(self.root._encoded)
+        self.assertIsNone(self.root.rows._encoded)
+        self.assertIsNone(self.root.rows[0]._encoded)
+
+        self.root.rows[0].tags.append("c")
+        self.assertEqual(self.root._encoded, {})
+        self.assertEqual(json.loads(encode(self.root)), self.root.to_plain())
+
+    def test_incremental_reencoding(self):
+        """验证修改过的路径上逐层缓存子节点，之后只重新编码被修改的节点及其祖先"""
+        import json
+        from unittest import mock
+
+        from reactive.serialize import FORMAT_BINARY, decode, encode, iter_encode
+
+        # 不按大小整体编码，每层都可以逐个成员编码
+        patcher = mock.patch("reactive.serialize._INLINE_LIMIT", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        rows = self.root.rows
+        encode(self.root)
+        # 每次修改后再编码，缓存沿被修改的路径向下一层：先是 rows，再是每一行
+        for value in (10, 20):
+            rows[2].id = value
+            encode(self.root)
+            encode(self.root, FORMAT_BINARY)
+        first = encode(self.root)
+        untouched = rows[0]._encoded["json"]
+
+        rows[2].tags.append("c")
+        self.assertFalse(self.root._encoded)
+        self.assertFalse(rows[2]._encoded)
+        self.assertTrue(rows[0]._encoded)
+
+        second = encode(self.root)
+        self.assertNotEqual(first, second)
+        self.assertIs(rows[0]._encoded["json"], untouched)
+        self.assertEqual(json.loads(second), self.root.to_plain())
+        self.assertEqual(b"".join(iter_encode(self.root)), second)
+        self.assertEqual(
+            decode(encode(self.root, FORMAT_BINARY), FORMAT_BINARY)["rows"],
+            self.root.to_plain()["rows"],
+        )
+
+        self.root.undo()
+        self.assertEqual(encode(self.root), first)
+
+    def test_lazy_tree(self):
+        """验证惰性模式下编码会封装子容器，之后的修改能使缓存失效"""
+        import json
+
+        from reactive.reactive import ReactivableDict
+        from reactive.serialize import encode
+
+        root = ReactivableDict({"a": {"b": [1]}}, lazy=True)
+        encode(root)
+        root.a.b.append(2)
+        self.assertEqual(json.loads(encode(root)), {"a": {"b": [1, 2]}})
+
+
+class TestDocumentStore(unittest.TestCase):
+    """测试快照 + 预写日志持久化"""
+
+    def setUp(self):
+        import tempfile
+
+        self._tmp = tempfile.TemporaryDirectory()
+        self.directory = self._tmp.name
+        self.default = {"title": "", "tags": [], "meta": {"rev": 0}}
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _edit(self, doc):
+        doc.title = "draft"
+        doc.tags.append("a")
+        doc.tags.append("b")
+        with doc.batch_update():
+            doc.meta.rev = 1
+            doc.tags.pop(0)
+        doc.title = "final"
+        doc.undo()
+
+    def test_recover_from_log(self):
+        """验证重新打开时通过重放日志恢复状态"""
+        from reactive.patch import _plain
+        from reactive.persistence import DocumentStore
+
+        with DocumentStore(self.directory) as store:
+            doc = store.open(self.default)
+            self._edit(doc)
+            expected = _plain(doc)
+
+        with DocumentStore(self.directory) as store:
+            recovered = store.open()
+            self.assertEqual(_plain(recovered), expected)
+            self.assertEqual(store.seq, 6)
+
+    def test_recover_matches_live_document(self):
+        """验证批量更新中移动列表元素、撤销和 undo_to 之后，恢复结果与在线文档一致"""
+        from reactive.patch import _plain
+        from reactive.persistence import DocumentStore
+
+        default = {"rows": [{"v": 0}, {"v": 0}], "n": 0}
+        store = DocumentStore(self.directory)
+        doc = store.open(default)
+        manager = doc._command_manager
+        manager.checkpoint("start")
+        with doc.batch_update():
+            doc.rows[0].v = 1
+            doc.rows.insert(0, {"v": 9})
+        with doc.batch_update():
+            doc.rows[2].v = 2
+            doc.rows.pop(0)
+            doc.n = 1
+        doc.rows.sort(key=lambda row: row["v"])
+        doc.rows[0].v = 3
+        manager.checkpoint("sorted")
+        doc.undo()
+        self.assertEqual(DocumentStore(self.directory).recover(), _plain(doc))
+        doc.rows.reverse()
+        doc.undo_to("start")
+        self.assertEqual(DocumentStore(self.directory).recover(), _plain(doc))
+        doc.redo_to(manager.position + 3)
+        self.assertEqual(DocumentStore(self.directory).recover(), _plain(doc))
+        store.close()
+
+    def test_batch_mode_flushes_every_record(self):
+        """验证 batch 策略下未到 fsync 边界的记录也已写出 Python 缓冲区"""
+        from reactive.persistence import DocumentStore
+
+        with DocumentStore(self.directory, fsync="batch", batch_size=64) as store:
+            doc = store.open(self.default)
+            doc.title = "draft"
+            doc.tags.append("a")
+            with open(store.log_path, encoding="utf-8") as log:
+                self.assertEqual(len(log.readlines()), 2)
+
+    def test_snapshot_truncates_log(self):
+        """验证快照后日志被截断，恢复结果不变"""
+        import os
+
+        from reactive.patch import _plain
+        from reactive.persistence import DocumentStore
+
+        with DocumentStore(self.directory, fsync="always") as store:
+            doc = store.open(self.default)
+            self._edit(doc)
+            store.snapshot()
+            self.assertEqual(os.path.getsize(store.log_path), 0)
+            doc.meta.rev = 2
+            expected = _plain(doc)
+
+        with DocumentStore(self.directory) as store:
+            self.assertEqual(_plain(store.open()), expected)
+
+    def test_automatic_snapshot(self):
+        """验证 snapshot_every 自动压缩日志"""
+        import os
+
+        from reactive.persistence import DocumentStore
+
+        with DocumentStore(self.directory, snapshot_every=3) as store:
+            doc = store.open(self.default)
+            for i in range(7):
+                doc.meta.rev = i + 1
+            self.assertTrue(os.path.exists(store.snapshot_path))
+
+        with DocumentStore(self.directory) as store:
+            self.assertEqual(store.open().meta.rev, 7)
+
+    def test_torn_tail_is_discarded(self):
+        """验证崩溃时写了一半的日志记录被丢弃"""
+        from reactive.persistence import DocumentStore
+
+        with DocumentStore(self.directory) as store:
+            doc = store.open(self.default)
+            doc.title = "kept"
+
+        with open(store.log_path, "a", encoding="utf-8") as f:
+            f.write('{"seq":2,"ops":[{"op":"add","path":"/title","va')
+
+        with DocumentStore(self.directory) as store:
+            doc = store.open()
+            self.assertEqual(doc.title, "kept")
+            # 截断后继续追加的记录仍然有效
+            doc.title = "next"
+
+        with DocumentStore(self.directory) as store:
+            self.assertEqual(store.open().title, "next")
+
+    def test_records_covered_by_snapshot_are_skipped(self):
+        """验证快照之后、截断日志之前崩溃时，不会重复应用记录"""
+        import json
+
+        from reactive.persistence import DocumentStore
+
+        with DocumentStore(self.directory) as store:
+            doc = store.open(self.default)
+            doc.tags.append("x")
+            doc.tags.append("y")
+
+        # 模拟：快照已包含全部记录，但日志尚未截断
+        with open(store.snapshot_path, "w", encoding="utf-8") as f:
+            json.dump({"seq": 2, "data": {"title": "", "tags": ["x", "y"]}}, f)
+
+        with DocumentStore(self.directory) as store:
+            self.assertEqual(list(store.open().tags), ["x", "y"])
+
+    def test_invalid_fsync_mode_raises_error(self):
+        """验证未知的 fsync 策略抛出 ValueError"""
+        from reactive.persistence import DocumentStore
+
+        with self.assertRaises(ValueError):
+            DocumentStore(self.directory, fsync="sometimes")
+
 
 class TestControllerProtocol(unittest.TestCase):
     """测试控件协议和绑定机制"""